@@ -0,0 +1,198 @@
+''' Decoder for the CAIC (Colorado Avalanche Information Center) products API.
+The `/products/all` response is a JSON array that mixes forecasts, summaries and other products. It is
+decoded one product at a time as it streams in. Anything that is not an `avalancheforecast` is dropped
+straight away. The fields of each forecast are appended to per-column lists, and one DataFrame is built
+from those lists at the end. A forecast gives one row per avalanche problem, and its header, confidence
+and danger rating values are repeated on each of those rows.
+
+backfill_forecasts rebuilds the history over a date range. It requests one products snapshot per day on
+a bounded thread pool, through the shared session that retries transient failures (avalanche.http),
+and keeps each product `id` once. write_partitions stores the result as one file per issue date. '''
+
+import codecs
+import datetime
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import pandas as pd
+import requests
+
+from avalanche import http
+from avalanche.sinks import write_frame
+
+API_URL = 'https://avalanche.state.co.us/api-proxy/avid'
+PRODUCTS_URL = '{api_url}?_api_proxy_uri=/products/all?datetime={datetime}&includeExpired=true'
+
+FORECAST_TYPE = 'avalancheforecast'
+
+HEADER_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'areaId': 'areaId',
+    'forecaster': 'forecaster',
+    'issueDateTime': 'issueDate',
+    'expiryDateTime': 'expiryDate',
+}
+
+CHUNK_SIZE = 1 << 16
+
+# Backfill snapshots are taken at midday in Colorado, after the morning forecast updates
+SNAPSHOT_TIME = datetime.time(18, 0)
+BACKFILL_WORKERS = 8
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def products_url(datetime: str, api_url: str = API_URL) -> str:
+    """Builds the `/products/all` URL for products valid at `datetime` (YYYY-MM-DDTHH:MM:00.000Z)."""
+    return PRODUCTS_URL.format(api_url=api_url, datetime=datetime)
+
+
+def iter_products(chunks: Iterable[Union[bytes, str]]) -> Iterator[Dict[str, Any]]:
+    """Yields the elements of a JSON array one by one as its text arrives in `chunks`."""
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+
+    for chunk in chunks:
+        buffer = buffer[position:] + (utf8.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE + ',':
+                position += 1
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError(f"Expected a JSON array, got {buffer[position:position + 20]!r}")
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == ']':
+                return
+
+            # An element is only complete once the text after it has arrived too
+            try:
+                product, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            if end == len(buffer):
+                break
+
+            yield product
+            position = end
+
+    raise ValueError('Truncated JSON array')
+
+
+def _flatten(record: Dict[str, Any], prefix: str = '') -> Dict[str, Any]:
+    """Flattens nested objects into dotted keys after the plain ones, like pd.json_normalize; lists are kept."""
+    flat = {f'{prefix}{key}': value for key, value in record.items() if not isinstance(value, dict)}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+    return flat
+
+
+def _without(record: Dict[str, Any], *keys: str) -> Dict[str, Any]:
+    return {key: value for key, value in record.items() if key not in keys}
+
+
+def forecast_rows(product: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Returns the output rows of one forecast, one per avalanche problem of its first day."""
+    header = {name: product.get(field) for field, name in HEADER_FIELDS.items()}
+
+    problems = product['avalancheProblems']['days'][0]
+    problems = [problems] if isinstance(problems, dict) else problems
+    problems = [{('problem' if key == 'type' else key): value for key, value in _flatten(problem).items()}
+                for problem in problems]
+
+    confidence = _flatten(product['confidence']['days'][0])
+    confidence = {('confidence' if key == 'rating' else key): value for key, value in confidence.items()}
+
+    danger = next((_flatten(day) for day in product['dangerRatings']['days'] if day.get('position') == 1), {})
+
+    shared = (_without(confidence, 'date', 'type'), _without(danger, 'date', 'type'))
+    return [{**header, **_without(problem, 'type'), **shared[0], **shared[1]} for problem in problems or [{}]]
+
+
+def build_forecasts(products: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """Collects the forecast rows of `products` into column lists and builds the frame once."""
+    columns: Dict[str, List[Any]] = {}
+    rows = 0
+
+    for product in products:
+        if product.get('type') != FORECAST_TYPE:
+            continue
+
+        for row in forecast_rows(product):
+            for key, value in row.items():
+                if key not in columns:
+                    columns[key] = [None] * rows
+                columns[key].append(value)
+            rows += 1
+            for values in columns.values():
+                if len(values) < rows:
+                    values.append(None)
+
+    return pd.DataFrame(columns)
+
+
+def fetch_forecasts(url: str, session=None, timeout: float = 60) -> pd.DataFrame:
+    """Streams a products response and returns its avalanche forecasts."""
+    with (session or http.session()).get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        return build_forecasts(iter_products(response.iter_content(chunk_size=CHUNK_SIZE)))
+
+
+def backfill_windows(start: datetime.date, end: datetime.date) -> List[str]:
+    """Returns the snapshot datetime of every day from `start` to `end` inclusive.
+
+    A snapshot only holds the forecasts in force at that moment, so a day without one would lose the
+    forecasts issued and replaced within it.
+    """
+    return [datetime.datetime.combine(day, SNAPSHOT_TIME).strftime('%Y-%m-%dT%H:%M:00.000Z')
+            for day in pd.date_range(start, end, freq='D').date]
+
+
+def _fetch_window(url: str, session, timeout: float) -> List[Dict[str, Any]]:
+    """Returns the forecasts of one snapshot."""
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        return [product for product in iter_products(response.iter_content(chunk_size=CHUNK_SIZE))
+                if product.get('type') == FORECAST_TYPE]
+
+
+def backfill_forecasts(start: datetime.date, end: datetime.date, workers: int = BACKFILL_WORKERS,
+                       api_url: str = API_URL, session: Optional[requests.Session] = None,
+                       timeout: float = 60) -> pd.DataFrame:
+    """Fetches the forecasts of every daily snapshot between `start` and `end` and keeps each product once."""
+    urls = [products_url(window, api_url) for window in backfill_windows(start, end)]
+    session = session or http.session()
+
+    products: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='caic') as executor:
+        windows = executor.map(lambda url: _fetch_window(url, session, timeout), urls)
+        for url, forecasts in zip(urls, windows):
+            for product in forecasts:
+                products.setdefault(product['id'], product)
+            logging.info(f"{len(forecasts)} forecasts from {url}, {len(products)} distinct so far")
+
+    return build_forecasts(products.values())
+
+
+def write_partitions(bucket, data: pd.DataFrame, prefix: str, fmt: str = 'parquet') -> List[str]:
+    """Writes one `{prefix}date={issue date}/part-0` file per issue date and returns the blob names."""
+    if data.empty:
+        return []
+
+    issue_dates = data['issueDate'].str[:10].fillna('unknown')
+    return [write_frame(bucket, group.reset_index(drop=True), f'{prefix}date={date}/part-0', fmt)
+            for date, group in data.groupby(issue_dates, sort=True)]
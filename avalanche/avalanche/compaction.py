@@ -0,0 +1,103 @@
+''' Compaction of the per-station daily_raw blobs into one partitioned file per day.
+compact_day merges every `daily_raw/{date}-{station_id}` blob of a day into `daily/date={date}/part-0.parquet`
+and then writes a `_manifest.json` next to it listing the source blobs with their generation and MD5. The
+manifest is written last, so a partition without one is incomplete. Compacting a day whose sources have not
+changed, by name or by content, is a no-op. '''
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from avalanche.sinks import decode_frame, format_of, write_frame
+from avalanche.snotel import SCHEMA, to_schema
+
+RAW_PREFIX = 'daily_raw/'
+COMPACTED_PREFIX = 'daily/'
+MANIFEST = '_manifest.json'
+
+DOWNLOAD_WORKERS = 16
+
+
+def partition_prefix(date: str) -> str:
+    return f'{COMPACTED_PREFIX}date={date}/'
+
+
+def raw_blobs(bucket, date: str) -> List[Any]:
+    """Lists the per-station blobs written for `date` (YYYY-MM-DD)."""
+    return sorted(bucket.list_blobs(prefix=f'{RAW_PREFIX}{date}'), key=lambda blob: blob.name)
+
+
+def read_manifest(bucket, date: str) -> Optional[Dict[str, Any]]:
+    blob = bucket.blob(f'{partition_prefix(date)}{MANIFEST}')
+    if not blob.exists():
+        return None
+    return json.loads(blob.download_as_bytes())
+
+
+def _source(blob) -> Dict[str, Any]:
+    """A blob's name and version; a blob rewritten in place keeps its name but not its generation or hash."""
+    return {'name': blob.name, 'generation': blob.generation, 'md5_hash': blob.md5_hash}
+
+
+def _read_blob(blob) -> pd.DataFrame:
+    return decode_frame(blob.download_as_bytes(), format_of(blob.name))
+
+
+def _read_blobs(blobs: List[Any]) -> pd.DataFrame:
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        frames = list(executor.map(_read_blob, blobs))
+
+    data = pd.concat(frames, ignore_index=True)
+    return data.astype({column: dtype for column, dtype in SCHEMA.items() if column in data.columns})
+
+
+def compact_day(bucket, date: str, force: bool = False) -> Optional[Dict[str, Any]]:
+    """Merges a day's raw blobs into one Parquet partition and returns its manifest."""
+    blobs = raw_blobs(bucket, date)
+    if not blobs:
+        logging.info(f"No {RAW_PREFIX} blobs for {date}, nothing to compact")
+        return None
+
+    sources = [_source(blob) for blob in blobs]
+
+    manifest = read_manifest(bucket, date)
+    if manifest is not None and manifest['sources'] == sources and not force:
+        logging.info(f"{partition_prefix(date)} is already compacted from {len(sources)} blobs")
+        return manifest
+
+    data = _read_blobs(blobs).sort_values(['station_id', 'date'], ignore_index=True)
+
+    part = write_frame(bucket, data, f'{partition_prefix(date)}part-0', 'parquet', schema=SCHEMA)
+
+    manifest = {
+        'date': date,
+        'files': [part],
+        'rows': len(data),
+        'sources': sources,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    bucket.blob(f'{partition_prefix(date)}{MANIFEST}').upload_from_string(
+        json.dumps(manifest, indent=2), content_type='application/json')
+
+    logging.info(f"Compacted {len(sources)} blobs into {part} ({len(data)} rows)")
+
+    return manifest
+
+
+def read_day(bucket, date: str) -> pd.DataFrame:
+    """Reads a day's observations, from the compacted partition when there is one.
+
+    A day with no blobs gives an empty frame typed like the table schema.
+    """
+    manifest = read_manifest(bucket, date)
+    if manifest is not None:
+        return _read_blobs([bucket.blob(name) for name in manifest['files']])
+
+    blobs = raw_blobs(bucket, date)
+    if not blobs:
+        return to_schema(pd.DataFrame())
+    return _read_blobs(blobs)
@@ -1,51 +1,13 @@
-import pandas as pd
-import requests
-from datetime import datetime, timezone, timedelta
-from google.cloud import storage
+import argparse
+from datetime import date, datetime, timezone, timedelta
 
+from avalanche.caic import backfill_forecasts, fetch_forecasts, products_url, write_partitions
+from avalanche.sinks import OUTPUT_FORMAT, get_bucket, write_frame
 
 
 def build_avy_df(url):
-
-    data = requests.get(url)
-    data = data.json()
-
-    df_final = []
-
-    for i in range(0, len(data)):
-        print(i)
-
-        record = data[i]
-
-        if record['type'] != 'avalancheforecast':
-            print("PASS")
-            pass
-        else:
-            print('YAY')
-            probs = pd.json_normalize(record['avalancheProblems']['days'][0]).rename({'type': 'problem'}, axis='columns')
-            conf = pd.json_normalize(record['confidence']['days'][0]).rename({'rating': 'confidence'}, axis='columns').drop(['date'], axis=1)
-            danger = pd.json_normalize(record['dangerRatings']['days']).drop(['date'], axis=1)
-            danger = danger[danger['position'] == 1]
-
-
-            df = {'id': record['id'],
-                  'title': record['title'],
-                  'type': record['type'],
-                  'areaId': record['areaId'],
-                  'forecaster': record['forecaster'],
-                  'issueDate': record['issueDateTime'],
-                  'expiryDate': record['expiryDateTime']
-                  }
-
-            df = pd.DataFrame(df, index=[0])
-            df = pd.concat([df, probs, conf, danger], axis=1).ffill()
-            df = df.drop(['type'], axis=1)
-
-            df_final.append(df)
-
-    df_final = pd.concat(df_final)
-
-    return df_final
+    """Streams the CAIC products at `url` and returns one row per forecast avalanche problem."""
+    return fetch_forecasts(url)
 
 
 def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
@@ -59,13 +21,8 @@ def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
 
     # The ID of your GCS object
     # destination_blob_name = "storage-object-name"
-    #service_account_info = json.load(open('/home/max/Documents/Access Accounts/avalanche-analytics-project-55735591e108.json'))
-    #storage_client = storage.Client(credentials = service_account.Credentials.from_service_account_info(service_account_info))
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-
-    blob.upload_from_string(contents.to_csv(), 'text/csv')
+    bucket = get_bucket(bucket_name)
+    destination_blob_name = write_frame(bucket, contents, destination_blob_name, OUTPUT_FORMAT, index=True)
 
     print(
         f"{destination_blob_name} uploaded to {bucket_name}."
@@ -77,7 +34,7 @@ def main(event, context):
 
     now = f'{now[0:10]}T{now[11:16]}:00.000Z'
 
-    url = f'https://avalanche.state.co.us/api-proxy/avid?_api_proxy_uri=/products/all?datetime={now}&includeExpired=true'
+    url = products_url(now)
     print(url)
 
     #url = 'https://avalanche.state.co.us/api-proxy/avid?_api_proxy_uri=/products/all&includeExpired=true'
@@ -88,6 +45,23 @@ def main(event, context):
 
     yesterday = str(today - timedelta(days=1))[0:10]
 
-    upload_blob_from_memory("raw-avy-data", data, f'daily/av-forecast/{yesterday}.csv')
+    upload_blob_from_memory("raw-avy-data", data, f'daily/av-forecast/{yesterday}')
+
+
+def backfill(start, end, workers=8):
+    """Rebuilds the forecast history between `start` and `end` into one partitioned dataset."""
+    data = backfill_forecasts(start, end, workers=workers)
+
+    bucket = get_bucket("raw-avy-data")
+    for name in write_partitions(bucket, data, 'history/av-forecast/', OUTPUT_FORMAT):
+        print(f"{name} uploaded to raw-avy-data.")
+
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the CAIC avalanche forecast history.')
+    parser.add_argument('--start', type=date.fromisoformat, required=True, help='first day, YYYY-MM-DD')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help='last day, YYYY-MM-DD')
+    parser.add_argument('--workers', type=int, default=8, help='number of daily snapshots fetched in parallel')
+    args = parser.parse_args()
 
+    backfill(args.start, args.end, workers=args.workers)
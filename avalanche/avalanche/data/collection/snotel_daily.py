@@ -0,0 +1,79 @@
+''' Daily SNOTEL collector for Colorado stations.
+Fetches yesterday's snow water equivalent, snow depth and air temperature for each station with a single
+report request and writes the same per-variable files as swe_daily.py, snow_depth_daily.py and
+air_temp_daily.py, so one function run replaces all three. '''
+
+import pandas as pd
+import datetime
+
+from avalanche.sinks import OUTPUT_FORMAT, Uploader, get_bucket
+from avalanche.snotel import DAILY_ELEMENTS, fetch_report, report_url, split_elements
+from avalanche.stations import by_state, load_stations
+
+# Destination prefix of each output and whether missing values are written as -1
+OUTPUTS = {
+    'swe': ('daily/swe/daily_swe', True),
+    'snow-depth': ('daily/snow-depth/daily_depth', True),
+    'air-temp': ('daily/air-temp/daily_temp', False),
+}
+
+
+def snotel_daily(station_data, day):
+    record = station_data
+
+    station_id = record["station_id"]
+
+    state = record["state"]
+
+    # build url with every element the per-variable outputs need
+
+    elements = ['stationId', 'name'] + [element for group in DAILY_ELEMENTS.values() for element in group]
+
+    url = report_url(station_id, state, day, day, elements)
+
+    print(url)
+
+    # read in snotel data, stations without records return an empty report
+
+    data = fetch_report(url)
+
+    return (None if data.empty else data), station_id
+
+
+def main(event, context):
+    #Station Metadata
+
+    station_md = by_state(load_stations(), 'CO')
+
+    # Get today's date
+    today = datetime.date.today()
+
+    # Yesterday date
+    yesterday = today - datetime.timedelta(days=1)
+
+    # Uploads run in the background while the next stations are fetched
+    uploader = Uploader(get_bucket("raw-avy-data"), OUTPUT_FORMAT)
+
+    for record in station_md.to_dict(orient='records'):
+
+        data, station_id = snotel_daily(record, yesterday)
+
+        if data is None:
+            print('NO RECORDS', station_id)
+            continue
+
+        for name, output in split_elements(data).items():
+            prefix, fill_missing = OUTPUTS[name]
+
+            if fill_missing:
+                output = output.fillna(-1)
+
+            uploader.submit(output, f'{prefix}_{station_id}_{yesterday}', index=True)
+
+    uploaded = uploader.close()
+    for name in uploaded:
+        print(f"{name} uploaded to raw-avy-data.")
+    for name, error in uploader.failed:
+        print(f"Error uploading {name} to raw-avy-data: {error}")
+
+    print('SUCCESS')
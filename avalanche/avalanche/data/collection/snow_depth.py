@@ -1,9 +1,13 @@
 import pandas as pd
 import datetime
-from google.cloud import storage
-from google.oauth2 import service_account
 import json
 import os
+import argparse
+
+from avalanche.journal import Journal, run_units, station_units
+from avalanche.sinks import get_bucket
+from avalanche.snotel import fetch_report, report_url
+from avalanche.stations import by_state, load_stations
 
 
 
@@ -18,8 +22,7 @@ def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
 
     # The ID of your GCS object
     # destination_blob_name = "storage-object-name"
-    storage_client = storage.Client(project='avalanche-analytics-project')
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name, project='avalanche-analytics-project')
     blob = bucket.blob(destination_blob_name)
 
     blob.upload_from_string(contents, 'text/csv')
@@ -29,41 +32,49 @@ def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
     )
 
 
-#Station Metadata
+# Backfill settings: checkpoint journal and the last day to fetch
+JOURNAL_PATH = os.environ.get('JOURNAL_PATH', 'journal.sqlite')
+ELEMENTS = ['stationId', 'name', 'SNWD::value', 'SNWD::qcFlag', 'SNWD::qaFlag', 'SNWD::prevValue']
+VARIABLE = 'SNWD'
+END_DATE = '2023-02-28'
 
-station_md = pd.read_html("https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist")[0].to_dict(orient='records')
-station_md = [entry for entry in station_md if entry['state'] == 'CO']
 
+def fetch_snow_depth(unit):
+    """Downloads one station's snow depth history, uploads it and returns the number of rows."""
+    state = load_stations().set_index('station_id').loc[int(unit.station_id), 'state']
 
-for i in range(0,len(station_md)):
-    record = station_md[i]
+    # build url
 
-    s = str()
+    url = report_url(unit.station_id, state, unit.start_date, unit.end_date, ELEMENTS)
 
-    station_id = record["site_name"][record["site_name"].find("(")+1:record["site_name"].find(")")]
+    print(url)
 
-    state = record["state"]
+    # read in snowtel daata
 
-    start_date = record["start"]
+    data = fetch_report(url)
 
-    # format
-    format = '%Y-%B'
+    data['state'] = state
 
-    # convert from string format to datetime format
-    s_date = datetime.datetime.strptime(start_date, format)
+    upload_blob_from_memory('snow-depth', contents=data.to_csv(), destination_blob_name=f'raw/{unit.station_id}.csv')
 
-    s_date = str(s_date.date())
+    return len(data)
 
-    # build url
 
-    url = f'https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/start_of_period/{station_id}:{state}:SNTL%7Cid=%22%22%7Cname/{s_date},2023-02-28/stationId,name,SNWD::value,SNWD::qcFlag,SNWD::qaFlag,SNWD::prevValue?fitToScreen=false'
+def main(workers=1):
+    #Station Metadata
+    station_md = by_state(load_stations(), 'CO')
 
-    print(url)
+    journal = Journal(JOURNAL_PATH)
+    added = journal.add(station_units(station_md.to_dict(orient='records'), VARIABLE, END_DATE))
+    journal.close()
+    print('Queued', added, 'new stations')
 
-    # read in snowtel daata
+    print(run_units(JOURNAL_PATH, fetch_snow_depth, workers=workers))
 
-    data = max(pd.read_html(url), key=lambda x: len(x))
 
-    data['state'] = state
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the snow depth history of Colorado SNOTEL stations.')
+    parser.add_argument('--workers', type=int, default=1, help='number of stations fetched in parallel')
+    args = parser.parse_args()
 
-    upload_blob_from_memory('snow-depth', contents=data.to_csv(), destination_blob_name='raw/{station_id}.csv')
+    main(workers=args.workers)
@@ -1,60 +1,53 @@
 import pandas as pd
-import numpy as np
 import datetime
-from google.cloud import storage
 import concurrent.futures
 
+from avalanche.features import new_snow
+from avalanche.sinks import OUTPUT_FORMAT, Uploader, get_bucket
+from avalanche.snotel import fetch_report, report_url
+from avalanche.stations import by_state, load_stations
 
-def upload_blob_from_memory(bucket, contents, destination_blob_name):
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_string(contents, content_type='text/csv')
+# Report elements fetched for each station
+ELEMENTS = ['stationId', 'name', 'SNWD::value', 'SNWD::qcFlag', 'SNWD::qaFlag', 'SNWD::prevValue']
 
 
 def process_station(record):
-    station_id = record["site_name"][record["site_name"].find("(") + 1:record["site_name"].find(")")]
+    station_id = record["station_id"]
     state = record["state"]
-    start_date = record["start"]
-    format = '%Y-%B'
-    s_date = datetime.datetime.strptime(start_date, format)
-    s_date = str(s_date.date())
-    url = f'https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/start_of_period/{station_id}:{state}:SNTL%7Cid=%22%22%7Cname/{s_date},2023-11-07/stationId,name,SNWD::value,SNWD::qcFlag,SNWD::qaFlag,SNWD::prevValue?fitToScreen=false'
+    s_date = str(record["start_date"].date())
+    url = report_url(station_id, state, s_date, '2023-11-07', ELEMENTS)
     #https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/1120:CO:SNTL|id=%22%22|name/-29,0/WTEQ::value,WTEQ::median_1991,WTEQ::pctOfMedian_1991,SNWD::value,PREC::value,PREC::median_1991,PREC::pctOfMedian_1991,TMAX::value,TMIN::value,TAVG::value?fitToScreen=false
     print('Done with', station_id, 'in', state, 'at', datetime.datetime.now().strftime("%H:%M:%S"))
-    data = max(pd.read_html(url), key=lambda x: len(x))
+    data = fetch_report(url)
     data['state'] = state
     data['county'] = record['county']
-    data['latitude'] = record['lat']
-    data['longitude'] = record['lon']
-    data['elevation'] = record['elev']
-    data['new_snow'] = np.maximum(0, data['Snow Depth (in) Start of Day Values'] - data['Snow Depth (in) Start of Day Values'].shift(1))
+    data['latitude'] = record['latitude']
+    data['longitude'] = record['longitude']
+    data['elevation'] = record['elevation_ft']
+    data['new_snow'] = new_snow(data, depth='Snow Depth (in) Start of Day Values', station='Station Id', date='Date')
     data.rename(columns={'Snow Depth (in) Start of Day Values': 'snow_depth', 'Station Id': 'station_id', 'Station Name': 'station_name'}, inplace=True)
     data = data[['state', 'county', 'latitude', 'longitude', 'elevation', 'station_name', 'station_id', 'Date', 'snow_depth', 'new_snow']]
     return station_id, data
 
 
 def main():
-    # Initialize Google Cloud Storage client and bucket
-    storage_client = storage.Client(project='avalanche-analytics-project')
-    bucket = storage_client.bucket('snow-depth')
+    # Shared Google Cloud Storage bucket
+    bucket = get_bucket('snow-depth', project='avalanche-analytics-project')
 
     # Fetch station metadata
-    station_md = pd.read_html("https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist")[
-        0].to_dict(orient='records')
-    station_md = [entry for entry in station_md if entry['state'] == 'CO']
+    station_md = by_state(load_stations(), 'CO').to_dict(orient='records')
 
-    # Process stations concurrently using ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    # Process stations concurrently using ThreadPoolExecutor, uploading each station as soon as it is done
+    with concurrent.futures.ThreadPoolExecutor() as executor, Uploader(bucket, OUTPUT_FORMAT) as uploader:
         futures = [executor.submit(process_station, record) for record in station_md]
 
-        # Wait for all futures to complete
-        concurrent.futures.wait(futures)
-
         # Upload data to Google Cloud Storage
-        for future in futures:
+        for future in concurrent.futures.as_completed(futures):
             station_id, data = future.result()
-            destination_blob_name = f'raw/{station_id}.csv'
-            upload_blob_from_memory(bucket, contents=data.to_csv(index=False),
-                                    destination_blob_name=destination_blob_name)
+            uploader.submit(data, f'raw/{station_id}')
+
+    for station_id, error in uploader.failed:
+        print(f"Error uploading {station_id}: {error}")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
 import pandas as pd
 import datetime
-from google.cloud import storage
-from google.oauth2 import service_account
 import json
 import os
+import argparse
+
+from avalanche.journal import Journal, run_units, station_units
+from avalanche.sinks import get_bucket
+from avalanche.snotel import fetch_report, report_url
+from avalanche.stations import load_stations
 
 
 
@@ -18,85 +22,64 @@ def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
 
     # The ID of your GCS object
     # destination_blob_name = "storage-object-name"
-    service_account_info = json.load(open('/home/max/Documents/Access Accounts/avalanche-analytics-project-55735591e108.json'))
-    storage_client = storage.Client(credentials = service_account.Credentials.from_service_account_info(service_account_info))
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
 
-    blob.upload_from_string(snow_data.to_csv(), 'text/csv')
+    blob.upload_from_string(contents, 'text/csv')
 
     print(
         f"{destination_blob_name} uploaded to {bucket_name}."
     )
 
 
-# Read all files in directory
-
-
-file = os.listdir('/home/max/Documents/Avalanche')
-file = [i.split('_',)[3] for i in file]
-file = [i.replace(".csv", "") for i in file]
-
-#Station Metadata
-
-
-station_md = pd.read_html("https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist")[1]
-#station_md = station_md[station_md['state'] == 'CO']
-
-all = []
-
-
-for i in range(0,len(station_md)):
-    record = station_md.iloc[i]
-
-    s = str()
-
-    station_id = record["site_name"][record["site_name"].find("(")+1:record["site_name"].find(")")]
-
-    if station_id in file:
-        print('pass', station_id)
-        pass
-    else:
-
-        state = record["state"]
-
-        start_date = record["start"]
+# Backfill settings: output directory, shared checkpoint journal and the last day to fetch
+OUTPUT_DIR = '/home/max/Documents/Avalanche'
+JOURNAL_PATH = os.path.join(OUTPUT_DIR, 'journal.sqlite')
+ELEMENTS = ['stationId', 'name', 'WTEQ::value', 'WTEQ::qcFlag', 'WTEQ::qaFlag', 'WTEQ::prevValue']
+VARIABLE = 'WTEQ'
+END_DATE = '2023-02-26'
 
-        # datetime in string format for may 25 1999
-        start_date = record["start"]
-        # format
-        format = '%Y-%B'
 
-        # convert from string format to datetime format
-        s_date = datetime.datetime.strptime(start_date, format)
+def fetch_snow_water_equivalent(unit):
+    """Downloads one station's snow water equivalent history and returns the number of rows written."""
+    state = load_stations().set_index('station_id').loc[int(unit.station_id), 'state']
 
-        s_date = str(s_date.date())
+    # build url
 
-        # build url
+    url = report_url(unit.station_id, state, unit.start_date, unit.end_date, ELEMENTS)
 
-        url = f'https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/start_of_period/{station_id}:{state}:SNTL%7Cid=%22%22%7Cname/{s_date},2023-02-26/stationId,name,WTEQ::value,WTEQ::qcFlag,WTEQ::qaFlag,WTEQ::prevValue??fitToScreen=false'
+    print(url)
 
-        print(url)
+    # read in snowtel daata
 
-        # read in snowtel daata
+    snow_data = fetch_report(url)
 
-        data = pd.read_html(url)
+    if len(snow_data) <= 2:
+        return 0
 
-        #Station ID
+    # Write under a temporary name first so a crash never leaves a partial file behind
+    path = os.path.join(OUTPUT_DIR, f'historical_snow_depth_{unit.station_id}.csv')
+    snow_data.to_csv(f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
 
-        station = data[5]
+    return len(snow_data)
 
-        #snow_depth
-        snow_data = data[34]
 
-        #all.append(snow_data)
+def main(workers=1):
+    #Station Metadata
+    station_md = load_stations()
 
-        #data = pd.concat(all)
+    journal = Journal(JOURNAL_PATH)
+    added = journal.add(station_units(station_md.to_dict(orient='records'), VARIABLE, END_DATE))
+    journal.close()
+    print('Queued', added, 'new stations')
 
-        if len(snow_data) > 2:
+    print(run_units(JOURNAL_PATH, fetch_snow_water_equivalent, workers=workers))
 
-            snow_data.to_csv(f'/home/max/Documents/Avalanche/historical_snow_depth_{station_id}.csv')
 
-        else:
-            pass
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the snow water equivalent history of every SNOTEL station.')
+    parser.add_argument('--workers', type=int, default=1, help='number of stations fetched in parallel')
+    args = parser.parse_args()
 
+    main(workers=args.workers)
@@ -1,72 +1,89 @@
 ''' This module contains functions for collecting streamflow data from the USGS API.
 It collects data for all streamflow stations in a given state and returns a pandas dataframe with the data.
-It collects the last 365 days of data for each station. '''
-
-import pandas as pd
-import requests
+It collects the last 365 days of data for each station. Stations are requested in multi-site batches
+that run concurrently, and the result is uploaded to GCS.
+In incremental mode only the days after each station's last stored date are fetched, and new or
+revised values are merged into one stored dataset. That dataset is also where the last dates come from,
+so the job keeps no state of its own between runs. '''
 
+import argparse
+from datetime import datetime, timedelta
 
-def get_streamflow_station_ids(state):
-    # The URL for the USGS streamflow stations service in the specified state
-    url = f'https://waterservices.usgs.gov/nwis/site/?format=rdb&stateCd={state}&siteType=ST&hasDataTypeCd=iv'
+import pandas as pd
 
-    # Send a request to the USGS API
-    response = requests.get(url)
+from avalanche.nwis import fetch_daily_values, fetch_incremental, merge_values, site_ids, stored_watermarks
+from avalanche.sinks import OUTPUT_FORMAT, decode_frame, get_bucket, write_frame
+from avalanche.store import default_store
 
-    # Parse the response into a list of station IDs
-    station_ids = [line.split('\t')[1] for line in response.text.split('\n') if line.startswith('USGS')]
+# The dataset incremental runs merge into
+DATASET_STEM = 'streamflow/daily_values'
 
-    # Return the list of station IDs
-    return station_ids
 
+def get_streamflow_station_ids(state):
+    # Return the list of stream site IDs in the specified state
+    return site_ids(state)
 
-def get_streamflow_data(url, station_id):
-    print(f"Fetching data for station {station_id} from {url}...")
 
-    # Send a GET request to the URL and store the response as a json object
-    response = requests.get(url)
+def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
+    """Uploads a file to the bucket."""
 
-    if response.status_code != 200:
-        print(f"Error {response.status_code} while fetching data for station {station_id} from {url}")
-        return pd.DataFrame()
+    bucket = get_bucket(bucket_name)
+    destination_blob_name = write_frame(bucket, contents, destination_blob_name, OUTPUT_FORMAT)
 
-    response = response.json()
+    print(f"{destination_blob_name} uploaded to {bucket_name}.")
 
-    # Extract the time series data from the json object
-    time_series = None
-    for ts in response['value']['timeSeries']:
-        if ts['variable']['variableCode'][0]['value'] == '00060':
-            time_series = ts['values'][0]['value']
-            break
 
-    # If time_series is still None, no data was found for variableCode '00060'
-    if time_series is None:
-        print(f"No data found for variableCode '00060' for station_id: {station_id}")
-        return pd.DataFrame()
+def load_dataset(bucket):
+    """The stored dataset, or None before the first incremental run."""
+    blob = bucket.blob(f'{DATASET_STEM}.parquet')
+    return decode_frame(blob.download_as_bytes(), 'parquet') if blob.exists() else None
 
-    # Create a list to store the data
-    data = [{'datetime': ts['dateTime'], 'discharge': float(ts['value']), 'station_id': station_id} for ts in
-            time_series]
 
-    # Create a pandas dataframe from the data list
-    df = pd.DataFrame(data)
+def update_dataset(bucket, stored, frames):
+    """Merges the fetched frames into the stored dataset."""
+    merged, changed = merge_values(stored, pd.concat(frames.values(), ignore_index=True))
+    print(f"{changed} new or revised values")
 
-    print(f"Fetched {len(df)} records for station {station_id}")
+    if changed:
+        destination_blob_name = write_frame(bucket, merged, DATASET_STEM, 'parquet')
+        print(f"{destination_blob_name} uploaded to {bucket.name}.")
 
-    return df
 
-def main():
+def main(incremental=False):
     # Get a list of all streamflow station IDs in Colorado
     ids = get_streamflow_station_ids('CO')
 
-    dfs = []
+    today = datetime.today().date()
+
+    if incremental:
+        # Fetch each station from its last stored date, or the last year for new stations
+        bucket = get_bucket("raw-avy-data")
+        stored = load_dataset(bucket)
+        frames = fetch_incremental(ids, stored_watermarks(stored), today - timedelta(days=365), today)
+    else:
+        # Fetch the last year of daily discharge in batches of stations
+        frames = fetch_daily_values(ids, period='P365D')
+    print(f"Fetched data for {len(frames)} of {len(ids)} stations")
+
+    if not frames:
+        return
+
+    if incremental:
+        update_dataset(bucket, stored, frames)
+    else:
+        df = pd.concat(frames.values(), ignore_index=True)
+        upload_blob_from_memory("raw-avy-data", df, f'daily/streamflow/{today}')
 
-    for i in ids:
+    # Keep a local copy for queries when AVALANCHE_STORE is set
+    store = default_store()
+    if store is not None:
+        store.write('streamflow', pd.concat(frames.values(), ignore_index=True))
 
-        data = get_streamflow_data(
-            f'https://waterservices.usgs.gov/nwis/dv/?format=json&sites={i}&period=P365D&siteStatus=active', i)
-        if not data.empty:
-            dfs.append(data)
 
-    df = pd.concat(dfs)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Collect the daily discharge of Colorado stream gauges.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch the days after each station\'s last stored date')
+    args = parser.parse_args()
 
+    main(incremental=args.incremental)
@@ -1,43 +1,20 @@
-import os
-
 import pandas as pd
 import datetime
-from google.cloud import storage
 from google.oauth2 import service_account
 import json
 
+from avalanche.sinks import OUTPUT_FORMAT, Uploader, get_bucket
+from avalanche.snotel import fetch_report, report_url
+from avalanche.stations import by_state, load_stations
 
-
-
-def upload_blob_from_memory(bucket_name, contents, destination_blob_name):
-    """Uploads a file to the bucket."""
-
-    # The ID of your GCS bucket
-    # bucket_name = "your-bucket-name"
-
-    # The contents to upload to the file
-    # contents = "these are my contents"
-
-    # The ID of your GCS object
-    # destination_blob_name = "storage-object-name"
-    #service_account_info = json.load(open('/home/max/Documents/Access Accounts/avalanche-analytics-project-55735591e108.json'))
-    #storage_client = storage.Client(credentials = service_account.Credentials.from_service_account_info(service_account_info))
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-
-    blob.upload_from_string(contents.to_csv(), 'text/csv')
-
-    print(
-        f"{destination_blob_name} uploaded to {bucket_name}."
-    )
-
+# Report elements fetched for each station
+ELEMENTS = ['stationId', 'name', 'WTEQ::value', 'WTEQ::qcFlag', 'WTEQ::qaFlag', 'WTEQ::prevValue']
 
 
 def snotel_swe_daily(station_data):
     record = station_data
 
-    station_id = record["site_name"][record["site_name"].find("(") + 1:record["site_name"].find(")")]
+    station_id = record["station_id"]
 
     state = record["state"]
 
@@ -50,20 +27,17 @@ def snotel_swe_daily(station_data):
     # Yesterday date
     yesterday = today - datetime.timedelta(days=1)
 
-    url = f'https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/start_of_period/{station_id}:{state}:SNTL%7Cid=%22%22%7Cname/{yesterday},{yesterday}/stationId,name,WTEQ::value,WTEQ::qcFlag,WTEQ::qaFlag,WTEQ::prevValue??fitToScreen=false'
+    url = report_url(station_id, state, yesterday, yesterday, ELEMENTS)
 
     print(url)
 
     # read in snowtel daata
 
-    data = pd.read_html(url)
-
-    # snow_depth
-    snow_data = data[34]
+    snow_data = fetch_report(url)
     snow_data = snow_data.fillna(-1)
 
-    if len(snow_data.axes[1]) > 10:
-        snow_data = 1
+    if snow_data.empty:
+        snow_data = None
 
     return snow_data, station_id
 
@@ -73,9 +47,7 @@ def main(event, context):
     #Station Metadata
 
 
-    station_md = pd.read_html("https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist")[1]
-
-    station_md = station_md[station_md['state'] == 'CO']
+    station_md = by_state(load_stations(), 'CO')
 
     # Get today's date
     today = datetime.date.today()
@@ -84,17 +56,26 @@ def main(event, context):
     # Yesterday date
     yesterday = today - datetime.timedelta(days=1)
 
+    # Uploads run in the background while the next stations are fetched
+    uploader = Uploader(get_bucket("raw-avy-data"), OUTPUT_FORMAT)
+
     for i in range(0,len(station_md)):
         record = station_md.iloc[i]
 
         data, station_id = snotel_swe_daily(record)
 
-        if data == 1:
+        if data is None:
             print('NO RECORDS', station_id)
             pass
         else:
 
-            upload_blob_from_memory("raw-avy-data", data, f'daily/swe/daily_swe_{station_id}_{yesterday}.csv')
+            uploader.submit(data, f'daily/swe/daily_swe_{station_id}_{yesterday}', index=True)
+
+    uploaded = uploader.close()
+    for name in uploaded:
+        print(f"{name} uploaded to raw-avy-data.")
+    for name, error in uploader.failed:
+        print(f"Error uploading {name} to raw-avy-data: {error}")
 
     print('SUCCESS')
 
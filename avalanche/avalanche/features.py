@@ -0,0 +1,131 @@
+''' Derived snowpack and weather features over a combined multi-station frame.
+Rows are keyed by station and calendar day and sorted once. Every feature is then an array operation over
+the whole frame, so one pass covers all stations instead of one small pass per station. Lookbacks are by
+calendar day: a value from k days earlier is only used when the station reported on that day. Gaps in a
+station's record therefore give NaN instead of a difference across the gap. '''
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+STATION_COLUMN = 'station_id'
+DATE_COLUMN = 'date'
+
+DEPTH_COLUMN = 'snow_depth_in'
+SWE_COLUMN = 'snow_water_equivalent_in'
+MAX_TEMP_COLUMN = 'max_temp_degF'
+MIN_TEMP_COLUMN = 'min_temp_degF'
+OBSERVED_TEMP_COLUMN = 'observed_temp_degF'
+
+# Snowfall totals and the number of days each one sums
+SNOWFALL_WINDOWS = {'snowfall_24h_in': 1, 'snowfall_48h_in': 2, 'snowfall_72h_in': 3}
+SWE_CHANGE_WINDOWS = {'swe_change_24h_in': 1, 'swe_change_72h_in': 3}
+
+# Days before a row that its features look back over
+FEATURE_LOOKBACK_DAYS = max(*SNOWFALL_WINDOWS.values(), *SWE_CHANGE_WINDOWS.values())
+
+# Longest lookback Timeline supports
+MAX_LOOKBACK_DAYS = 366
+
+
+def _values(data: pd.DataFrame, column: str) -> np.ndarray:
+    """The column as a float array with NaN for missing values, or all NaN when the frame lacks it."""
+    if column not in data.columns:
+        return np.full(len(data), np.nan)
+    return data[column].to_numpy(dtype='float64', na_value=np.nan)
+
+
+class Timeline:
+    """Rows of a multi-station frame sorted by (station, day), for lookups a number of days back."""
+
+    def __init__(self, data: pd.DataFrame, station: str = STATION_COLUMN, date: str = DATE_COLUMN) -> None:
+        codes, _ = pd.factorize(data[station])
+        dates = data[date].to_numpy(dtype='datetime64[D]')
+        dated = ~np.isnat(dates)
+        days = dates.astype(np.int64)
+
+        first = days[dated].min() if dated.any() else 0
+        span = (days[dated].max() - first if dated.any() else 0) + MAX_LOOKBACK_DAYS + 1
+
+        # Rows without a date get a station of their own, so nothing is looked up from or into them
+        codes = codes.astype(np.int64)
+        codes[~dated] = codes.max(initial=0) + 1 + np.arange((~dated).sum())
+        days = np.where(dated, days - first, 0)
+
+        # One integer per (station, day); a station's days never reach into the next station's range
+        keys = codes * span + days
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def _unsort(self, values: np.ndarray) -> np.ndarray:
+        result = np.empty_like(values)
+        result[self.order] = values
+        return result
+
+    def _check(self, days: int) -> None:
+        if not 0 < days <= MAX_LOOKBACK_DAYS:
+            raise ValueError(f"Lookbacks must be 1 to {MAX_LOOKBACK_DAYS} days, got {days}")
+
+    def lag(self, values: np.ndarray, days: int) -> np.ndarray:
+        """Each row's value from `days` days earlier at the same station, NaN when that day is missing."""
+        self._check(days)
+        target = self.keys - days
+        position = np.searchsorted(self.keys, target, side='left')
+        clipped = np.minimum(position, len(self.keys) - 1)
+        found = (position < len(self.keys)) & (self.keys[clipped] == target)
+
+        return self._unsort(np.where(found, values[self.order][clipped], np.nan))
+
+    def total(self, values: np.ndarray, days: int) -> np.ndarray:
+        """Sum of each station's values over the `days` days ending on the row's day, NaN when all are missing."""
+        self._check(days)
+        ordered = values[self.order]
+        start = np.searchsorted(self.keys, self.keys - (days - 1), side='left')
+        end = np.arange(1, len(ordered) + 1)
+
+        sums = np.concatenate(([0.0], np.cumsum(np.nan_to_num(ordered))))
+        counts = np.concatenate(([0], np.cumsum(~np.isnan(ordered))))
+
+        total = sums[end] - sums[start]
+        return self._unsort(np.where(counts[end] > counts[start], total, np.nan))
+
+
+def new_snow(data: pd.DataFrame, depth: str = DEPTH_COLUMN, station: str = STATION_COLUMN,
+             date: str = DATE_COLUMN, timeline: Optional[Timeline] = None) -> pd.Series:
+    """Increase in snow depth since the previous day at each station; decreases count as zero."""
+    timeline = timeline or Timeline(data, station, date)
+    values = _values(data, depth)
+    return pd.Series(np.maximum(0, values - timeline.lag(values, 1)), index=data.index, name='new_snow')
+
+
+def derive_features(data: pd.DataFrame, station: str = STATION_COLUMN, date: str = DATE_COLUMN) -> pd.DataFrame:
+    """Returns a copy of `data` with new snow, snowfall totals, SWE change, settlement and temperature swings.
+
+    Columns the frame lacks give NaN features rather than an error.
+    """
+    timeline = Timeline(data, station, date)
+
+    depth = _values(data, DEPTH_COLUMN)
+    previous_depth = timeline.lag(depth, 1)
+    swe = _values(data, SWE_COLUMN)
+    observed = _values(data, OBSERVED_TEMP_COLUMN)
+
+    features: Dict[str, np.ndarray] = {}
+    features['new_snow'] = np.maximum(0, depth - previous_depth)
+    for name, days in SNOWFALL_WINDOWS.items():
+        features[name] = timeline.total(features['new_snow'], days)
+
+    for name, days in SWE_CHANGE_WINDOWS.items():
+        features[name] = swe - timeline.lag(swe, days)
+
+    # Depth lost over a day and that loss as a percentage of the previous day's depth
+    features['settlement_24h_in'] = np.maximum(0, previous_depth - depth)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features['settlement_rate_pct'] = np.where(previous_depth > 0,
+                                                   100 * features['settlement_24h_in'] / previous_depth, np.nan)
+
+    features['temp_range_degF'] = _values(data, MAX_TEMP_COLUMN) - _values(data, MIN_TEMP_COLUMN)
+    features['temp_change_24h_degF'] = observed - timeline.lag(observed, 1)
+
+    return data.assign(**features)
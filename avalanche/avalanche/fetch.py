@@ -0,0 +1,62 @@
+''' Bounded-concurrency async fetcher shared by the collectors.
+Requests run on a worker pool through one pooled session that caches responses (see avalanche.http). A
+global semaphore caps the number of requests in flight and a per-host semaphore caps how many of them
+hit the same upstream. '''
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from avalanche.http import CachedSession
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 60
+
+
+class AsyncFetcher:
+    """Fetches URLs concurrently with a shared session, bounded globally and per host."""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, per_host: Optional[int] = None,
+                 timeout: float = DEFAULT_TIMEOUT, session: Optional[requests.Session] = None) -> None:
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+
+        self.concurrency = concurrency
+        self.per_host = min(per_host or concurrency, concurrency)
+        self.timeout = timeout
+
+        # A caller's session keeps its own adapters; CachedSession sizes its pool to `concurrency`
+        self.session = session or CachedSession(pool_size=concurrency)
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='fetch')
+        self._limit = asyncio.Semaphore(concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def get(self, url: str) -> requests.Response:
+        async with self._limit, self._host_limit(url):
+            loop = asyncio.get_running_loop()
+            logging.debug(f"GET {url}")
+            return await loop.run_in_executor(self._executor, lambda: self.session.get(url, timeout=self.timeout))
+
+    async def get_all(self, urls: Iterable[str]) -> List[requests.Response]:
+        return await asyncio.gather(*(self.get(url) for url in urls))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    async def __aenter__(self) -> 'AsyncFetcher':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
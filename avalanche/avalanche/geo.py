@@ -0,0 +1,114 @@
+''' Vectorized distances between stations and regions of interest.
+Distances from every point to every reference point are computed in one NumPy pass instead of one
+geopy call per pair. `haversine` treats the earth as a sphere and is accurate to about 0.5%;
+`vincenty` solves the inverse problem on the WGS84 ellipsoid and matches geopy's geodesic to well under
+a metre. Use it when points sit close to a region's radius. '''
+
+from typing import Iterable, NamedTuple, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.7613
+METRES_PER_MILE = 1609.344
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+METHODS = ('haversine', 'vincenty')
+
+
+class Region(NamedTuple):
+    name: str
+    latitude: float
+    longitude: float
+    radius_miles: float
+
+
+# Regions whose buoys are collected by bouy_data.py
+BUOY_REGIONS = (
+    Region('hawaii', 19.8968, -155.5828, 1000),
+    Region('juneau', 58.3019, -134.4197, 700),
+)
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in miles between broadcastable arrays of coordinates in degrees."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def vincenty(lat1, lon1, lat2, lon2, max_iter: int = 200, tol: float = 1e-12) -> np.ndarray:
+    """Ellipsoidal (WGS84) distance in miles between broadcastable arrays of coordinates in degrees.
+
+    Nearly antipodal pairs, where the iteration does not converge, fall back to the haversine distance.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in (lat1, lon1, lat2, lon2)))
+
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat2)))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_U2 * sin_lam, cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam)
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma)
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos_sq_alpha == 0
+            cos_2sigma_m = np.where(cos_sq_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos_sq_alpha)
+
+            C = WGS84_F / 16 * cos_sq_alpha * (4 + WGS84_F * (4 - 3 * cos_sq_alpha))
+            previous = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+
+            converged = np.abs(lam - previous) <= tol
+            if converged.all():
+                break
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+
+    miles = WGS84_B * A * (sigma - delta_sigma) / METRES_PER_MILE
+
+    return np.where(converged & np.isfinite(miles), miles, haversine(lat1, lon1, lat2, lon2))
+
+
+def distances(latitudes: Sequence[float], longitudes: Sequence[float], regions: Iterable[Region],
+              method: str = 'vincenty') -> np.ndarray:
+    """Returns an (n_points, n_regions) array of distances in miles from each point to each region's centre."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown distance method {method!r}, expected one of {METHODS}")
+
+    regions = list(regions)
+    lats = np.asarray(latitudes, dtype=float)[:, np.newaxis]
+    lons = np.asarray(longitudes, dtype=float)[:, np.newaxis]
+    centre_lats = np.array([region.latitude for region in regions], dtype=float)
+    centre_lons = np.array([region.longitude for region in regions], dtype=float)
+
+    distance = haversine if method == 'haversine' else vincenty
+    return distance(lats, lons, centre_lats, centre_lons).reshape(len(lats), len(regions))
+
+
+def within_regions(latitudes: Sequence[float], longitudes: Sequence[float], regions: Iterable[Region] = BUOY_REGIONS,
+                   method: str = 'vincenty') -> np.ndarray:
+    """Boolean mask of the points that lie within the radius of at least one region."""
+    regions = list(regions)
+    radii = np.array([region.radius_miles for region in regions], dtype=float)
+    return (distances(latitudes, longitudes, regions, method) <= radii).any(axis=1)
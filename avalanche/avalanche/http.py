@@ -0,0 +1,413 @@
+''' Shared HTTP layer for the collectors, with an on-disk response cache.
+GET responses are stored in a SQLite file keyed by their full URL, with gzip-compressed bodies. By
+default every cached response is revalidated with its ETag/Last-Modified and reused on a 304, since
+many of the URLs we fetch ("latest" observations, relative date ranges) change without changing name.
+Callers that know a URL is stable can pass a TTL, and a cached response younger than it is returned
+without touching the network. Streamed bodies are stored as the caller reads them, once read to the
+end. When the cache grows past its size limit, the least recently used responses are evicted.
+Transfers ask for gzip, which requests decodes.
+
+Requests that do reach the network share pooled keep-alive connections and get a default timeout.
+Each host has an optional token-bucket rate limit, so that raising concurrency does not get us
+throttled by wcc.sc.egov.usda.gov. Connection errors, timeouts, 429 and 5xx responses to idempotent
+requests are retried with exponential backoff and full jitter, honouring Retry-After. Request counts,
+retries, cache hits, rate-limit waits and latency histograms are collected per host in `metrics`.
+
+Use `session()` (or `get()`) instead of requests directly, so reruns and debugging sessions hit the
+cache. Pass `ttl=3600` to a request to reuse its response for an hour. '''
+
+import gzip
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = Path(os.environ.get('AVALANCHE_CACHE_DIR', Path.home() / '.cache' / 'avalanche'))
+CACHE_TTL = float(os.environ.get('AVALANCHE_HTTP_TTL', 0))
+CACHE_MAX_BYTES = 512 * 2 ** 20
+
+POOL_SIZE = 16
+CACHEABLE_STATUSES = {200}
+
+TIMEOUT = 60
+RETRIES = 3
+BACKOFF_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Only these are retried; repeating a POST could apply it twice
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'}
+
+# Requests per second and burst size per host; AVALANCHE_RATE_LIMITS="host=rate[:burst],..." overrides them
+RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    'wcc.sc.egov.usda.gov': (10.0, 20),
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Headers that describe the transfer rather than the stored (decoded) body
+_TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def _parse_rate_limits(value: str) -> Dict[str, Tuple[float, int]]:
+    """Parses "host=rate[:burst],..."; malformed entries are logged and ignored."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        try:
+            host, limit = item.split('=')
+            rate, _, burst = limit.partition(':')
+            limits[host] = (float(rate), int(burst or max(1, float(rate))))
+        except ValueError:
+            logging.warning(f"Ignoring malformed rate limit {item!r}, expected host=rate[:burst]")
+    return limits
+
+
+RATE_LIMITS.update(_parse_rate_limits(os.environ.get('AVALANCHE_RATE_LIMITS', '')))
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes a token, sleeping until it is available, and returns how long that took."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now so waiting callers queue up behind each other
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class Metrics:
+    """Thread-safe per-host request counters and latency histograms."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests: Counter = Counter()
+            self.retries: Counter = Counter()
+            self.cache_hits: Counter = Counter()
+            self.throttled_seconds: Dict[str, float] = defaultdict(float)
+            self.latency: Dict[str, list] = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+            self.latency_seconds: Dict[str, float] = defaultdict(float)
+
+    def record_request(self, host: str, outcome: Union[int, str], seconds: float) -> None:
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            self.requests[host, outcome] += 1
+            self.latency[host][bucket] += 1
+            self.latency_seconds[host] += seconds
+
+    def record_retry(self, host: str) -> None:
+        with self._lock:
+            self.retries[host] += 1
+
+    def record_cache_hit(self, host: str) -> None:
+        with self._lock:
+            self.cache_hits[host] += 1
+
+    def record_wait(self, host: str, seconds: float) -> None:
+        with self._lock:
+            self.throttled_seconds[host] += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the metrics of each host as plain data, e.g. for logging or export."""
+        with self._lock:
+            hosts = {host for host, _ in self.requests} | set(self.cache_hits)
+            snapshot = {}
+            for host in sorted(hosts):
+                latency = self.latency[host] if host in self.latency else [0] * (len(LATENCY_BUCKETS) + 1)
+                count = sum(latency)
+                snapshot[host] = {
+                    'requests': {str(outcome): n for (name, outcome), n in self.requests.items() if name == host},
+                    'retries': self.retries[host],
+                    'cache_hits': self.cache_hits[host],
+                    'throttled_seconds': round(self.throttled_seconds.get(host, 0.0), 3),
+                    'latency_buckets': dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'], latency)),
+                    'latency_mean': self.latency_seconds.get(host, 0.0) / count if count else None,
+                }
+            return snapshot
+
+    def log(self, level: int = logging.INFO) -> None:
+        for host, values in self.snapshot().items():
+            logging.log(level, f"HTTP {host}: {json.dumps(values)}")
+
+
+metrics = Metrics()
+
+
+class ResponseCache:
+    """Size-bounded LRU store of responses in SQLite, safe to share between threads."""
+
+    def __init__(self, path: Union[str, Path] = ':memory:', max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+
+    def get(self, url: str) -> Optional[sqlite3.Row]:
+        with self._lock, self.connection:
+            row = self.connection.execute('SELECT * FROM responses WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                self.connection.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        return row
+
+    def put(self, url: str, response: requests.Response, content: Optional[bytes] = None) -> None:
+        """Stores a response, with `content` as its body when it was read separately (streamed responses)."""
+        body = gzip.compress(response.content if content is None else content)
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _TRANSFER_HEADERS}
+        now = time.time()
+
+        with self._lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, json.dumps(headers), body, len(body), response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'), now, now))
+            self._evict()
+
+    def touch(self, url: str) -> None:
+        """Marks a response as fresh again after the server confirmed it is unchanged."""
+        with self._lock, self.connection:
+            self.connection.execute('UPDATE responses SET stored_at = ? WHERE url = ?', (time.time(), url))
+
+    def _evict(self) -> None:
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for url, size in self.connection.execute('SELECT url, size FROM responses ORDER BY accessed_at'):
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+        self.connection.executemany('DELETE FROM responses WHERE url = ?', evicted)
+        logging.debug(f"Evicted {len(evicted)} cached responses")
+
+    def size(self) -> int:
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock, self.connection:
+            self.connection.execute('DELETE FROM responses')
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _cached_response(row: sqlite3.Row) -> requests.Response:
+    response = requests.Response()
+    response.status_code = row['status']
+    response.reason = 'OK'
+    response.url = row['url']
+    response.headers = CaseInsensitiveDict(json.loads(row['headers']))
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    # The body is already in memory, so stream=True callers read it from there
+    response._content = gzip.decompress(row['body'])
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+
+class _TeeRaw:
+    """Wraps a streamed response's raw body and passes the decoded bytes to `done` once all are read."""
+
+    def __init__(self, raw, done) -> None:
+        self._raw = raw
+        self._done = done
+        self._chunks = []
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+        # A caller that stops early leaves nothing in the cache
+        self._done(b''.join(self._chunks))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._raw, name)
+
+
+class CachedSession(requests.Session):
+    """Pooled, rate-limited and retrying requests.Session whose GETs go through a ResponseCache."""
+
+    def __init__(self, cache_dir: Optional[Union[str, Path]] = None, ttl: float = CACHE_TTL,
+                 max_bytes: int = CACHE_MAX_BYTES, pool_size: int = POOL_SIZE, timeout: float = TIMEOUT,
+                 retries: int = RETRIES, backoff: Optional[float] = None,
+                 rate_limits: Optional[Dict[str, Tuple[float, int]]] = None) -> None:
+        super().__init__()
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = BACKOFF_SECONDS if backoff is None else backoff
+        self.rate_limits = RATE_LIMITS if rate_limits is None else rate_limits
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        cache_dir = Path(cache_dir or CACHE_DIR)
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            path = cache_dir / 'http.sqlite'
+        except OSError as e:
+            logging.warning(f"Cannot use {cache_dir} for the HTTP cache, keeping it in memory: {e}")
+            path = ':memory:'
+        self.cache = ResponseCache(path, max_bytes)
+
+    def _bucket(self, host: str) -> Optional[TokenBucket]:
+        if host not in self.rate_limits:
+            return None
+        with self._buckets_lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(*self.rate_limits[host])
+            return self._buckets[host]
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        delay = random.uniform(0, min(BACKOFF_CAP_SECONDS, self.backoff * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request within the host's rate limit, retrying transient failures of idempotent methods."""
+        host = urlsplit(url).netloc
+        bucket = self._bucket(host)
+        kwargs.setdefault('timeout', self.timeout)
+        retries = self.retries if method.upper() in IDEMPOTENT_METHODS else 0
+
+        for attempt in range(retries + 1):
+            if bucket is not None:
+                metrics.record_wait(host, bucket.acquire())
+
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.record_request(host, type(e).__name__, time.perf_counter() - start)
+                if attempt == retries:
+                    raise
+                reason = repr(e)
+            else:
+                metrics.record_request(host, response.status_code, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                reason = f"status {response.status_code}"
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+
+            delay = self._delay(attempt, retry_after)
+            metrics.record_retry(host)
+            logging.warning(f"Retrying {url} in {delay:.2f}s after {reason} (attempt {attempt + 1})")
+            time.sleep(delay)
+
+    def request(self, method, url, ttl: Optional[float] = None, **kwargs) -> requests.Response:
+        if method.upper() != 'GET':
+            return self._send(method, url, **kwargs)
+
+        key = requests.Request('GET', url, params=kwargs.get('params')).prepare().url
+        ttl = self.ttl if ttl is None else ttl
+        headers = dict(kwargs.pop('headers', None) or {})
+
+        # Callers that revalidate on their own get the server's answer as is
+        conditional = any(name.lower() in ('if-none-match', 'if-modified-since') for name in headers)
+
+        entry = None if conditional else self.cache.get(key)
+        if entry is not None:
+            if time.time() - entry['stored_at'] < ttl:
+                logging.debug(f"Cache hit {key}")
+                metrics.record_cache_hit(urlsplit(key).netloc)
+                return _cached_response(entry)
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self._send(method, url, headers=headers, **kwargs)
+        response.from_cache = False
+
+        if entry is not None and response.status_code == 304:
+            response.close()
+            self.cache.touch(key)
+            logging.debug(f"Revalidated {key}")
+            return _cached_response(entry)
+
+        if response.status_code in CACHEABLE_STATUSES and 'no-store' not in response.headers.get('Cache-Control', ''):
+            if kwargs.get('stream') and not response._content_consumed:
+                # Reading .content here would load the whole body before the caller streams it
+                response.raw = _TeeRaw(response.raw, lambda content: self.cache.put(key, response, content))
+            else:
+                self.cache.put(key, response)
+
+        return response
+
+    def close(self) -> None:
+        super().close()
+        self.cache.close()
+
+
+_default: Optional[CachedSession] = None
+_default_lock = threading.Lock()
+
+
+def session() -> CachedSession:
+    """Returns the process-wide cached session, creating it on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CachedSession()
+    return _default
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return session().get(url, **kwargs)
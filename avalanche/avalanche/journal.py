@@ -0,0 +1,180 @@
+''' Checkpoint journal for the historical backfills.
+A backfill is split into work units of (station, variable, date range). Units are recorded in a SQLite
+journal and move from pending to claimed to done. Claims happen inside an IMMEDIATE transaction, so
+several workers, whether threads or separate processes, can share one journal without taking the same
+unit twice. A claim that is not finished within the lease (because its worker died) becomes claimable
+again. An interrupted backfill therefore resumes from the units that are not done yet. A worker can only
+finish a unit while it still holds the claim, so a late worker cannot overwrite the unit's next owner. '''
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, NamedTuple, Optional, Union
+
+import pandas as pd
+
+LEASE_SECONDS = 3600
+MAX_ATTEMPTS = 3
+
+
+class WorkUnit(NamedTuple):
+    station_id: str
+    variable: str
+    start_date: str
+    end_date: str
+
+
+class Journal:
+
+    def __init__(self, path: Union[str, Path], worker_id: Optional[str] = None,
+                 lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS) -> None:
+        self.path = str(path)
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        # Claim time of each unit this worker holds, the lease token checked when it finishes
+        self._claims: Dict[WorkUnit, float] = {}
+
+        # Autocommit mode so claims can open their own IMMEDIATE transactions
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS units (
+                station_id TEXT NOT NULL,
+                variable TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                claimed_at REAL,
+                finished_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                rows INTEGER,
+                error TEXT,
+                PRIMARY KEY (station_id, variable, start_date, end_date)
+            )
+        """)
+
+    def add(self, units: Iterable[WorkUnit]) -> int:
+        """Registers units that are not in the journal yet and returns how many were new."""
+        before = self.connection.total_changes
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO units (station_id, variable, start_date, end_date) VALUES (?, ?, ?, ?)',
+                [tuple(str(value) for value in unit) for unit in units])
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        return self.connection.total_changes - before
+
+    def claim(self) -> Optional[WorkUnit]:
+        """Atomically takes the next pending (or abandoned) unit for this worker."""
+        now = time.time()
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute("""
+                SELECT station_id, variable, start_date, end_date FROM units
+                WHERE attempts < ? AND (
+                    status = 'pending'
+                    OR status = 'failed'
+                    OR (status = 'claimed' AND claimed_at < ?)
+                )
+                ORDER BY attempts, station_id, variable, start_date
+                LIMIT 1
+            """, (self.max_attempts, now - self.lease_seconds)).fetchone()
+
+            if row is not None:
+                self.connection.execute("""
+                    UPDATE units SET status = 'claimed', worker = ?, claimed_at = ?, attempts = attempts + 1
+                    WHERE station_id = ? AND variable = ? AND start_date = ? AND end_date = ?
+                """, (self.worker_id, now, *row))
+
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+        if row is None:
+            return None
+
+        unit = WorkUnit(*row)
+        self._claims[unit] = now
+        return unit
+
+    def _finish(self, unit: WorkUnit, status: str, rows: Optional[int] = None, error: Optional[str] = None) -> bool:
+        claimed_at = self._claims.pop(unit, None)
+        finished = claimed_at is not None and self.connection.execute("""
+            UPDATE units SET status = ?, finished_at = ?, rows = ?, error = ?
+            WHERE station_id = ? AND variable = ? AND start_date = ? AND end_date = ?
+                AND status = 'claimed' AND worker = ? AND claimed_at = ?
+        """, (status, time.time(), rows, error, *unit, self.worker_id, claimed_at)).rowcount > 0
+
+        if not finished:
+            logging.warning(f"Not marking {unit} {status}: {self.worker_id} no longer holds its claim")
+        return finished
+
+    def complete(self, unit: WorkUnit, rows: Optional[int] = None) -> bool:
+        """Marks a unit this worker claimed as done; returns False when its lease has passed to another claim."""
+        return self._finish(unit, 'done', rows=rows)
+
+    def fail(self, unit: WorkUnit, error: str) -> bool:
+        """Marks a unit this worker claimed as failed; returns False when its lease has passed to another claim."""
+        return self._finish(unit, 'failed', error=error)
+
+    def __iter__(self) -> Iterator[WorkUnit]:
+        while True:
+            unit = self.claim()
+            if unit is None:
+                return
+            yield unit
+
+    def summary(self) -> Dict[str, int]:
+        return dict(self.connection.execute('SELECT status, COUNT(*) FROM units GROUP BY status'))
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def station_units(records: Iterable[Mapping[str, Any]], variable: str, end_date: str) -> Iterator[WorkUnit]:
+    """One unit per registry station, from its start date to `end_date`; stations without one are skipped."""
+    for record in records:
+        if pd.isna(record.get('start_date')):
+            logging.warning(f"Skipping station {record['station_id']}: the registry has no start date for it")
+            continue
+        yield WorkUnit(str(record['station_id']), variable, str(record['start_date'].date()), end_date)
+
+
+def run_units(path: Union[str, Path], handler: Callable[[WorkUnit], Optional[int]], workers: int = 1) -> Dict[str, int]:
+    """Runs `handler` over every unclaimed unit with `workers` threads, each holding its own connection.
+
+    The handler returns the number of rows it wrote. Units whose handler raises are marked failed and
+    retried, after the fresh units, until they reach the attempt limit.
+    """
+    def work() -> None:
+        journal = Journal(path)
+        try:
+            for unit in journal:
+                try:
+                    journal.complete(unit, rows=handler(unit))
+                except Exception as e:
+                    logging.exception(f"Failed {unit}")
+                    journal.fail(unit, repr(e))
+        finally:
+            journal.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(work) for _ in range(workers)]:
+            future.result()
+
+    journal = Journal(path)
+    summary = journal.summary()
+    journal.close()
+    return summary
@@ -0,0 +1,49 @@
+''' Parser for the NDBC latest observations file (latest_obs.txt).
+The file is downloaded once and parsed from memory. Its first two lines are '#'-prefixed headers, the
+measurement names and then their units; they are combined into `{name}_{unit}` column names such as
+`WSPD_m/s`. Missing values ("MM") become NaN. '''
+
+import io
+
+import pandas as pd
+
+from avalanche import http
+
+LATEST_OBS_URL = 'https://www.ndbc.noaa.gov/data/latest_obs/latest_obs.txt'
+
+MISSING = ['MM']
+
+# Observation time columns, parsed as integers
+TIME_COLUMNS = ['YYYY_yr', 'MM_mo', 'DD_day', 'hh_hr', 'mm_mn']
+
+
+def parse_latest_obs(contents) -> pd.DataFrame:
+    """Parses the text or bytes of latest_obs.txt into a frame with `station_id` and `{name}_{unit}` columns."""
+    if isinstance(contents, bytes):
+        contents = contents.decode('utf-8')
+
+    buffer = io.StringIO(contents)
+    names = buffer.readline().lstrip('#').split()
+    units = buffer.readline().lstrip('#').split()
+    columns = ['station_id'] + [f'{name}_{unit}' for name, unit in zip(names[1:], units[1:])]
+
+    data = pd.read_csv(buffer, delim_whitespace=True, header=None, names=columns, na_values=MISSING,
+                       dtype={'station_id': 'string'})
+
+    measurements = [column for column in columns if column not in ['station_id'] + TIME_COLUMNS]
+    return data.astype({**{column: 'Int64' for column in TIME_COLUMNS if column in data.columns},
+                        **{column: 'float64' for column in measurements}})
+
+
+def observation_times(data: pd.DataFrame) -> pd.Series:
+    """UTC time of each observation, from the TIME_COLUMNS of a parsed frame."""
+    parts = data[TIME_COLUMNS].astype('float64')
+    parts.columns = ['year', 'month', 'day', 'hour', 'minute']
+    return pd.to_datetime(parts, errors='coerce')
+
+
+def fetch_latest_obs(url: str = LATEST_OBS_URL, session=None, timeout: float = 60) -> pd.DataFrame:
+    """Downloads latest_obs.txt once and parses it."""
+    response = (session or http.session()).get(url, timeout=timeout)
+    response.raise_for_status()
+    return parse_latest_obs(response.content)
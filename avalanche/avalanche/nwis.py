@@ -0,0 +1,212 @@
+''' Client for the USGS NWIS water services.
+The daily values service accepts a comma-separated list of sites. Stations are therefore requested in
+batches, the batches run in parallel, and the `timeSeries` array of each response is split back into
+one frame per station. Each series is read straight into datetime64/float32 arrays, with one column
+per requested parameter code.
+
+For incremental updates, each site's last ingested date is read from the stored dataset into a
+WatermarkStore (stored_watermarks). Sites are fetched
+from that date (less a few days, to pick up revised provisional values), grouped by start date so
+they still share requests. merge_values then folds only new or changed rows into the stored dataset. '''
+
+import datetime
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from avalanche import http
+from avalanche.watermarks import WatermarkStore
+
+API_URL = 'https://waterservices.usgs.gov/nwis'
+SITE_URL = '{api_url}/site/?format=rdb&stateCd={state}&siteType=ST&hasDataTypeCd=iv'
+DV_URL = '{api_url}/dv/?format=json&sites={sites}&parameterCd={parameters}&{window}&siteStatus=active'
+
+DISCHARGE = '00060'
+GAGE_HEIGHT = '00065'
+WATER_TEMPERATURE = '00010'
+
+# Column names of the parameters we know; others keep their code
+PARAMETER_NAMES = {
+    DISCHARGE: 'discharge',
+    GAGE_HEIGHT: 'gage_height',
+    WATER_TEMPERATURE: 'water_temperature',
+}
+
+# NWIS allows up to 100 sites per request
+BATCH_SIZE = 100
+WORKERS = 8
+
+# Days before a site's watermark that are fetched again, as USGS revises provisional values
+REVISION_DAYS = 7
+KEY_COLUMNS = ['station_id', 'datetime']
+
+
+def site_ids(state: str, api_url: str = API_URL, session=None, timeout: float = 60) -> List[str]:
+    """Returns the IDs of the active stream sites in `state`."""
+    response = (session or http.session()).get(SITE_URL.format(api_url=api_url, state=state), timeout=timeout)
+    response.raise_for_status()
+    return [line.split('\t')[1] for line in response.text.split('\n') if line.startswith('USGS')]
+
+
+def batches(ids: Sequence[str], size: int = BATCH_SIZE) -> List[List[str]]:
+    return [list(ids[i:i + size]) for i in range(0, len(ids), size)]
+
+
+def dv_url(sites: Iterable[str], period: str = 'P365D', parameters: Sequence[str] = (DISCHARGE,),
+           api_url: str = API_URL, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> str:
+    """Builds a daily values URL for the last `period`, or from `start` to `end` when `start` is given."""
+    window = f'period={period}' if start is None else f'startDT={start}' + (f'&endDT={end}' if end else '')
+    return DV_URL.format(api_url=api_url, sites=','.join(sites), parameters=','.join(parameters), window=window)
+
+
+def _series_arrays(values: List[Dict[str, str]], no_data: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads the dateTime and value of each point straight into preallocated datetime64/float32 arrays."""
+    dates = np.fromiter((value['dateTime'] for value in values), dtype='datetime64[ns]', count=len(values))
+    readings = np.fromiter((float(value['value']) for value in values), dtype=np.float32, count=len(values))
+    readings[readings == no_data] = np.nan
+    return dates, readings
+
+
+def split_series(payload: Dict[str, Any], parameters: Sequence[str] = (DISCHARGE,)) -> Dict[str, pd.DataFrame]:
+    """Splits a multi-site response into one frame per station with a float32 column per parameter.
+
+    Stations that report several parameters are aligned on `datetime`; no-data values become NaN.
+    """
+    names = [PARAMETER_NAMES.get(parameter, parameter) for parameter in parameters]
+
+    arrays_by_station: Dict[str, Dict[str, Tuple[np.ndarray, np.ndarray]]] = {}
+    for series in payload['value']['timeSeries']:
+        station_id = series['sourceInfo']['siteCode'][0]['value']
+        parameter = series['variable']['variableCode'][0]['value']
+        columns = arrays_by_station.setdefault(station_id, {})
+        name = PARAMETER_NAMES.get(parameter, parameter)
+        if parameter not in parameters or name in columns:
+            continue
+
+        columns[name] = _series_arrays(series['values'][0]['value'], series['variable'].get('noDataValue'))
+
+    frames = {}
+    for station_id, columns in arrays_by_station.items():
+        if not columns:
+            continue
+
+        arrays = [(name, *columns[name]) for name in names if name in columns]
+        dates = arrays[0][1]
+        if all(np.array_equal(other, dates) for _, other, _ in arrays[1:]):
+            frame = pd.DataFrame({'datetime': dates, **{name: readings for name, _, readings in arrays},
+                                  'station_id': station_id})
+        else:
+            frame = pd.concat([pd.Series(readings, index=pd.DatetimeIndex(other, name='datetime'), name=name)
+                               for name, other, readings in arrays], axis=1).reset_index()
+            frame['station_id'] = station_id
+
+        frames[station_id] = frame
+    return frames
+
+
+def _fetch_batch(session, sites: List[str], period: str, parameters: Sequence[str], api_url: str,
+                 start: Optional[datetime.date], end: Optional[datetime.date],
+                 timeout: float) -> Dict[str, pd.DataFrame]:
+    url = dv_url(sites, period, parameters, api_url=api_url, start=start, end=end)
+    try:
+        response = session.get(url, timeout=timeout)
+        if response.status_code != 200:
+            logging.error(f"Error {response.status_code} while fetching {len(sites)} stations from {url}")
+            return {}
+        payload = response.json()
+    except (requests.RequestException, ValueError) as e:
+        # Retries are exhausted or the body is not JSON; the other batches carry on
+        logging.error(f"Failed to fetch {len(sites)} stations from {url}: {e}")
+        return {}
+
+    frames = split_series(payload, parameters)
+    logging.info(f"Fetched {sum(len(frame) for frame in frames.values())} records for {len(frames)} of "
+                 f"{len(sites)} stations")
+    return frames
+
+
+def fetch_daily_values(ids: Sequence[str], period: str = 'P365D', parameters: Sequence[str] = (DISCHARGE,),
+                       batch_size: int = BATCH_SIZE, workers: int = WORKERS, api_url: str = API_URL,
+                       session: Optional[requests.Session] = None, timeout: float = 120,
+                       start: Optional[datetime.date] = None,
+                       end: Optional[datetime.date] = None) -> Dict[str, pd.DataFrame]:
+    """Fetches the daily values of `parameters` for `ids` in concurrent multi-site batches, keyed by station.
+
+    The last `period` is requested unless `start` (and optionally `end`) is given.
+    """
+    session = session or http.session()
+
+    frames: Dict[str, pd.DataFrame] = {}
+
+    def fetch(sites: List[str]) -> Dict[str, pd.DataFrame]:
+        return _fetch_batch(session, sites, period, parameters, api_url, start, end, timeout)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='nwis') as executor:
+        for batch in executor.map(fetch, batches(ids, batch_size)):
+            frames.update(batch)
+
+    missing = len(ids) - len(frames)
+    if missing:
+        logging.info(f"No {','.join(parameters)} data for {missing} of {len(ids)} stations")
+
+    return frames
+
+
+def fetch_incremental(ids: Sequence[str], watermarks: WatermarkStore, start: datetime.date, end: datetime.date,
+                      revision_days: int = REVISION_DAYS, **kwargs) -> Dict[str, pd.DataFrame]:
+    """Fetches each site from its watermark (less `revision_days`), or from `start` when it has none.
+
+    Sites that share a start date are fetched together; sites already up to `end` are skipped.
+    """
+    groups: Dict[datetime.date, List[str]] = defaultdict(list)
+    for station_id in ids:
+        if watermarks.missing_range(station_id, start, end) is None:
+            continue
+        watermark = watermarks.get(station_id)
+        site_start = start if watermark is None else max(start, watermark - datetime.timedelta(days=revision_days))
+        groups[site_start].append(station_id)
+
+    frames: Dict[str, pd.DataFrame] = {}
+    for site_start, sites in sorted(groups.items()):
+        logging.info(f"Fetching {len(sites)} stations from {site_start}")
+        frames.update(fetch_daily_values(sites, start=site_start, end=end, **kwargs))
+    return frames
+
+
+def stored_watermarks(stored: Optional[pd.DataFrame], namespace: str = 'nwis') -> WatermarkStore:
+    """In-memory watermarks holding each station's last day in the stored dataset.
+
+    The dataset is the record of what was ingested, so nothing has to survive between runs besides it.
+    """
+    watermarks = WatermarkStore(namespace=namespace)
+    if stored is not None and not stored.empty:
+        station, time = KEY_COLUMNS
+        for station_id, last in pd.to_datetime(stored[time]).groupby(stored[station]).max().items():
+            watermarks.advance(station_id, last.date())
+    return watermarks
+
+
+def merge_values(stored: Optional[pd.DataFrame], fetched: pd.DataFrame,
+                 keys: Sequence[str] = KEY_COLUMNS) -> Tuple[pd.DataFrame, int]:
+    """Folds the new or changed rows of `fetched` into `stored` and returns the result and their count."""
+    keys = list(keys)
+    if stored is None or stored.empty:
+        return fetched.sort_values(keys, ignore_index=True), len(fetched)
+
+    previous = fetched[keys].merge(stored, on=keys, how='left', indicator=True)
+    changed = (previous['_merge'] == 'left_only').to_numpy()
+    for column in fetched.columns.difference(keys):
+        if column not in stored.columns:
+            changed[:] = True
+            break
+        old, new = previous[column].to_numpy(), fetched[column].to_numpy()
+        changed |= ~((old == new) | (pd.isna(old) & pd.isna(new)))
+
+    updates = fetched[changed]
+    merged = pd.concat([stored, updates], ignore_index=True).drop_duplicates(keys, keep='last')
+    return merged.sort_values(keys, ignore_index=True), len(updates)
@@ -0,0 +1,226 @@
+''' Serialization and storage for collector output.
+Frames are written as CSV or as typed, compressed Parquet. LocalBucket implements the part of the
+google.cloud.storage Bucket API the collectors use on top of a local directory, so output can be written
+and read back without GCS.
+
+get_bucket hands out one bucket handle per process, so the storage client is authenticated once per
+run instead of once per blob. Setting AVALANCHE_LOCAL_BUCKETS makes it return LocalBuckets under that
+directory, for offline runs. Uploader writes frames from a thread pool and blocks the producer once
+`max_pending` uploads are queued or running.
+
+OUTPUT_FORMAT, the format every collector writes, comes from the environment variable of the same name
+and is checked on import, so a bad value stops a job before it fetches anything. '''
+
+import base64
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+FORMATS = ('csv', 'parquet')
+
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+
+CONTENT_TYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Directory holding local stand-ins for the GCS buckets, when set
+LOCAL_BUCKETS = os.environ.get('AVALANCHE_LOCAL_BUCKETS')
+
+UPLOAD_WORKERS = 8
+MAX_PENDING_UPLOADS = 32
+
+_clients: Dict[Optional[str], Any] = {}
+_buckets: Dict[Tuple[Optional[str], str, Optional[str]], Any] = {}
+_buckets_lock = threading.Lock()
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {FORMATS}")
+
+
+# Format of the files the collectors write, 'csv' or 'parquet'
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'csv')
+_check_format(OUTPUT_FORMAT)
+
+
+def encode_frame(df: pd.DataFrame, fmt: str = 'csv', schema: Optional[Dict[str, str]] = None,
+                 index: bool = False) -> Union[str, bytes]:
+    """Serializes a frame, casting the columns named in `schema` first when writing Parquet."""
+    _check_format(fmt)
+
+    if fmt == 'csv':
+        return df.to_csv(index=index)
+
+    if schema:
+        df = df.astype({column: dtype for column, dtype in schema.items() if column in df.columns})
+
+    buffer = BytesIO()
+    df.to_parquet(buffer, index=index, compression=PARQUET_COMPRESSION)
+    return buffer.getvalue()
+
+
+def decode_frame(contents: Union[str, bytes], fmt: str = 'csv') -> pd.DataFrame:
+    _check_format(fmt)
+
+    if isinstance(contents, str):
+        contents = contents.encode('utf-8')
+
+    if fmt == 'csv':
+        return pd.read_csv(BytesIO(contents))
+
+    return pd.read_parquet(BytesIO(contents))
+
+
+def format_of(blob_name: str) -> str:
+    """Infers the output format from a blob name's extension."""
+    for fmt, extension in EXTENSIONS.items():
+        if blob_name.endswith(extension):
+            return fmt
+    raise ValueError(f"Cannot infer the format of {blob_name}")
+
+
+def write_frame(bucket, df: pd.DataFrame, destination_stem: str, fmt: str = 'csv',
+                schema: Optional[Dict[str, str]] = None, index: bool = False) -> str:
+    """Uploads `df` to `destination_stem` plus the format's extension and returns the blob name."""
+    _check_format(fmt)
+
+    destination_blob_name = f'{destination_stem}{EXTENSIONS[fmt]}'
+    contents = encode_frame(df, fmt, schema=schema, index=index)
+
+    bucket.blob(destination_blob_name).upload_from_string(contents, content_type=CONTENT_TYPES[fmt])
+
+    return destination_blob_name
+
+
+class LocalBlob:
+
+    def __init__(self, bucket: 'LocalBucket', name: str) -> None:
+        self.bucket = bucket
+        self.name = name
+        self.path = bucket.root / name
+
+    def upload_from_string(self, data: Union[str, bytes], content_type: Optional[str] = None) -> None:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial object
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.path)
+
+    def download_as_bytes(self) -> bytes:
+        return self.path.read_bytes()
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    @property
+    def generation(self) -> Optional[int]:
+        """Changes whenever the object is rewritten, like a GCS object generation."""
+        return self.path.stat().st_mtime_ns if self.exists() else None
+
+    @property
+    def md5_hash(self) -> Optional[str]:
+        """Base64-encoded MD5 of the contents, as GCS reports it."""
+        if not self.exists():
+            return None
+        return base64.b64encode(hashlib.md5(self.path.read_bytes()).digest()).decode('ascii')
+
+
+class LocalBucket:
+    """Filesystem stand-in for a GCS bucket rooted at `root`."""
+
+    def __init__(self, root: Union[str, Path]) -> None:
+        self.root = Path(root)
+        self.name = self.root.name
+
+    def blob(self, blob_name: str) -> LocalBlob:
+        return LocalBlob(self, blob_name)
+
+    def list_blobs(self, prefix: str = '') -> Iterator[LocalBlob]:
+        for path in sorted(self.root.rglob('*')):
+            name = path.relative_to(self.root).as_posix()
+            if path.is_file() and not path.name.startswith('.') and name.startswith(prefix):
+                yield LocalBlob(self, name)
+
+
+def get_bucket(name: str, project: Optional[str] = None, local_root: Optional[Union[str, Path]] = None):
+    """Returns this process's handle of bucket `name`, creating the storage client on first use."""
+    root = local_root or LOCAL_BUCKETS
+    key = (project, name, str(root) if root else None)
+
+    with _buckets_lock:
+        if key not in _buckets:
+            if root:
+                _buckets[key] = LocalBucket(Path(root) / name)
+            else:
+                if project not in _clients:
+                    from google.cloud import storage
+                    _clients[project] = storage.Client(project=project)
+                _buckets[key] = _clients[project].bucket(name)
+        return _buckets[key]
+
+
+class Uploader:
+    """Uploads frames to one bucket in parallel, with at most `max_pending` uploads in flight."""
+
+    def __init__(self, bucket, fmt: str = 'csv', workers: int = UPLOAD_WORKERS,
+                 max_pending: int = MAX_PENDING_UPLOADS) -> None:
+        _check_format(fmt)
+        self.bucket = bucket
+        self.fmt = fmt
+        self.failed: List[Tuple[str, BaseException]] = []
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._uploads: List[Tuple[str, Future]] = []
+
+    def _release(self, future: Future) -> None:
+        self._slots.release()
+
+    def submit(self, df: pd.DataFrame, destination_stem: str, schema: Optional[Dict[str, str]] = None,
+               index: bool = False) -> Future:
+        """Queues an upload, waiting for a free slot when `max_pending` uploads are already in flight."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(write_frame, self.bucket, df, destination_stem, self.fmt, schema, index)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release)
+        self._uploads.append((destination_stem, future))
+        return future
+
+    def close(self) -> List[str]:
+        """Waits for every upload and returns the names of the blobs written; failures are logged and kept."""
+        wait([future for _, future in self._uploads])
+        self._executor.shutdown(wait=True)
+
+        names = []
+        for destination_stem, future in self._uploads:
+            if future.exception() is not None:
+                logging.error(f"Error uploading {destination_stem} to {self.bucket.name}: {future.exception()}")
+                self.failed.append((destination_stem, future.exception()))
+            else:
+                names.append(future.result())
+
+        logging.info(f"Uploaded {len(names)} blobs to {self.bucket.name}, {len(self.failed)} failed")
+        self._uploads = []
+        return names
+
+    def __enter__(self) -> 'Uploader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
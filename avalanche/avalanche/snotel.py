@@ -0,0 +1,230 @@
+''' Column names, types and element groups for the SNOTEL daily station reports, and a client for the
+reportGenerator CSV endpoint. '''
+
+import io
+import logging
+
+import pandas as pd
+
+from avalanche import http
+from avalanche.features import new_snow
+
+COLUMN_MAPPING = {
+    'Date': 'date',
+    'Station Name': 'station_name',
+    'Station Id': 'station_id',
+    'State Code': 'state_code',
+    'Network Code': 'network_code',
+    'Elevation (ft)': 'elevation_ft',
+    'Latitude': 'latitude',
+    'Longitude': 'longitude',
+    'County Name': 'county_name',
+    'Snow Water Equivalent (in) Start of Day Values': 'snow_water_equivalent_in',
+    'Snow Water Equivalent % of Median (1991-2020)': 'snow_water_equivalent_median_percentage',
+    'Snow Depth (in) Start of Day Values': 'snow_depth_in',
+    'Air Temperature Maximum (degF)': 'max_temp_degF',
+    'Air Temperature Minimum (degF)': 'min_temp_degF',
+    'Air Temperature Observed (degF) Start of Day Values': 'observed_temp_degF',
+    'Snow Density (pct) Start of Day Values': 'snow_density_percentage'
+}
+
+SCHEMA = {
+    "date": "datetime64[ns]",
+    "station_name": "string",
+    "station_id": "Int64",
+    "state_code": "string",
+    "network_code": "string",
+    "elevation_ft": "Int64",
+    "latitude": "float64",
+    "longitude": "float64",
+    "county_name": "string",
+    "snow_water_equivalent_in": "float64",
+    "snow_water_equivalent_median_percentage": "float64",
+    "snow_depth_in": "float64",
+    "max_temp_degF": "float64",
+    "min_temp_degF": "float64",
+    "observed_temp_degF": "float64",
+    "snow_density_percentage": "float64",
+    "new_snow": "float64"
+}
+
+# Elements requested for each per-variable daily output and the report column prefix they come back under
+DAILY_ELEMENTS = {
+    'swe': ['WTEQ::value', 'WTEQ::qcFlag', 'WTEQ::qaFlag', 'WTEQ::prevValue'],
+    'snow-depth': ['SNWD::value', 'SNWD::qcFlag', 'SNWD::qaFlag', 'SNWD::prevValue'],
+    'air-temp': ['TOBS::value', 'TMIN::value', 'TMAX::value', 'TAVG::value', 'TOBS::qcFlag', 'TOBS::qaFlag'],
+}
+
+DAILY_COLUMN_PREFIXES = {
+    'swe': 'Snow Water Equivalent',
+    'snow-depth': 'Snow Depth',
+    'air-temp': 'Air Temperature',
+}
+
+ID_COLUMNS = ['Date', 'Station Id', 'Station Name']
+
+
+def split_elements(data, prefixes=DAILY_COLUMN_PREFIXES):
+    """Splits a multi-element report into one frame per output, each keeping the date and station columns."""
+    id_columns = [column for column in ID_COLUMNS if column in data.columns]
+
+    outputs = {}
+    for name, prefix in prefixes.items():
+        columns = [column for column in data.columns if column.startswith(prefix)]
+        if columns:
+            outputs[name] = data[id_columns + columns]
+
+    return outputs
+
+
+REPORT_URL = ('https://wcc.sc.egov.usda.gov/reportGenerator/{view}/customSingleStationReport/daily/start_of_period/'
+              '{station_id}:{state}:SNTL%7Cid=%22%22%7Cname/{start},{end}/{elements}?fitToScreen=false')
+
+# Elements of the full station report loaded into BigQuery
+REPORT_ELEMENTS = ['name', 'stationId', 'state.code', 'network.code', 'elevation', 'latitude', 'longitude',
+                   'county.name', 'WTEQ::value', 'WTEQ::pctOfMedian_1991', 'SNWD::value', 'TMAX::value',
+                   'TMIN::value', 'TOBS::value', 'SNDN::value']
+
+# Parse types of the report columns we know, keyed by the report's own headers
+REPORT_DTYPES = {column: SCHEMA[name] for column, name in COLUMN_MAPPING.items() if name != 'date'}
+
+
+def report_url(station_id, state, start, end, elements, view='view_csv'):
+    """Builds a reportGenerator URL; `start` and `end` are dates or day offsets such as -1 and 0."""
+    return REPORT_URL.format(view=view, station_id=station_id, state=state, start=start, end=end,
+                             elements=','.join(elements))
+
+
+class _DataLines(io.RawIOBase):
+    """Read-only file over an iterator of report lines that drops the '#' comment header and blank lines."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self._buffer) < len(target):
+            line = next(self._lines, None)
+            if line is None:
+                break
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if line.strip() and not line.startswith('#'):
+                self._buffer += line.rstrip('\r\n').encode('utf-8') + b'\n'
+
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class ReportError(ValueError):
+    """A response body that is not a station report, such as an HTML error page served with status 200."""
+
+
+def header_end(text):
+    """Offset of the first line of a whole report that is neither a comment nor blank."""
+    position = 0
+    while position < len(text):
+        end = text.find(b'\n', position)
+        end = len(text) if end == -1 else end + 1
+        line = text[position:end]
+        if line.strip() and not line.startswith(b'#'):
+            break
+        position = end
+    return position
+
+
+def parse_report(lines, dtypes=REPORT_DTYPES):
+    """Parses reportGenerator CSV lines into a frame, typing the known columns while reading.
+
+    A whole report body (bytes or str) is handed to the parser in one piece after its comment header.
+    Raises ReportError when the body has no Date column or cannot be parsed as a report.
+    """
+    if isinstance(lines, str):
+        lines = lines.encode('utf-8')
+    if isinstance(lines, bytes):
+        reader = io.BytesIO(lines[header_end(lines):])
+    else:
+        reader = io.BufferedReader(_DataLines(lines))
+
+    try:
+        data = pd.read_csv(reader, dtype=dtypes)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+    except (pd.errors.ParserError, ValueError) as e:
+        raise ReportError(f"Cannot parse the station report: {e}") from e
+
+    if 'Date' not in data.columns:
+        raise ReportError(f"Not a station report, columns are {list(data.columns)[:5]}")
+    try:
+        data['Date'] = pd.to_datetime(data['Date'], format='%Y-%m-%d')
+    except ValueError as e:
+        raise ReportError(f"Cannot parse the report dates: {e}") from e
+    return data
+
+
+def to_schema(data, schema=SCHEMA):
+    """Renames a parsed report to the table columns and gives every schema column its type.
+
+    Columns the report lacks are added as typed nulls, so no column goes through object dtype. new_snow is
+    left null here and derived over all stations at once with avalanche.features.new_snow.
+    """
+    data = data.rename(columns=COLUMN_MAPPING)
+
+    dtypes = data.dtypes
+    mismatched = {column: dtype for column, dtype in schema.items()
+                  if column in dtypes.index and dtypes[column] != dtype}
+    if mismatched:
+        data = data.astype(mismatched)
+
+    for column, dtype in schema.items():
+        if column not in dtypes.index:
+            data[column] = pd.Series(index=data.index, dtype=dtype)
+
+    return data
+
+
+def skip_report(position, error):
+    """Logs a report body that is left out of a combined frame, by its position among the bodies."""
+    logging.warning(f"Skipping station report {position}: {error}")
+
+
+def combine_reports(bodies):
+    """Parses station report bodies into one frame indexed by (station, row), with new_snow derived across them.
+
+    Reports without rows are dropped, and bodies that are not reports are logged and dropped; each
+    remaining station's first row is its earliest day.
+    """
+    frames = []
+    for position, body in enumerate(bodies):
+        try:
+            frame = to_schema(parse_report(body))
+        except ReportError as e:
+            skip_report(position, e)
+            continue
+        if len(frame) > 0:
+            frames.append(frame)
+    if not frames:
+        return to_schema(pd.DataFrame())
+
+    data = pd.concat(frames, keys=range(len(frames)), names=['station', 'row'])
+    data['new_snow'] = new_snow(data)
+    return data
+
+
+def fetch_report(url, session=None, timeout=60):
+    """Downloads a station report from the CSV endpoint and parses it as it streams in.
+
+    A body that is not a report is logged and read as a report without rows.
+    """
+    with (session or http.session()).get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        try:
+            return parse_report(response.iter_lines())
+        except ReportError as e:
+            logging.warning(f"Skipping {url}: {e}")
+            return pd.DataFrame()
@@ -0,0 +1,164 @@
+''' Polars engine for the SNOTEL station reports.
+Produces the same frame as avalanche.snotel.combine_reports. Each report is read with its known columns
+typed, and reports that share a header are parsed together. The rename, cast and new_snow steps then run
+as lazy queries over every station at once, and the result is converted to pandas once for the write
+stages. '''
+
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+
+from avalanche.snotel import COLUMN_MAPPING, SCHEMA, ReportError, header_end, skip_report, to_schema
+
+POLARS_TYPES = {
+    'datetime64[ns]': pl.Datetime('ns'),
+    'string': pl.String,
+    'Int64': pl.Int64,
+    'float64': pl.Float64,
+}
+
+# Report columns typed while reading; dates are read as text and parsed right after
+READ_TYPES = {column: POLARS_TYPES[SCHEMA[name]] for column, name in COLUMN_MAPPING.items() if name != 'date'}
+READ_TYPES['Date'] = pl.String
+
+# Arrow types that map to the pandas nullable dtypes the pandas engine produces
+PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.string(): pd.StringDtype(),
+    pa.large_string(): pd.StringDtype(),
+}
+
+
+def _split_report(body: bytes) -> Tuple[bytes, bytes, int]:
+    """The header line of a report body, its data lines and their number, without blank lines."""
+    header, _, rest = body[header_end(body):].partition(b'\n')
+    rest = rest.replace(b'\r\n', b'\n')
+    if not rest.strip():
+        return header.rstrip(b'\r'), b'', 0
+    if b'\n\n' in rest or rest.startswith(b'\n'):
+        rest = b'\n'.join(line for line in rest.splitlines() if line.strip())
+    if rest and not rest.endswith(b'\n'):
+        rest += b'\n'
+    return header.rstrip(b'\r'), rest, rest.count(b'\n')
+
+
+def _read_group(header: bytes, chunks: List[bytes]) -> pl.DataFrame:
+    """Reads the data lines of reports that share `header`, with their known columns and dates typed."""
+    columns = header.decode('utf-8').split(',')
+    frame = pl.read_csv(b''.join([header + b'\n', *chunks]),
+                        schema_overrides={column: READ_TYPES[column] for column in columns if column in READ_TYPES})
+    return frame.with_columns(pl.col('Date').str.to_datetime('%Y-%m-%d', time_unit='ns'))
+
+
+def read_reports(bodies: Iterable[bytes]) -> Tuple[pl.LazyFrame, List[List[str]]]:
+    """Reads report bodies with one CSV parse per distinct header, adding `station` and `row` columns.
+
+    Returns the rows and the header of each station that has any rows; stations are numbered in that order.
+    Bodies that are not reports are logged and left out, as snotel.combine_reports does.
+    """
+    groups: Dict[bytes, Tuple[List[bytes], List[int], List[int]]] = {}
+    headers: List[List[str]] = []
+    positions: List[int] = []
+    for position, body in enumerate(bodies):
+        header, rows, count = _split_report(body)
+        if not header.strip():
+            continue
+        columns = header.decode('utf-8', errors='replace').split(',')
+        if 'Date' not in columns:
+            skip_report(position, ReportError(f"Not a station report, columns are {columns[:5]}"))
+            continue
+        if not count:
+            continue
+
+        chunks, stations, counts = groups.setdefault(header, ([], [], []))
+        chunks.append(rows)
+        stations.append(len(headers))
+        counts.append(count)
+        headers.append(columns)
+        positions.append(position)
+
+    parts = []
+    for header, (chunks, stations, counts) in groups.items():
+        try:
+            parts.append((_read_group(header, chunks), stations, counts))
+        except pl.exceptions.PolarsError:
+            # One malformed report fails its whole group; read the group's reports one by one to find it
+            for rows, station, count in zip(chunks, stations, counts):
+                try:
+                    parts.append((_read_group(header, [rows]), [station], [count]))
+                except pl.exceptions.PolarsError as e:
+                    skip_report(positions[station], ReportError(f"Cannot parse the station report: {e}"))
+
+    # Number the stations that were read consecutively, like the pandas engine
+    read = np.zeros(len(headers), dtype=bool)
+    for _, stations, _ in parts:
+        read[stations] = True
+    numbers = np.cumsum(read) - 1
+
+    frames = []
+    for frame, stations, counts in parts:
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        frames.append(frame.lazy().with_columns(
+            pl.Series('station', np.repeat(numbers[stations], counts), dtype=pl.Int64),
+            pl.Series('row', np.arange(len(starts)) - starts, dtype=pl.Int64)))
+
+    headers = [columns for columns, ok in zip(headers, read) if ok]
+    return (pl.concat(frames, how='diagonal') if frames else pl.LazyFrame()), headers
+
+
+def _pandas_columns(headers: List[List[str]]) -> List[str]:
+    """Column order of the pandas engine: each station's renamed columns then its missing schema columns."""
+    columns: Dict[str, None] = {}
+    for header in headers:
+        renamed = [COLUMN_MAPPING.get(column, column) for column in header]
+        columns.update(dict.fromkeys(renamed))
+        columns.update(dict.fromkeys(column for column in SCHEMA if column not in renamed))
+    return list(columns)
+
+
+def combine_reports(bodies: Iterable[bytes]) -> pd.DataFrame:
+    """Parses station report bodies into one frame indexed by (station, row), like snotel.combine_reports."""
+    stations, headers = read_reports(bodies)
+    if not headers:
+        return to_schema(pd.DataFrame())
+
+    present = stations.collect_schema().names()
+    renamed = {COLUMN_MAPPING.get(column, column) for column in present}
+    typed = (
+        stations
+        .rename({column: name for column, name in COLUMN_MAPPING.items() if column in present})
+        .with_columns(pl.lit(None, POLARS_TYPES[dtype]).alias(column) for column, dtype in SCHEMA.items()
+                      if column not in renamed)
+        .with_columns(pl.col(column).cast(POLARS_TYPES[dtype]) for column, dtype in SCHEMA.items())
+        .collect()
+    )
+
+    # new_snow compares each day with the same station's previous calendar day, as features.new_snow does.
+    # Only the key and depth columns go through the join, and the result is added to the typed frame.
+    depths = typed.lazy().select('station_id', pl.col('date').dt.truncate('1d').alias('_day'), 'snow_depth_in')
+    previous = (
+        depths
+        .select('station_id', pl.col('_day').dt.offset_by('1d'), pl.col('snow_depth_in').alias('_previous_depth'))
+        .unique(subset=['station_id', '_day'], keep='first', maintain_order=True)
+    )
+    change = pl.col('snow_depth_in') - pl.col('_previous_depth')
+    snow = (
+        depths
+        .join(previous, on=['station_id', '_day'], how='left', maintain_order='left')
+        .select(pl.when(change < 0).then(0.0).otherwise(change).alias('new_snow'))
+        .collect()
+    )
+    combined = typed.with_columns(snow['new_snow'])
+
+    # Reports with different headers were read separately; put the stations back in order
+    if len(set(map(tuple, headers))) > 1:
+        combined = combined.sort(['station', 'row'])
+
+    index = pd.MultiIndex.from_arrays([combined['station'].to_numpy(), combined['row'].to_numpy()],
+                                      names=['station', 'row'])
+    data = combined.select(_pandas_columns(headers)).to_arrow().to_pandas(types_mapper=PANDAS_TYPES.get)
+    data.index = index
+    return data
@@ -0,0 +1,105 @@
+''' Spatial index over the station registry for nearest-station and region lookups.
+Stations are stored once as unit vectors on the sphere. The k nearest stations to a point are then the k
+largest dot products, found with one matrix product and an argpartition; only those k get a haversine
+distance. Polygon queries (forecast zones, CAIC areas, any GeoJSON geometry) go through a shapely STRtree
+of the station points. The index is built on first use and cached per registry URL, like load_stations.
+
+Queries return station ids (with distances or region keys) rather than registry rows, which keeps each
+lookup well under a millisecond; join the result to the registry on `station_id` for the other columns. '''
+
+from typing import Any, Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+from avalanche.geo import haversine
+from avalanche.stations import YEARCOUNT_URL, load_stations
+
+_indexes: Dict[str, 'StationIndex'] = {}
+
+
+def _unit_vectors(latitudes, longitudes) -> np.ndarray:
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _geometry(region: Any):
+    """A shapely geometry from a geometry or a GeoJSON-like mapping."""
+    return region if isinstance(region, shapely.Geometry) else shape(region)
+
+
+class StationIndex:
+    """Stations with coordinates, indexed for k-nearest and polygon queries."""
+
+    def __init__(self, stations: pd.DataFrame, key: str = 'station_id', latitude: str = 'latitude',
+                 longitude: str = 'longitude') -> None:
+        self.source = stations
+        located = stations[latitude].notna() & stations[longitude].notna()
+        self.stations = stations[located].reset_index(drop=True)
+        self.ids = pd.Index(self.stations[key], name=key)
+        self.latitudes = self.stations[latitude].to_numpy(dtype=float)
+        self.longitudes = self.stations[longitude].to_numpy(dtype=float)
+        self.vectors = _unit_vectors(self.latitudes, self.longitudes)
+        self.tree = shapely.STRtree(shapely.points(self.longitudes, self.latitudes))
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5,
+                max_miles: Optional[float] = None) -> pd.Series:
+        """Distance in miles to the `k` stations closest to a point, indexed by station id, nearest first."""
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        k = min(k, len(self))
+        if not k:
+            return pd.Series(index=self.ids[:0], dtype=float, name='distance_miles')
+
+        # Largest dot product is the smallest great-circle angle
+        similarity = self.vectors @ _unit_vectors(latitude, longitude)
+        closest = np.argpartition(-similarity, k - 1)[:k]
+        closest = closest[np.argsort(-similarity[closest], kind='stable')]
+
+        miles = haversine(latitude, longitude, self.latitudes[closest], self.longitudes[closest])
+        if max_miles is not None:
+            closest, miles = closest[miles <= max_miles], miles[miles <= max_miles]
+
+        return pd.Series(miles, index=self.ids.take(closest), name='distance_miles')
+
+    def within(self, region: Any) -> pd.Index:
+        """Ids of the stations inside a polygon, given as a shapely geometry or a GeoJSON-like mapping."""
+        positions = self.tree.query(_geometry(region), predicate='intersects')
+        return self.ids.take(np.sort(positions))
+
+    def assign_regions(self, regions: Mapping[Any, Any]) -> pd.Series:
+        """The key of the region each station falls in, indexed by station id; NA outside them all.
+
+        `regions` maps a key such as a CAIC `areaId` to its polygon. All regions are queried in one pass;
+        a station on a shared border takes the first region listed.
+        """
+        keys = list(regions)
+        if not keys:
+            return pd.Series(pd.NA, index=self.ids, dtype=object, name='region')
+
+        geometries = [_geometry(region) for region in regions.values()]
+        region_positions, station_positions = self.tree.query(geometries, predicate='intersects')
+
+        assigned = np.full(len(self), -1)
+        # Reversed so the first listed region is written last and wins
+        order = np.argsort(region_positions, kind='stable')[::-1]
+        assigned[station_positions[order]] = region_positions[order]
+
+        labels = np.empty(len(keys) + 1, dtype=object)
+        labels[:-1], labels[-1] = keys, pd.NA
+        return pd.Series(labels[assigned], index=self.ids, name='region')
+
+
+def station_index(url: str = YEARCOUNT_URL, refresh: bool = False) -> StationIndex:
+    """The index over the station registry at `url`, rebuilt only when the registry itself is reloaded."""
+    stations = load_stations(url, refresh=refresh)
+    index = _indexes.get(url)
+    if index is None or index.source is not stations:
+        index = _indexes[url] = StationIndex(stations)
+    return index
@@ -0,0 +1,130 @@
+''' Registry of SNOTEL stations built from the NWCC yearcount inventory.
+The inventory page is scraped once and kept on disk as a small typed Parquet table. Cached copies are
+reused until they are older than the TTL and are then revalidated with the page's ETag/Last-Modified,
+so collectors normally load the station list in milliseconds instead of re-parsing the HTML. '''
+
+import json
+import logging
+import time
+from io import StringIO
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import pandas as pd
+import requests
+
+from avalanche import http
+
+YEARCOUNT_URL = 'https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist'
+
+CACHE_TTL = 7 * 24 * 3600
+
+SCHEMA = {
+    'station_id': 'Int64',
+    'name': 'string',
+    'state': 'string',
+    'network': 'string',
+    'county': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'elevation_ft': 'Int64',
+    'start_date': 'datetime64[ns]',
+}
+
+_loaded: Dict[str, pd.DataFrame] = {}
+
+
+def parse_yearcount(html: str) -> pd.DataFrame:
+    """Parses the yearcount inventory page into the registry table."""
+    table = next(t for t in pd.read_html(StringIO(html)) if 'site_name' in t.columns)
+
+    site_name = table['site_name'].astype(str)
+
+    stations = pd.DataFrame({
+        'station_id': site_name.str.extract(r'\((\d+)\)\s*$', expand=False),
+        'name': site_name.str.replace(r'\s*\(\d+\)\s*$', '', regex=True),
+        'state': table['state'],
+        'network': table.get('ntwk', 'SNTL'),
+        'county': table.get('county'),
+        'latitude': table['lat'],
+        'longitude': table['lon'],
+        'elevation_ft': pd.to_numeric(table['elev'], errors='coerce').round(),
+        'start_date': pd.to_datetime(table['start'], format='%Y-%B', errors='coerce'),
+    })
+
+    stations = stations.dropna(subset=['station_id']).astype(SCHEMA)
+    return stations.sort_values('station_id', ignore_index=True)
+
+
+def _cache_paths(cache_dir: Path):
+    return cache_dir / 'stations.parquet', cache_dir / 'stations.json'
+
+
+def _fetch(url: str, metadata: Dict[str, str]) -> Optional[requests.Response]:
+    """Downloads the inventory page, or returns None when the cached copy is still current."""
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+
+    # The registry keeps its own copy, so the HTTP cache only saves the body for a 304
+    response = http.session().get(url, headers=headers, timeout=60, ttl=0)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    return response
+
+
+def load_stations(url: str = YEARCOUNT_URL, cache_dir: Optional[Union[str, Path]] = None,
+                  ttl: float = CACHE_TTL, refresh: bool = False) -> pd.DataFrame:
+    """Returns the station registry, from memory or disk when fresh enough, otherwise from NWCC.
+
+    The disk copy is kept in `cache_dir`, by default the HTTP cache directory (http.CACHE_DIR).
+    """
+    if url in _loaded and not refresh:
+        return _loaded[url]
+
+    table_path, metadata_path = _cache_paths(Path(cache_dir or http.CACHE_DIR))
+    metadata = json.loads(metadata_path.read_text()) if metadata_path.exists() else {}
+    cached = table_path.exists() and metadata.get('url') == url
+
+    if cached and not refresh and time.time() - metadata.get('fetched_at', 0) < ttl:
+        stations = pd.read_parquet(table_path)
+    else:
+        try:
+            response = _fetch(url, metadata if cached else {})
+        except requests.RequestException as e:
+            if not cached:
+                raise
+            logging.warning(f"Could not refresh the station registry, using the cached copy: {e}")
+            response = None
+
+        if response is None:
+            stations = pd.read_parquet(table_path)
+        else:
+            stations = parse_yearcount(response.text)
+            metadata = {'url': url, 'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')}
+
+        metadata['fetched_at'] = time.time()
+        try:
+            if response is not None:
+                table_path.parent.mkdir(parents=True, exist_ok=True)
+                stations.to_parquet(table_path, index=False)
+                logging.info(f"Cached {len(stations)} stations in {table_path}")
+            metadata_path.write_text(json.dumps(metadata))
+        except OSError as e:
+            # Read-only filesystems such as Cloud Functions still get the registry, kept in memory only
+            logging.warning(f"Cannot cache the station registry in {table_path.parent}: {e}")
+
+    _loaded[url] = stations
+    return stations
+
+
+def by_state(stations: pd.DataFrame, *states: str) -> pd.DataFrame:
+    return stations[stations['state'].isin(states)]
+
+
+def in_bbox(stations: pd.DataFrame, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> pd.DataFrame:
+    return stations[stations['latitude'].between(min_lat, max_lat) & stations['longitude'].between(min_lon, max_lon)]
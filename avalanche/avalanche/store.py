@@ -0,0 +1,189 @@
+''' Local columnar store of station observations (SNOTEL, streamflow and buoys).
+Each dataset is a directory of Hive-partitioned Parquet files, `{dataset}/month=YYYY-MM/part-{n}.parquet`.
+Rows in every file are sorted by (station_id, time) and written in small row groups. A query prunes
+partitions by month and skips row groups by their min/max statistics, so it only reads the stations and
+days it asks for.
+
+A write appends one new part per month it touches and never rewrites older parts. When a month holds
+several parts, reads keep the last written row for each key before applying any other filter, and a
+column added by a later part reads as null in the earlier ones. compact() merges each such month into a
+single sorted part.
+
+Collectors feed the store when AVALANCHE_STORE names its directory (see default_store). '''
+
+import datetime
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+STORE_DIR = os.environ.get('AVALANCHE_STORE')
+
+ROW_GROUP_SIZE = 8192
+COMPRESSION = 'zstd'
+
+
+class Dataset(NamedTuple):
+    station: str
+    time: str
+
+    @property
+    def keys(self) -> List[str]:
+        return [self.station, self.time]
+
+
+DATASETS = {
+    'snotel': Dataset('station_id', 'date'),
+    'streamflow': Dataset('station_id', 'datetime'),
+    'buoy': Dataset('station_id', 'time'),
+}
+
+PARTITION_SCHEMA = pa.schema([('month', pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+DateLike = Union[str, datetime.date, pd.Timestamp]
+
+
+def _months(start: pd.Timestamp, end: pd.Timestamp) -> List[str]:
+    return [str(month) for month in pd.period_range(start, end, freq='M')]
+
+
+def _latest(table: pa.Table, keys: List[str]) -> pa.Table:
+    """The last row of `table` for each key, in their original order."""
+    rows = table.append_column('__row', pa.array(np.arange(table.num_rows)))
+    last = rows.group_by(keys).aggregate([('__row', 'max')]).column('__row_max')
+    return table.take(np.sort(last.to_numpy()))
+
+
+class ObservationStore:
+
+    def __init__(self, root: Union[str, Path]) -> None:
+        self.root = Path(root)
+
+    def _dataset(self, name: str) -> Dataset:
+        if name not in DATASETS:
+            raise ValueError(f"Unknown dataset {name!r}, expected one of {sorted(DATASETS)}")
+        return DATASETS[name]
+
+    def write(self, name: str, data: pd.DataFrame) -> int:
+        """Adds observations to dataset `name`, replacing earlier rows with the same key; returns the row count."""
+        dataset = self._dataset(name)
+        data = data.dropna(subset=dataset.keys)
+        if data.empty:
+            return 0
+
+        times = pd.to_datetime(data[dataset.time])
+        sequence = time.time_ns()
+        for month, rows in data.groupby(times.dt.strftime('%Y-%m'), sort=True):
+            directory = self.root / name / f'month={month}'
+            directory.mkdir(parents=True, exist_ok=True)
+            self._write_part(directory / f'part-{sequence:020d}.parquet', rows, dataset)
+
+        logging.info(f"Stored {len(data)} {name} rows under {self.root / name}")
+        return len(data)
+
+    @staticmethod
+    def _write_part(path: Path, rows: pd.DataFrame, dataset: Dataset) -> None:
+        # Written next to the target and renamed, so readers never see a partial file
+        table = pa.Table.from_pandas(rows.sort_values(dataset.keys, kind='stable'), preserve_index=False)
+        temporary = path.with_suffix('.tmp')
+        pq.write_table(table, temporary, row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION)
+        os.replace(temporary, path)
+
+    def read(self, name: str, stations: Optional[Iterable] = None, start: Optional[DateLike] = None,
+             end: Optional[DateLike] = None, columns: Optional[Sequence[str]] = None,
+             where: Optional[pc.Expression] = None) -> pd.DataFrame:
+        """Returns the observations of `stations` from `start` to `end` (whole days, inclusive).
+
+        `where` is an extra pyarrow filter such as `pc.field('elevation_ft') > 10000`. It is pushed down to
+        the Parquet reader together with the station and date bounds, except in months with several parts,
+        where it is applied to the latest row of each key so a replaced row can never match in its place.
+        """
+        dataset = self._dataset(name)
+        directory = self.root / name
+        if not directory.exists():
+            return pd.DataFrame(columns=list(columns) if columns else dataset.keys)
+
+        paths = sorted(directory.glob('month=*/part-*.parquet'))
+        if not paths:
+            return pd.DataFrame(columns=list(columns) if columns else dataset.keys)
+
+        bounds = pc.scalar(True)
+        first = pd.Timestamp(start).normalize() if start is not None else None
+        last = pd.Timestamp(end).normalize() + pd.Timedelta(days=1) if end is not None else None
+        if first is not None:
+            bounds &= pc.field(dataset.time) >= pa.scalar(first.to_datetime64())
+        if last is not None:
+            bounds &= pc.field(dataset.time) < pa.scalar(last.to_datetime64())
+        if first is not None and last is not None:
+            bounds &= pc.field('month').isin(_months(first, last - pd.Timedelta(days=1)))
+        if stations is not None:
+            bounds &= pc.field(dataset.station).isin(pa.array(list(stations)))
+        expression = bounds & where if where is not None else bounds
+
+        # Parts written later may carry columns the first ones lack
+        schema = pa.unify_schemas([pq.read_schema(path) for path in paths] + [PARTITION_SCHEMA])
+        source = ds.dataset(directory, format='parquet', partitioning=PARTITIONING, schema=schema)
+        names = [column for column in schema.names if column != 'month']
+        wanted = list(columns) if columns else names
+        read_columns = wanted + [key for key in dataset.keys if key not in wanted]
+
+        months: Dict[str, List[ds.Fragment]] = {}
+        for fragment in sorted(source.get_fragments(filter=bounds), key=lambda fragment: fragment.path):
+            months.setdefault(str(Path(fragment.path).parent), []).append(fragment)
+
+        tables = []
+        for fragments in months.values():
+            if len(fragments) == 1:
+                tables.append(fragments[0].to_table(schema=schema, columns=read_columns, filter=expression))
+                continue
+
+            # A month with several parts can hold a key more than once; the latest part wins
+            table = _latest(pa.concat_tables([fragment.to_table(schema=schema, columns=names, filter=bounds)
+                                              for fragment in fragments]), dataset.keys)
+            if where is not None:
+                table = table.filter(where)
+            tables.append(table.select(read_columns))
+        if not tables:
+            return pd.DataFrame(columns=wanted)
+
+        data = pa.concat_tables(tables).to_pandas()
+        return data.sort_values(dataset.keys, ignore_index=True)[wanted]
+
+    def compact(self, name: str) -> int:
+        """Merges every month of dataset `name` that has several parts into one; returns the months merged."""
+        dataset = self._dataset(name)
+        merged = 0
+        for directory in sorted((self.root / name).glob('month=*')):
+            parts = sorted(directory.glob('part-*.parquet'))
+            if len(parts) < 2:
+                continue
+
+            rows = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+            rows = rows.drop_duplicates(dataset.keys, keep='last')
+            self._write_part(parts[-1], rows, dataset)
+            for part in parts[:-1]:
+                part.unlink()
+            merged += 1
+
+        logging.info(f"Compacted {merged} months of {name}")
+        return merged
+
+    def months(self, name: str) -> Dict[str, int]:
+        """Number of parts in each month of dataset `name`."""
+        self._dataset(name)
+        return {directory.name.split('=', 1)[1]: len(list(directory.glob('part-*.parquet')))
+                for directory in sorted((self.root / name).glob('month=*'))}
+
+
+def default_store() -> Optional[ObservationStore]:
+    """The store named by AVALANCHE_STORE, or None when collectors should not keep a local copy."""
+    return ObservationStore(STORE_DIR) if STORE_DIR else None
@@ -0,0 +1,160 @@
+''' Writers for the SNOTEL observation table.
+A writer applies a whole batch of rows at once: new rows go out as one load job and corrected rows are
+loaded into a staging table and applied with a single MERGE into the target table. The SQLite writer does
+the same against a local database so the pipeline can be exercised offline. '''
+
+import logging
+import sqlite3
+from typing import List, Optional
+
+import pandas as pd
+
+KEY_COLUMNS = ['station_id', 'date']
+
+UPDATE_COLUMNS = [
+    'snow_water_equivalent_in',
+    'snow_water_equivalent_median_percentage',
+    'snow_depth_in',
+    'max_temp_degF',
+    'min_temp_degF',
+    'observed_temp_degF',
+    'snow_density_percentage',
+]
+
+
+def merge_statement(target: str, staging: str, columns: List[str]) -> str:
+    """Builds a MERGE that updates the matching (station_id, date) rows; staged rows with no match are ignored."""
+    on = ' AND '.join(f'T.{c} = S.{c}' for c in KEY_COLUMNS)
+    updates = ',\n            '.join(f'{c} = S.{c}' for c in UPDATE_COLUMNS if c in columns)
+
+    return f"""
+        MERGE `{target}` T
+        USING `{staging}` S
+        ON {on}
+        WHEN MATCHED THEN UPDATE SET
+            {updates}
+    """
+
+
+def latest_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """The last row staged for each (station_id, date); a MERGE fails when a target row matches several."""
+    return df.drop_duplicates(subset=KEY_COLUMNS, keep='last')
+
+
+class SnotelWriter:
+    """Interface for the stores the SNOTEL pipeline writes to."""
+
+    def append(self, df: pd.DataFrame) -> int:
+        """Appends new rows and returns the number of rows written."""
+        raise NotImplementedError
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        """Applies corrected rows to the existing (station_id, date) rows and returns the number updated."""
+        raise NotImplementedError
+
+
+class BigQueryWriter(SnotelWriter):
+
+    def __init__(self, client, project_id: str, dataset_id: str, table_id: str) -> None:
+        self.client = client
+        self.table = f'{project_id}.{dataset_id}.{table_id}'
+        self.staging_table = f'{project_id}.{dataset_id}.{table_id}_staging'
+
+    def append(self, df: pd.DataFrame) -> int:
+        from google.cloud import bigquery
+
+        if df.empty:
+            return 0
+
+        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+        job = self.client.load_table_from_dataframe(df, self.table, job_config=job_config)
+        job.result()
+
+        logging.info(f"Load job {job.job_id} {job.state}: {job.output_rows} rows appended to {self.table}")
+
+        return job.output_rows
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        from google.cloud import bigquery
+
+        if df.empty:
+            return 0
+
+        df = latest_rows(df.assign(date=pd.to_datetime(df['date']).dt.date))
+
+        logging.info(f"Staging {len(df)} rows in {self.staging_table}")
+
+        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        self.client.load_table_from_dataframe(df, self.staging_table, job_config=job_config).result()
+
+        logging.info(f"Merging {self.staging_table} into {self.table}")
+
+        query_job = self.client.query(merge_statement(self.table, self.staging_table, list(df.columns)))
+        query_job.result()
+
+        return query_job.num_dml_affected_rows or 0
+
+
+class SQLiteWriter(SnotelWriter):
+    """Local stand-in for BigQueryWriter backed by a SQLite database."""
+
+    def __init__(self, connection: sqlite3.Connection, table_id: str = 'snotel') -> None:
+        self.connection = connection
+        self.table = table_id
+        self.staging_table = f'{table_id}_staging'
+
+    def append(self, df: pd.DataFrame) -> int:
+        if df.empty:
+            return 0
+
+        df = df.assign(date=pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d'))
+
+        with self.connection:
+            df.to_sql(self.table, self.connection, if_exists='append', index=False)
+
+        return len(df)
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        if df.empty:
+            return 0
+
+        df = latest_rows(df.assign(date=pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')))
+        on = ' AND '.join(f'{self.table}.{c} = S.{c}' for c in KEY_COLUMNS)
+        updates = ', '.join(f'{c} = S.{c}' for c in UPDATE_COLUMNS if c in df.columns)
+
+        with self.connection:
+            df.to_sql(self.staging_table, self.connection, if_exists='replace', index=False)
+
+            updated = self.connection.execute(f"""
+                UPDATE {self.table} SET {updates}
+                FROM {self.staging_table} S
+                WHERE {on}
+            """).rowcount
+
+        return updated
+
+
+class BatchAppender:
+    """Collects per-station frames and appends them with one load job per flush, or one per `chunk_rows` rows."""
+
+    def __init__(self, writer: SnotelWriter, chunk_rows: Optional[int] = None) -> None:
+        self.writer = writer
+        self.chunk_rows = chunk_rows
+        self.frames: List[pd.DataFrame] = []
+
+    def add(self, df: pd.DataFrame) -> None:
+        self.frames.append(df)
+
+    def flush(self) -> int:
+        if not self.frames:
+            return 0
+
+        df = pd.concat(self.frames, ignore_index=True)
+        self.frames = []
+
+        chunk_rows = self.chunk_rows or len(df)
+        written = 0
+        for start in range(0, len(df), chunk_rows):
+            written += self.writer.append(df.iloc[start:start + chunk_rows])
+
+        return written
@@ -0,0 +1,61 @@
+''' Per-station high-water marks for incremental collection.
+A watermark is the last date that has been ingested for a key (usually a station ID). Marks are kept in
+a small SQLite database so a rerun after a partial failure only fetches what is missing. '''
+
+import datetime
+import sqlite3
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+class WatermarkStore:
+
+    def __init__(self, path: Union[str, Path] = ':memory:', namespace: str = 'default') -> None:
+        self.path = str(path)
+        self.namespace = namespace
+        self.connection = sqlite3.connect(self.path)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    watermark TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+
+    def get(self, key: str) -> Optional[datetime.date]:
+        row = self.connection.execute(
+            'SELECT watermark FROM watermarks WHERE namespace = ? AND key = ?', (self.namespace, str(key))).fetchone()
+        return datetime.date.fromisoformat(row[0]) if row else None
+
+    def advance(self, key: str, watermark: datetime.date) -> datetime.date:
+        """Moves the mark for `key` forward to `watermark`; marks never move backwards."""
+        with self.connection:
+            self.connection.execute("""
+                INSERT INTO watermarks (namespace, key, watermark, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET
+                    watermark = MAX(watermark, excluded.watermark),
+                    updated_at = excluded.updated_at
+            """, (self.namespace, str(key), watermark.isoformat(), datetime.datetime.now().isoformat()))
+        return self.get(key)
+
+    def missing_range(self, key: str, start: datetime.date,
+                      end: datetime.date) -> Optional[Tuple[datetime.date, datetime.date]]:
+        """Returns the (start, end) dates still to fetch for `key`, or None when it is up to date."""
+        watermark = self.get(key)
+        if watermark is not None:
+            start = max(start, watermark + datetime.timedelta(days=1))
+        return (start, end) if start <= end else None
+
+    def reset(self, key: str) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM watermarks WHERE namespace = ? AND key = ?', (self.namespace, str(key)))
+
+    def all(self) -> Dict[str, datetime.date]:
+        rows = self.connection.execute('SELECT key, watermark FROM watermarks WHERE namespace = ?', (self.namespace,))
+        return {key: datetime.date.fromisoformat(watermark) for key, watermark in rows}
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,57 @@
+''' Compares the per-buoy geopy loop that bouy_data.py used with the vectorized avalanche.geo filter.
+Buoy positions are drawn at random over the North Pacific, about as many as the NDBC latest_obs file
+lists. The script also reports how far the vectorized distances are from geopy's.
+
+    python -m benchmarks.bench_buoy_filter [--buoys 900] [--repeat 5] '''
+
+import argparse
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+from avalanche.geo import BUOY_REGIONS, distances, within_regions
+
+
+def geodesic_loop(lats, lons):
+    keep = []
+    for lat, lon in zip(lats, lons):
+        keep.append(any(geodesic((region.latitude, region.longitude), (lat, lon)).miles <= region.radius_miles
+                        for region in BUOY_REGIONS))
+    return np.array(keep)
+
+
+def measure(label, filter_buoys, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = filter_buoys()
+        timings.append(time.perf_counter() - start)
+
+    print(f'{label:<24} {min(timings) * 1000:9.2f} ms  ({result.sum()} buoys kept)')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--buoys', type=int, default=900)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(0, 70, args.buoys), rng.uniform(-180, -110, args.buoys)
+
+    expected = measure('geopy geodesic loop', lambda: geodesic_loop(lats, lons), args.repeat)
+    for method in ('vincenty', 'haversine'):
+        kept = measure(f'within_regions {method}', lambda: within_regions(lats, lons, method=method), args.repeat)
+        print(f'{"":<24} {(kept != expected).sum()} buoys classified differently from geopy')
+
+    reference = np.array([[geodesic((r.latitude, r.longitude), (lat, lon)).miles for r in BUOY_REGIONS]
+                          for lat, lon in zip(lats, lons)])
+    for method in ('vincenty', 'haversine'):
+        error = np.abs(distances(lats, lons, BUOY_REGIONS, method) - reference).max()
+        print(f'max |{method} - geodesic| = {error:.3g} miles')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+''' Compares the per-record json_normalize/concat build of the CAIC forecasts that caic_avy_forecast.py
+used with the streaming decoder in avalanche.caic.
+A synthetic `/products/all` response is generated with the requested number of products, half of them
+avalanche forecasts with three problems each. The legacy path parses the whole body with json.loads; the
+streaming path reads it in 64 KiB chunks, as it would arrive from the network.
+
+    python -m benchmarks.bench_caic_decode [--products 4000] [--repeat 1] '''
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from avalanche.caic import CHUNK_SIZE, build_forecasts, iter_products
+
+PROBLEMS = ['windSlab', 'persistentSlab', 'stormSlab', 'wetLoose', 'cornice']
+RATINGS = ['low', 'moderate', 'considerable', 'high']
+
+
+def synthetic_products(count, seed=0):
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        if i % 2:
+            products.append({'id': f's-{i}', 'type': 'regionaldiscussionforecast', 'title': 'Summary',
+                             'areaId': 'a-state', 'message': 'x' * 2000})
+            continue
+        products.append({
+            'id': f'f-{i}', 'title': f'Zone {i % 40}', 'type': 'avalancheforecast', 'areaId': f'a-{i % 40}',
+            'forecaster': 'Forecaster', 'issueDateTime': '2023-02-26T23:30:00Z',
+            'expiryDateTime': '2023-02-27T23:30:00Z',
+            'avalancheProblems': {'days': [[
+                {'type': problem, 'aspectElevations': ['n_alp', 'ne_tln'], 'likelihood': 'likely',
+                 'expectedSize': {'min': '1', 'max': '2'}, 'comment': 'c' * 300}
+                for problem in rng.sample(PROBLEMS, 3)
+            ] for _ in range(3)]},
+            'confidence': {'days': [{'date': '2023-02-27T00:00:00Z', 'rating': rng.choice(RATINGS),
+                                     'statements': ['s' * 80]} for _ in range(3)]},
+            'dangerRatings': {'days': [{'position': position, 'alp': rng.choice(RATINGS), 'tln': rng.choice(RATINGS),
+                                        'btl': rng.choice(RATINGS), 'date': '2023-02-27T00:00:00Z'}
+                                       for position in (1, 2, 3)]},
+        })
+    return products
+
+
+def legacy_build(body):
+    data = json.loads(body)
+
+    df_final = []
+    for record in data:
+        if record['type'] != 'avalancheforecast':
+            continue
+        probs = pd.json_normalize(record['avalancheProblems']['days'][0]).rename({'type': 'problem'}, axis='columns')
+        conf = pd.json_normalize(record['confidence']['days'][0]).rename({'rating': 'confidence'}, axis='columns').drop(['date'], axis=1)
+        danger = pd.json_normalize(record['dangerRatings']['days']).drop(['date'], axis=1)
+        danger = danger[danger['position'] == 1]
+
+        df = pd.DataFrame({'id': record['id'], 'title': record['title'], 'type': record['type'],
+                           'areaId': record['areaId'], 'forecaster': record['forecaster'],
+                           'issueDate': record['issueDateTime'], 'expiryDate': record['expiryDateTime']}, index=[0])
+        df = pd.concat([df, probs, conf, danger], axis=1).ffill()
+        df_final.append(df.drop(['type'], axis=1))
+
+    return pd.concat(df_final)
+
+
+def streaming_build(body):
+    return build_forecasts(iter_products(body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)))
+
+
+def measure(label, build, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = build()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{label:<20} {min(timings):8.2f} s {peak / 2 ** 20:9.1f} MiB peak  ({len(result)} rows)')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--products', type=int, default=4000)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    body = json.dumps(synthetic_products(args.products)).encode('utf-8')
+    print(f'{args.products} products, {len(body) / 2 ** 20:.1f} MiB of JSON')
+
+    legacy = measure('json_normalize', lambda: legacy_build(body), args.repeat)
+    streamed = measure('streaming', lambda: streaming_build(body), args.repeat)
+
+    pd.testing.assert_frame_equal(streamed, legacy.reset_index(drop=True).astype({'position': 'int64'}))
+    print('outputs are identical')
+
+
+if __name__ == '__main__':
+    main()
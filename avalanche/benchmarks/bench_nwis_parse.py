@@ -0,0 +1,91 @@
+''' Compares the list-of-dicts parse that get_streamflow_data used with the columnar split_series in
+avalanche.nwis.
+The recorded dv response in tests/fixtures is scaled up to many stations and a multi-year period by
+repeating its discharge series with consecutive dates. Both parsers start from the decoded JSON.
+
+    python -m benchmarks.bench_nwis_parse [--stations 300] [--days 3650] [--repeat 3] '''
+
+import argparse
+import copy
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from avalanche.nwis import split_series
+
+FIXTURE = Path(__file__).resolve().parents[1] / 'tests' / 'fixtures' / 'nwis_dv.json'
+
+
+def build_payload(stations, days):
+    recorded = json.loads(FIXTURE.read_text())
+    template = recorded['value']['timeSeries'][0]
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2013-01-01', periods=days, freq='D').strftime('%Y-%m-%dT%H:%M:%S.000')
+
+    series = []
+    for station in range(stations):
+        entry = copy.deepcopy(template)
+        entry['sourceInfo']['siteCode'][0]['value'] = f'{station:08d}'
+        entry['values'][0]['value'] = [{'value': f'{flow:.1f}', 'qualifiers': ['A'], 'dateTime': date}
+                                       for date, flow in zip(dates, rng.gamma(2, 40, days))]
+        series.append(entry)
+
+    recorded['value']['timeSeries'] = series
+    return recorded
+
+
+def legacy_parse(payload):
+    frames = {}
+    for ts in payload['value']['timeSeries']:
+        station_id = ts['sourceInfo']['siteCode'][0]['value']
+        if ts['variable']['variableCode'][0]['value'] != '00060':
+            continue
+        data = [{'datetime': value['dateTime'], 'discharge': float(value['value']), 'station_id': station_id}
+                for value in ts['values'][0]['value']]
+        frames[station_id] = pd.DataFrame(data)
+    return frames
+
+
+def measure(label, parse, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = parse()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    frames = parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    size = sum(frame.memory_usage(deep=True).sum() for frame in frames.values())
+    print(f'{label:<16} {min(timings):7.2f} s {peak / 2 ** 20:9.1f} MiB peak {size / 2 ** 20:9.1f} MiB frames')
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stations', type=int, default=300)
+    parser.add_argument('--days', type=int, default=3650)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    payload = build_payload(args.stations, args.days)
+    print(f'{args.stations} stations x {args.days} days = {args.stations * args.days} values')
+
+    legacy = measure('list of dicts', lambda: legacy_parse(payload), args.repeat)
+    columnar = measure('split_series', lambda: split_series(payload), args.repeat)
+
+    for station_id, frame in legacy.items():
+        np.testing.assert_array_equal(columnar[station_id]['datetime'], pd.to_datetime(frame['datetime']))
+        np.testing.assert_allclose(columnar[station_id]['discharge'], frame['discharge'], rtol=1e-6)
+    print('values agree')
+
+
+if __name__ == '__main__':
+    main()
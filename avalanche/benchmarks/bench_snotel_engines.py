@@ -0,0 +1,90 @@
+''' Compares the pandas and Polars engines that turn the daily SNOTEL station reports into one frame
+(avalanche.snotel.combine_reports and avalanche.snotel_polars.combine_reports).
+The recorded Grizzly Peak report in tests/fixtures is repeated once per station with its own station id.
+Each engine runs in a fresh interpreter so that its peak RSS is its own. The parent checks first that
+both engines produce the same frame.
+
+    python -m benchmarks.bench_snotel_engines [--stations 900] [--days 2] [--repeat 5] '''
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+FIXTURE = Path(__file__).resolve().parents[1] / 'tests' / 'fixtures' / 'snotel_505_CO.csv'
+
+ENGINES = {
+    'pandas': 'avalanche.snotel',
+    'polars': 'avalanche.snotel_polars',
+}
+
+
+def build_reports(stations, days):
+    lines = FIXTURE.read_text().splitlines()
+    comments = [line for line in lines if line.startswith('#')]
+    header, *rows = [line for line in lines if line and not line.startswith('#')]
+
+    dates = pd.date_range('2023-11-07', periods=days, freq='D').strftime('%Y-%m-%d')
+    reports = []
+    for station in range(stations):
+        body = []
+        for i, date in enumerate(dates):
+            _, name, _, rest = rows[i % len(rows)].split(',', 3)
+            body.append(f'{date},{name},{1000 + station},{rest}')
+        reports.append(('\n'.join(comments + [header] + body) + '\n').encode())
+    return reports
+
+
+def combine(engine):
+    module = __import__(ENGINES[engine], fromlist=['combine_reports'])
+    return module.combine_reports
+
+
+def child(engine, stations, days, repeat):
+    reports = build_reports(stations, days)
+    combine_reports = combine(engine)
+    combine_reports(reports[:2])
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        combine_reports(reports)
+        timings.append(time.perf_counter() - start)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': min(timings), 'peak_kib': peak, 'growth_kib': peak - baseline}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engine', choices=ENGINES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        child(args.engine, args.stations, args.days, args.repeat)
+        return
+
+    sample = build_reports(min(args.stations, 20), args.days)
+    pd.testing.assert_frame_equal(combine('polars')(sample), combine('pandas')(sample))
+    print(f'{args.stations} stations, {args.days} days each')
+
+    for engine in ENGINES:
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_snotel_engines', '--engine', engine,
+                                 '--stations', str(args.stations), '--days', str(args.days),
+                                 '--repeat', str(args.repeat)], check=True, capture_output=True, text=True)
+        result = json.loads(output.stdout)
+        print(f'{engine:<8} {result["seconds"] * 1000:9.1f} ms {result["peak_kib"] / 2 ** 10:9.1f} MiB peak RSS '
+              f'{result["growth_kib"] / 2 ** 10:9.1f} MiB growth while combining')
+
+
+if __name__ == '__main__':
+    main()
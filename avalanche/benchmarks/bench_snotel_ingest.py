@@ -0,0 +1,96 @@
+''' Compares the per-station ingest of docker/snow/main.py before and after typed parsing.
+The old path read the report with pd.read_csv, turned every missing value into None (object columns)
+and cast the columns back to the schema one by one. The new path is avalanche.snotel.parse_report,
+which types the columns while reading, followed by to_schema and features.new_snow.
+Both paths run over the recorded Grizzly Peak report in tests/fixtures, once per station, and must
+produce the same frame.
+
+    python -m benchmarks.bench_snotel_ingest [--stations 900] [--days 2] [--repeat 5] '''
+
+import argparse
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from avalanche.features import new_snow
+from avalanche.snotel import COLUMN_MAPPING, SCHEMA, parse_report, to_schema
+
+FIXTURE = Path(__file__).resolve().parents[1] / 'tests' / 'fixtures' / 'snotel_505_CO.csv'
+
+
+def build_reports(stations, days):
+    lines = FIXTURE.read_text().splitlines()
+    comments = [line for line in lines if line.startswith('#')]
+    header, *rows = [line for line in lines if line and not line.startswith('#')]
+
+    dates = pd.date_range('2023-11-07', periods=days, freq='D').strftime('%Y-%m-%d')
+    body = [f'{date},{rows[i % len(rows)].split(",", 1)[1]}' for i, date in enumerate(dates)]
+
+    text = '\n'.join(comments + [header] + body) + '\n'
+    return [text] * stations
+
+
+def legacy_ingest(text):
+    data = pd.read_csv(StringIO(text), comment='#', skip_blank_lines=True)
+
+    if 'Snow Depth (in) Start of Day Values' not in data.columns:
+        data['Snow Depth (in) Start of Day Values'] = None
+
+    data['new_snow'] = np.maximum(0, data['Snow Depth (in) Start of Day Values'] - data[
+            'Snow Depth (in) Start of Day Values'].shift(1))
+
+    data.rename(columns=COLUMN_MAPPING, inplace=True)
+
+    data = data.fillna(np.nan).replace([np.nan], [None])
+
+    for column, dtype in SCHEMA.items():
+        if column not in data.columns or data[column].dtype != dtype:
+            data[column] = data[column].astype(dtype)
+
+    return data
+
+
+def typed_ingest(text):
+    data = to_schema(parse_report(text))
+    data['new_snow'] = new_snow(data)
+    return data
+
+
+def measure(label, ingest, reports, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in reports:
+            ingest(text)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    ingest(reports[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{label:<22} {min(timings) * 1000:9.1f} ms {min(timings) / len(reports) * 1e6:9.0f} us/station '
+          f'{peak / 2 ** 10:9.0f} KiB peak per station')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    reports = build_reports(args.stations, args.days)
+    pd.testing.assert_frame_equal(typed_ingest(reports[0]), legacy_ingest(reports[0]))
+    print(f'{args.stations} stations, {args.days} days each')
+
+    measure('legacy (object)', legacy_ingest, reports, args.repeat)
+    measure('typed (parse_report)', typed_ingest, reports, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
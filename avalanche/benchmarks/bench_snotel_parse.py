@@ -0,0 +1,70 @@
+''' Compares parsing a SNOTEL station report from the HTML view with pd.read_html against the CSV
+endpoint with avalanche.snotel.parse_report.
+The recorded Grizzly Peak report in tests/fixtures is repeated to the length of a full backfill
+(2009-10-01 onwards) and rendered both ways. The HTML page has the same layout tables around the data
+table that the reportGenerator view has.
+
+    python -m benchmarks.bench_snotel_parse [--days 5150] [--repeat 5] '''
+
+import argparse
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+
+from avalanche.snotel import parse_report
+
+FIXTURE = Path(__file__).resolve().parents[1] / 'tests' / 'fixtures' / 'snotel_505_CO.csv'
+
+LAYOUT_TABLES = 34
+
+
+def build_report(days):
+    lines = FIXTURE.read_text().splitlines()
+    comments = [line for line in lines if line.startswith('#')]
+    header, *rows = [line for line in lines if line and not line.startswith('#')]
+
+    dates = pd.date_range('2009-10-01', periods=days, freq='D').strftime('%Y-%m-%d')
+    body = [f'{date},{rows[i % len(rows)].split(",", 1)[1]}' for i, date in enumerate(dates)]
+
+    csv_text = '\n'.join(comments + [header] + body) + '\n'
+
+    layout = ''.join(f'<table><tr><td>menu {i}</td><td>item</td></tr></table>' for i in range(LAYOUT_TABLES))
+    data = pd.read_csv(StringIO(csv_text), comment='#').to_html(index=False)
+    html_text = f'<html><body>{layout}{data}</body></html>'
+
+    return csv_text, html_text
+
+
+def measure(label, parse, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{label:<28} {min(timings) * 1000:9.1f} ms {peak / 2 ** 20:9.1f} MiB peak  ({len(result)} rows)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--days', type=int, default=5150)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    csv_text, html_text = build_report(args.days)
+    print(f'{args.days} days: CSV {len(csv_text) / 2 ** 10:.0f} KiB, HTML {len(html_text) / 2 ** 10:.0f} KiB')
+
+    measure('read_html (view)', lambda: max(pd.read_html(StringIO(html_text)), key=len), args.repeat)
+    measure('parse_report (view_csv)', lambda: parse_report(csv_text.splitlines()), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+''' Times nearest-station and polygon lookups on avalanche.spatial.StationIndex against a brute-force scan.
+Stations get random coordinates over the western US. The regions are a grid of boxes standing in for
+forecast zones.
+
+    python -m benchmarks.bench_spatial [--stations 900] [--zones 10] [--repeat 2000] '''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+from avalanche.geo import haversine
+from avalanche.spatial import StationIndex
+
+
+def build_stations(stations, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'station_id': pd.array(np.arange(300, 300 + stations), dtype='Int64'),
+        'latitude': rng.uniform(32, 49, stations),
+        'longitude': rng.uniform(-124, -103, stations),
+    })
+
+
+def build_zones(zones):
+    corners = np.linspace(-109, -104, zones + 1)
+    return {f'zone-{i}': box(corners[i], 37, corners[i + 1], 41) for i in range(zones)}
+
+
+def brute_nearest(stations, latitude, longitude, k):
+    distances = haversine(latitude, longitude, stations['latitude'].to_numpy(), stations['longitude'].to_numpy())
+    closest = np.argsort(distances)[:k]
+    return pd.Series(distances[closest], index=stations['station_id'].iloc[closest], name='distance_miles')
+
+
+def measure(label, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query()
+        timings.append(time.perf_counter() - start)
+    print(f'{label:<32} {np.median(timings) * 1e6:9.1f} us median')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    stations = build_stations(args.stations)
+    zones = build_zones(args.zones)
+
+    start = time.perf_counter()
+    index = StationIndex(stations)
+    print(f'{args.stations} stations indexed in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    pd.testing.assert_series_equal(index.nearest(39.66, -105.88, k=5), brute_nearest(stations, 39.66, -105.88, 5))
+
+    measure('nearest 5, brute force', lambda: brute_nearest(stations, 39.66, -105.88, 5), args.repeat)
+    measure('nearest 5, index', lambda: index.nearest(39.66, -105.88, k=5), args.repeat)
+    measure('stations in one zone', lambda: index.within(zones['zone-0']), args.repeat)
+    measure(f'assign {args.zones} zones', lambda: index.assign_regions(zones), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
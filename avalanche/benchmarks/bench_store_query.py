@@ -0,0 +1,90 @@
+''' Times "last 7 days of SWE for all CO stations above 10,000 ft" against the local observation store
+(avalanche.store), and against reading the per-station `raw/{station_id}.csv` files the backfill writes.
+Stations get random states and elevations, and one row per day ending today.
+
+    python -m benchmarks.bench_store_query [--stations 900] [--days 1825] [--repeat 20] '''
+
+import argparse
+import datetime
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from avalanche.store import ObservationStore
+
+STATES = ['CO', 'UT', 'WY', 'MT', 'ID', 'CA', 'OR', 'WA', 'NM', 'AZ', 'NV', 'AK']
+
+
+def build_observations(stations, days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=days, freq='D')
+
+    ids = np.arange(300, 300 + stations)
+    states = rng.choice(STATES, size=stations)
+    elevations = rng.integers(5000, 12500, size=stations)
+
+    return pd.DataFrame({
+        'date': np.tile(dates.values, stations),
+        'station_id': pd.array(np.repeat(ids, days), dtype='Int64'),
+        'state_code': pd.array(np.repeat(states, days), dtype='string'),
+        'elevation_ft': pd.array(np.repeat(elevations, days), dtype='Int64'),
+        'snow_water_equivalent_in': rng.random(stations * days) * 30,
+        'snow_depth_in': rng.random(stations * days) * 100,
+        'observed_temp_degF': rng.random(stations * days) * 60 - 10,
+    })
+
+
+def query_csv(directory, start):
+    frames = []
+    for path in sorted(directory.glob('*.csv')):
+        data = pd.read_csv(path, parse_dates=['date'])
+        frames.append(data[(data['date'] >= start) & (data['state_code'] == 'CO') & (data['elevation_ft'] > 10000)])
+    return pd.concat(frames, ignore_index=True)[['station_id', 'date', 'snow_water_equivalent_in']]
+
+
+def query_store(store, start):
+    return store.read('snotel', start=start, end=datetime.date.today(),
+                      columns=['station_id', 'date', 'snow_water_equivalent_in'],
+                      where=(pc.field('state_code') == 'CO') & (pc.field('elevation_ft') > 10000))
+
+
+def measure(label, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = query()
+        timings.append(time.perf_counter() - start)
+    print(f'{label:<22} {min(timings) * 1000:9.1f} ms  ({len(result)} rows)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stations', type=int, default=900)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    data = build_observations(args.stations, args.days)
+    start = pd.Timestamp.today().normalize() - pd.Timedelta(days=6)
+
+    with tempfile.TemporaryDirectory() as root:
+        raw = Path(root) / 'raw'
+        raw.mkdir()
+        for station_id, rows in data.groupby('station_id'):
+            rows.to_csv(raw / f'{station_id}.csv', index=False)
+
+        store = ObservationStore(Path(root) / 'store')
+        started = time.perf_counter()
+        store.write('snotel', data)
+        print(f'{len(data)} rows, {args.stations} stations: store written in {time.perf_counter() - started:.1f} s')
+
+        measure('raw CSV per station', lambda: query_csv(raw, start), max(1, args.repeat // 10))
+        measure('observation store', lambda: query_store(store, start), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from avalanche import http
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+@pytest.fixture
+def fixtures():
+    return FIXTURES
+
+
+@pytest.fixture
+def stub_server():
+    """Starts a local HTTP server answering from a `handler(path, headers)` callable.
+
+    The handler returns `(status, body)` or `(status, body, response_headers)`.
+    """
+    servers = []
+
+    def start(handler):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body, *extra = handler(self.path, self.headers)
+                self.send_response(status)
+                for name, value in (extra[0] if extra else {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def http_cache(tmp_path, monkeypatch):
+    """Gives every test its own empty HTTP cache instead of the user's, and retries without waiting."""
+    monkeypatch.setattr(http, 'CACHE_DIR', tmp_path / 'http-cache')
+    monkeypatch.setattr(http, 'BACKOFF_SECONDS', 0)
+    monkeypatch.setattr(http, '_default', None)
+    yield
+    if http._default is not None:
+        http._default.close()
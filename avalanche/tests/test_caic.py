@@ -0,0 +1,104 @@
+import datetime
+import json
+
+import pytest
+from requests import HTTPError
+
+from avalanche.caic import (backfill_forecasts, backfill_windows, build_forecasts, fetch_forecasts, iter_products,
+                            write_partitions)
+from avalanche.sinks import LocalBucket, decode_frame
+
+
+def chunked(contents, size):
+    return [contents[i:i + size] for i in range(0, len(contents), size)]
+
+
+def test_iter_products_across_chunk_boundaries(fixtures):
+    contents = (fixtures / 'caic_products.json').read_bytes()
+
+    # Single bytes split the multi-byte en dash in the second forecast's title
+    for size in (1, 7, len(contents)):
+        assert list(iter_products(chunked(contents, size))) == json.loads(contents)
+
+
+def test_iter_products_rejects_truncated_input():
+    with pytest.raises(ValueError):
+        list(iter_products([b'[{"id": 1}, {"id"']))
+
+    assert list(iter_products([b' [ ] '])) == []
+
+
+def test_build_forecasts(fixtures):
+    data = build_forecasts(json.loads((fixtures / 'caic_products.json').read_text()))
+
+    assert list(data.columns) == ['id', 'title', 'areaId', 'forecaster', 'issueDate', 'expiryDate', 'problem',
+                                  'aspectElevations', 'likelihood', 'comment', 'expectedSize.min',
+                                  'expectedSize.max', 'confidence', 'statements', 'position', 'alp', 'tln', 'btl']
+    assert data['id'].tolist() == ['f-1001', 'f-1001', 'f-1002']
+    assert data['problem'].tolist() == ['windSlab', 'persistentSlab', None]
+    assert data['confidence'].tolist() == ['moderate', 'moderate', 'high']
+    assert data['alp'].tolist() == ['considerable', 'considerable', 'low']
+    assert data['title'].iloc[2] == 'Sawatch – North'
+
+
+def test_fetch_forecasts(fixtures, stub_server):
+    url = stub_server(lambda path, headers: (200, (fixtures / 'caic_products.json').read_bytes()))
+
+    assert fetch_forecasts(f'{url}/products/all')['id'].tolist() == ['f-1001', 'f-1001', 'f-1002']
+
+
+def forecast(product_id, issued):
+    return {'id': product_id, 'title': 'Front Range', 'type': 'avalancheforecast', 'areaId': 'a-front-range',
+            'forecaster': 'Forecaster', 'issueDateTime': issued, 'expiryDateTime': issued,
+            'avalancheProblems': {'days': [[{'type': 'windSlab', 'likelihood': 'likely'}]]},
+            'confidence': {'days': [{'date': issued, 'rating': 'moderate'}]},
+            'dangerRatings': {'days': [{'position': 1, 'alp': 'low', 'tln': 'low', 'btl': 'low', 'date': issued}]}}
+
+
+def test_backfill_forecasts(stub_server, tmp_path):
+    requests = []
+
+    def handler(path, headers):
+        snapshot = path.split('datetime=')[1][:10]
+        requests.append(snapshot)
+        # The second day fails once before it succeeds
+        if snapshot == '2023-01-02' and requests.count(snapshot) == 1:
+            return 503, b'busy'
+
+        day = datetime.date.fromisoformat(snapshot)
+        # Each snapshot still lists the previous day's forecast
+        products = [forecast(f'f-{issued.day}', f'{issued}T23:30:00Z')
+                    for issued in (day - datetime.timedelta(days=1), day)]
+        products.append({'id': f's-{day}', 'type': 'regionaldiscussionforecast'})
+        return 200, json.dumps(products).encode('utf-8')
+
+    data = backfill_forecasts(datetime.date(2023, 1, 1), datetime.date(2023, 1, 4), workers=3,
+                              api_url=stub_server(handler))
+
+    assert sorted(requests) == ['2023-01-01', '2023-01-02', '2023-01-02', '2023-01-03', '2023-01-04']
+    assert sorted(data['id']) == ['f-1', 'f-2', 'f-3', 'f-31', 'f-4']
+
+    bucket = LocalBucket(tmp_path)
+    names = write_partitions(bucket, data, 'history/av-forecast/')
+
+    assert names[0] == 'history/av-forecast/date=2022-12-31/part-0.parquet'
+    assert len(names) == 5
+    assert decode_frame(bucket.blob(names[-1]).download_as_bytes(), 'parquet')['id'].tolist() == ['f-4']
+
+
+def test_backfill_gives_up_on_client_errors(stub_server):
+    calls = []
+
+    def handler(path, headers):
+        calls.append(path)
+        return 404, b'not found'
+
+    with pytest.raises(HTTPError):
+        backfill_forecasts(datetime.date(2023, 1, 1), datetime.date(2023, 1, 1), api_url=stub_server(handler))
+    assert len(calls) == 1
+
+
+def test_backfill_windows():
+    assert backfill_windows(datetime.date(2023, 1, 1), datetime.date(2023, 1, 3)) == [
+        '2023-01-01T18:00:00.000Z', '2023-01-02T18:00:00.000Z', '2023-01-03T18:00:00.000Z']
+    assert backfill_windows(datetime.date(2023, 1, 3), datetime.date(2023, 1, 1)) == []
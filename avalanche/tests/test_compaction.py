@@ -0,0 +1,49 @@
+import pandas as pd
+
+from avalanche.compaction import compact_day, read_day
+from avalanche.sinks import LocalBucket, write_frame
+from avalanche.snotel import SCHEMA
+
+
+def _station(station_id, depth):
+    return pd.DataFrame({
+        'date': [pd.Timestamp('2023-11-07')],
+        'station_id': [station_id],
+        'snow_depth_in': [depth],
+    })
+
+
+def test_compact_day_merges_raw_blobs_once(tmp_path):
+    bucket = LocalBucket(tmp_path)
+    write_frame(bucket, _station(1120, 20.0), 'daily_raw/2023-11-07 00:00:00-1120', 'csv')
+    write_frame(bucket, _station(505, 14.0), 'daily_raw/2023-11-07 00:00:00-505', 'parquet')
+    write_frame(bucket, _station(505, 12.0), 'daily_raw/2023-11-06 00:00:00-505', 'csv')
+
+    manifest = compact_day(bucket, '2023-11-07')
+
+    assert manifest['files'] == ['daily/date=2023-11-07/part-0.parquet']
+    assert manifest['rows'] == 2
+    assert len(manifest['sources']) == 2
+
+    compacted = read_day(bucket, '2023-11-07')
+    assert compacted['station_id'].tolist() == [505, 1120]
+    assert compacted['snow_depth_in'].tolist() == [14.0, 20.0]
+
+    # A second run with the same sources leaves the partition alone
+    assert compact_day(bucket, '2023-11-07')['created_at'] == manifest['created_at']
+
+    # Rewriting a source in place under the same name recompacts the day
+    write_frame(bucket, _station(1120, 22.0), 'daily_raw/2023-11-07 00:00:00-1120', 'csv')
+    assert compact_day(bucket, '2023-11-07')['created_at'] != manifest['created_at']
+    assert read_day(bucket, '2023-11-07')['snow_depth_in'].tolist() == [14.0, 22.0]
+
+
+def test_read_day_falls_back_to_raw_blobs(tmp_path):
+    bucket = LocalBucket(tmp_path)
+    write_frame(bucket, _station(505, 12.0), 'daily_raw/2023-11-06 00:00:00-505', 'csv')
+
+    assert read_day(bucket, '2023-11-06')['snow_depth_in'].tolist() == [12.0]
+    assert compact_day(bucket, '2023-11-05') is None
+
+    empty = read_day(bucket, '2023-11-05')
+    assert empty.empty and empty.dtypes.astype(str).to_dict() == SCHEMA
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from avalanche.features import Timeline, derive_features, new_snow
+
+
+def _frame():
+    # Two stations interleaved and out of order; station 2 has no report on 2024-01-03
+    return pd.DataFrame({
+        'station_id': [1, 2, 1, 2, 1, 1, 2],
+        'date': pd.to_datetime(['2024-01-02', '2024-01-01', '2024-01-01', '2024-01-02', '2024-01-03',
+                                '2024-01-04', '2024-01-04']),
+        'snow_depth_in': [14.0, 30.0, 10.0, 33.0, 13.0, 20.0, 40.0],
+        'snow_water_equivalent_in': [2.5, 5.0, 2.0, 5.5, 2.5, 3.5, 6.0],
+        'max_temp_degF': [30.0, 25.0, 28.0, 20.0, 35.0, 22.0, 18.0],
+        'min_temp_degF': [10.0, 5.0, 12.0, 2.0, 20.0, 8.0, -1.0],
+        'observed_temp_degF': [20.0, 10.0, 18.0, 8.0, 30.0, 15.0, 5.0],
+    })
+
+
+def test_new_snow_matches_per_station_shift():
+    data = _frame()
+    expected = data.sort_values(['station_id', 'date']).groupby('station_id')['snow_depth_in'].diff().clip(lower=0)
+
+    # Station 2 skipped a day, so its last row has no previous day to compare with
+    expected[6] = np.nan
+    pd.testing.assert_series_equal(new_snow(data), expected.reindex(data.index), check_names=False)
+
+
+def test_derive_features_by_station_and_calendar_day():
+    features = derive_features(_frame()).set_index(['station_id', 'date']).sort_index()
+    station = features.loc[1].reset_index()
+
+    assert station['new_snow'].tolist()[1:] == [4.0, 0.0, 7.0]
+    assert station['snowfall_24h_in'].tolist()[1:] == [4.0, 0.0, 7.0]
+    assert station['snowfall_48h_in'].tolist()[1:] == [4.0, 4.0, 7.0]
+    assert station['snowfall_72h_in'].tolist()[1:] == [4.0, 4.0, 11.0]
+    assert np.isnan(station['snowfall_24h_in'][0])
+
+    assert station['swe_change_24h_in'].tolist()[1:] == [0.5, 0.0, 1.0]
+    assert station['swe_change_72h_in'].isna().tolist() == [True, True, True, False]
+    assert station['swe_change_72h_in'][3] == 1.5
+
+    assert station['settlement_24h_in'].tolist()[1:] == [0.0, 1.0, 0.0]
+    assert station['settlement_rate_pct'][2] == pytest.approx(100 / 14)
+
+    assert station['temp_range_degF'].tolist() == [16.0, 20.0, 15.0, 14.0]
+    assert station['temp_change_24h_degF'].tolist()[1:] == [2.0, 10.0, -15.0]
+
+    gap = features.loc[(2, pd.Timestamp('2024-01-04'))]
+    assert np.isnan(gap['new_snow']) and np.isnan(gap['swe_change_24h_in'])
+    assert features.loc[(2, pd.Timestamp('2024-01-04')), 'snowfall_72h_in'] == 3.0
+
+
+def test_derive_features_handles_missing_columns_and_empty_frames():
+    data = _frame()[['station_id', 'date', 'snow_depth_in']]
+    features = derive_features(data)
+
+    assert features['swe_change_24h_in'].isna().all() and features['temp_range_degF'].isna().all()
+    assert derive_features(data.iloc[:0]).empty
+
+    with pytest.raises(ValueError):
+        Timeline(data).lag(data['snow_depth_in'].to_numpy(), 0)
+
+
+def test_rows_without_a_date_have_no_lookbacks():
+    data = _frame()
+    data.loc[2, 'date'] = pd.NaT
+
+    snow = new_snow(data)
+
+    assert np.isnan(snow[2]) and np.isnan(snow[0])
+    assert snow[4] == 0.0
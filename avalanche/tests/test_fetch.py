@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+from io import StringIO
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from avalanche.fetch import AsyncFetcher
+
+
+def test_fetcher_bounds_requests_per_host(stub_server, fixtures):
+    body = (fixtures / 'snotel_505_CO.csv').read_bytes()
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def handler(path, headers):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return 200, body
+
+    base_url = stub_server(handler)
+
+    async def run():
+        async with AsyncFetcher(concurrency=8, per_host=3) as fetcher:
+            return await fetcher.get_all(f'{base_url}/station/{i}' for i in range(12))
+
+    responses = asyncio.run(run())
+
+    assert [r.status_code for r in responses] == [200] * 12
+    assert 1 < in_flight[1] <= 3
+
+    data = pd.read_csv(StringIO(responses[0].text), comment='#')
+    assert list(data['Station Id']) == [505, 505]
+
+
+def test_fetcher_keeps_the_callers_adapters():
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=5)
+    session.mount('https://', adapter)
+
+    fetcher = AsyncFetcher(concurrency=4, session=session)
+    try:
+        assert fetcher.session.get_adapter('https://example.com') is adapter
+    finally:
+        fetcher.close()
+
+    fetcher = AsyncFetcher(concurrency=4)
+    try:
+        assert fetcher.session.get_adapter('https://example.com')._pool_maxsize == 4
+    finally:
+        fetcher.close()
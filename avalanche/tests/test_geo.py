@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+from avalanche.geo import BUOY_REGIONS, Region, distances, haversine, vincenty, within_regions
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-80, 80, 500), rng.uniform(-180, 180, 500)
+
+
+def test_vincenty_agrees_with_geodesic(points):
+    lats, lons = points
+    expected = np.array([[geodesic((region.latitude, region.longitude), (lat, lon)).miles for region in BUOY_REGIONS]
+                         for lat, lon in zip(lats, lons)])
+
+    np.testing.assert_allclose(distances(lats, lons, BUOY_REGIONS), expected, atol=1e-6)
+    np.testing.assert_allclose(distances(lats, lons, BUOY_REGIONS, 'haversine'), expected, rtol=0.006)
+
+
+def test_within_regions_matches_geodesic_loop(points):
+    lats, lons = points
+    regions = [Region('hawaii', 19.8968, -155.5828, 4000), Region('juneau', 58.3019, -134.4197, 3000)]
+
+    expected = [any(geodesic((region.latitude, region.longitude), (lat, lon)).miles <= region.radius_miles
+                    for region in regions)
+                for lat, lon in zip(lats, lons)]
+
+    assert within_regions(lats, lons, regions).tolist() == expected
+
+
+def test_edge_cases():
+    assert vincenty(40.0, -105.0, 40.0, -105.0) == 0
+    assert haversine(0, 0, 0, 180) == pytest.approx(np.pi * 3958.7613)
+    # Nearly antipodal points do not converge and fall back to the spherical distance
+    assert vincenty(0, 0, 0.5, 179.7) == pytest.approx(haversine(0, 0, 0.5, 179.7))
+
+    with pytest.raises(ValueError):
+        distances([0], [0], BUOY_REGIONS, method='flat')
@@ -0,0 +1,180 @@
+import gzip
+import time
+
+import pytest
+import requests
+
+from avalanche.http import CachedSession, ResponseCache, TokenBucket, _parse_rate_limits, metrics
+
+
+def counting_handler(body, headers=None):
+    calls = []
+
+    def handler(path, request_headers):
+        calls.append((path, request_headers.get('If-None-Match')))
+        if request_headers.get('If-None-Match') == '"v1"':
+            return 304, b''
+        return 200, body, headers or {}
+
+    return handler, calls
+
+
+def test_fresh_responses_skip_the_network(stub_server, tmp_path):
+    handler, calls = counting_handler(b'Date,Value\n2023-02-26,1\n')
+    url = f'{stub_server(handler)}/report'
+
+    session = CachedSession(tmp_path, ttl=3600)
+    first = session.get(url)
+    second = session.get(url, stream=True)
+
+    assert not first.from_cache and second.from_cache
+    assert list(second.iter_lines()) == [b'Date,Value', b'2023-02-26,1']
+    assert len(calls) == 1
+
+    # The cache is on disk, so another session (a rerun) reuses it
+    assert CachedSession(tmp_path, ttl=3600).get(url).text == first.text
+    assert len(calls) == 1
+
+
+def test_responses_are_revalidated_by_default(stub_server, tmp_path):
+    handler, calls = counting_handler(b'latest', {'ETag': '"v1"'})
+    url = f'{stub_server(handler)}/latest_obs.txt'
+
+    session = CachedSession(tmp_path)
+    session.get(url)
+    assert session.get(url).from_cache
+    assert calls == [('/latest_obs.txt', None), ('/latest_obs.txt', '"v1"')]
+
+
+def test_streamed_responses_are_cached_once_read(stub_server, tmp_path):
+    body = b''.join(b'2023-02-%02d,%d\n' % (day, day) for day in range(1, 29)) * 200
+    handler, calls = counting_handler(body, {'ETag': '"v1"'})
+    url = f'{stub_server(handler)}/report'
+
+    session = CachedSession(tmp_path)
+    streamed = session.get(url, stream=True)
+    assert not streamed._content_consumed and session.cache.get(url) is None
+
+    assert b'\n'.join(streamed.iter_lines()) + b'\n' == body
+    assert gzip.decompress(session.cache.get(url)['body']) == body
+
+    # The next request revalidates the stored copy and gets it back on the 304
+    assert session.get(url, stream=True).content == body
+    assert calls[-1] == ('/report', '"v1"')
+
+
+def test_stale_responses_are_revalidated(stub_server, tmp_path):
+    handler, calls = counting_handler(b'{"a": 1}', {'ETag': '"v1"', 'Content-Type': 'application/json'})
+    url = f'{stub_server(handler)}/products'
+
+    session = CachedSession(tmp_path, ttl=0)
+    session.get(url)
+    revalidated = session.get(url)
+
+    assert calls == [('/products', None), ('/products', '"v1"')]
+    assert revalidated.status_code == 200 and revalidated.from_cache
+    assert revalidated.json() == {'a': 1}
+
+    # A caller that sends its own validators gets the 304 back
+    assert session.get(url, headers={'If-None-Match': '"v1"'}).status_code == 304
+
+
+def test_errors_are_not_cached(stub_server, tmp_path):
+    calls = []
+
+    def handler(path, headers):
+        calls.append(path)
+        return 503, b'busy'
+
+    session = CachedSession(tmp_path, retries=0)
+    url = f'{stub_server(handler)}/busy'
+    assert session.get(url).status_code == 503
+    assert session.get(url).status_code == 503
+    assert len(calls) == 2
+
+
+def test_cache_evicts_least_recently_used():
+    class Response:
+        status_code = 200
+        headers = {}
+
+        def __init__(self, content):
+            self.content = content
+
+    body = bytes(range(256)) * 40
+    cache = ResponseCache(max_bytes=2 * len(gzip.compress(body)))
+
+    cache.put('a', Response(body))
+    cache.put('b', Response(body))
+    cache.get('a')
+    cache.put('c', Response(body))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.size() <= cache.max_bytes
+
+
+def test_transient_failures_are_retried(stub_server, tmp_path):
+    calls = []
+
+    def handler(path, headers):
+        calls.append(path)
+        return (503, b'busy') if len(calls) < 3 else (200, b'ok')
+
+    url = f'{stub_server(handler)}/flaky'
+    host = url.split('/')[2]
+    metrics.reset()
+
+    response = CachedSession(tmp_path, retries=3).get(url)
+
+    assert response.text == 'ok' and len(calls) == 3
+    snapshot = metrics.snapshot()[host]
+    assert snapshot['retries'] == 2
+    assert snapshot['requests'] == {'503': 2, '200': 1}
+    assert sum(snapshot['latency_buckets'].values()) == 3
+
+
+def test_posts_are_not_retried(stub_server, tmp_path):
+    calls = []
+
+    def handler(path, headers):
+        calls.append(path)
+        return 503, b'busy'
+
+    response = CachedSession(tmp_path, retries=3).post(f'{stub_server(handler)}/submit')
+
+    assert response.status_code == 503 and len(calls) == 1
+
+
+def test_malformed_rate_limits_are_ignored():
+    assert _parse_rate_limits('a.gov=5:10, broken, b.gov=x, c.gov=2') == {'a.gov': (5.0, 10), 'c.gov': (2.0, 2)}
+
+
+def test_connection_errors_are_raised_after_retries(tmp_path):
+    metrics.reset()
+
+    with pytest.raises(requests.ConnectionError):
+        CachedSession(tmp_path, retries=2).get('http://127.0.0.1:9/closed')
+
+    assert metrics.snapshot()['127.0.0.1:9']['retries'] == 2
+
+
+def test_rate_limit_per_host(stub_server, tmp_path):
+    url = stub_server(lambda path, headers: (200, b'ok'))
+    host = url.split('/')[2]
+    session = CachedSession(tmp_path, ttl=0, rate_limits={host: (20.0, 2)})
+
+    start = time.monotonic()
+    for i in range(6):
+        session.get(f'{url}/{i}')
+    elapsed = time.monotonic() - start
+
+    # Two requests fit in the burst, the other four wait 1/20 s each
+    assert elapsed >= 0.19
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, burst=5)
+
+    assert sum(bucket.acquire() for _ in range(5)) == 0
+    assert bucket.acquire() > 0
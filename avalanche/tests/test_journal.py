@@ -0,0 +1,91 @@
+import threading
+
+import pandas as pd
+
+from avalanche.journal import Journal, WorkUnit, run_units, station_units
+
+
+def _units(n):
+    return [WorkUnit(str(station_id), 'WTEQ', '2009-10-01', '2023-02-26') for station_id in range(n)]
+
+
+def test_parallel_workers_run_each_unit_once(tmp_path):
+    path = tmp_path / 'journal.sqlite'
+    assert Journal(path).add(_units(40)) == 40
+
+    seen = []
+    lock = threading.Lock()
+
+    def handler(unit):
+        with lock:
+            seen.append(unit)
+        return 10
+
+    assert run_units(path, handler, workers=4) == {'done': 40}
+    assert sorted(seen) == sorted(_units(40))
+
+    # Everything is done, so a rerun has nothing to claim
+    assert run_units(path, handler, workers=4) == {'done': 40}
+    assert len(seen) == 40
+
+
+def test_resume_skips_finished_units_and_reclaims_abandoned_ones(tmp_path):
+    path = tmp_path / 'journal.sqlite'
+    first = Journal(path, worker_id='first', lease_seconds=0)
+    first.add(_units(3))
+
+    done = first.claim()
+    first.complete(done, rows=5)
+    abandoned = first.claim()
+
+    # Re-adding the same backfill does not reset finished units
+    assert first.add(_units(3)) == 0
+
+    second = Journal(path, worker_id='second', lease_seconds=0)
+    remaining = []
+    for unit in second:
+        remaining.append(unit)
+        second.complete(unit)
+    assert done not in remaining
+    assert sorted(remaining) == sorted(set(_units(3)) - {done})
+    assert abandoned in remaining
+
+
+def test_failing_units_stop_at_attempt_limit(tmp_path):
+    path = tmp_path / 'journal.sqlite'
+    Journal(path).add(_units(2))
+    calls = []
+
+    def handler(unit):
+        calls.append(unit)
+        if unit.station_id == '1':
+            raise ValueError('no data')
+        return 1
+
+    assert run_units(path, handler) == {'done': 1, 'failed': 1}
+    assert len(calls) == 4
+
+
+def test_expired_claims_cannot_be_finished(tmp_path):
+    path = tmp_path / 'journal.sqlite'
+    first = Journal(path, worker_id='first', lease_seconds=0)
+    first.add(_units(1))
+    unit = first.claim()
+
+    # The lease ran out and another worker took the unit
+    second = Journal(path, worker_id='second', lease_seconds=0)
+    assert second.claim() == unit
+
+    assert not first.complete(unit, rows=5)
+    assert not first.fail(unit, 'late')
+    assert second.complete(unit, rows=7)
+    assert not second.complete(unit, rows=7)
+    assert second.summary() == {'done': 1}
+    assert second.connection.execute('SELECT worker, rows FROM units').fetchone() == ('second', 7)
+
+
+def test_station_units_skip_stations_without_a_start_date():
+    records = [{'station_id': 505, 'start_date': pd.Timestamp('1979-10-01')},
+               {'station_id': 1120, 'start_date': pd.NaT}]
+
+    assert list(station_units(records, 'SNWD', '2023-02-26')) == [WorkUnit('505', 'SNWD', '1979-10-01', '2023-02-26')]
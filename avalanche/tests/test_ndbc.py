@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from avalanche.ndbc import fetch_latest_obs, observation_times, parse_latest_obs
+
+
+def test_parse_latest_obs(fixtures):
+    data = parse_latest_obs((fixtures / 'ndbc_latest_obs.txt').read_bytes())
+
+    assert len(data) == 5
+    assert list(data.columns[:4]) == ['station_id', 'LAT_deg', 'LON_deg', 'YYYY_yr']
+    assert 'WSPD_m/s' in data.columns and 'TIDE_ft' in data.columns
+    assert data['station_id'].tolist() == ['46001', '46410', '51001', 'JNEA2', '41001']
+    assert str(data['station_id'].dtype) == 'string'
+    assert str(data['MM_mo'].dtype) == 'Int64'
+    assert data['PTDY_hPa'].dtype == np.float64
+
+    juneau = data[data['station_id'] == 'JNEA2']
+    assert juneau['PRES_hPa'].tolist() == [1005.0]
+    assert juneau['WSPD_m/s'].isna().all()
+
+
+def test_observation_times(fixtures):
+    data = parse_latest_obs((fixtures / 'ndbc_latest_obs.txt').read_bytes())
+    times = observation_times(data)
+
+    assert times.iloc[0] == pd.Timestamp('2023-02-26 12:00')
+    assert times.iloc[1] == pd.Timestamp('2023-02-26 11:45')
+
+
+def test_fetch_latest_obs_downloads_once(fixtures, stub_server):
+    requests = []
+
+    def handler(path, headers):
+        requests.append(path)
+        return 200, (fixtures / 'ndbc_latest_obs.txt').read_bytes()
+
+    data = fetch_latest_obs(f'{stub_server(handler)}/data/latest_obs/latest_obs.txt')
+
+    assert requests == ['/data/latest_obs/latest_obs.txt']
+    assert len(data) == 5
@@ -0,0 +1,135 @@
+import datetime
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+
+from avalanche.nwis import (DISCHARGE, GAGE_HEIGHT, batches, fetch_daily_values, fetch_incremental, merge_values,
+                            split_series, stored_watermarks)
+from avalanche.watermarks import WatermarkStore
+
+
+def test_split_series(fixtures):
+    frames = split_series(json.loads((fixtures / 'nwis_dv.json').read_text()))
+
+    assert list(frames) == ['06719505', '06730200']
+    assert list(frames['06719505'].columns) == ['datetime', 'discharge', 'station_id']
+    assert str(frames['06719505']['datetime'].dtype) == 'datetime64[ns]'
+    assert frames['06719505']['discharge'].dtype == np.float32
+    np.testing.assert_array_equal(frames['06719505']['discharge'], np.array([21.4, 20.9, np.nan], dtype=np.float32))
+    assert frames['06730200']['station_id'].unique().tolist() == ['06730200']
+
+
+def test_split_series_several_parameters(fixtures):
+    frames = split_series(json.loads((fixtures / 'nwis_dv.json').read_text()), [DISCHARGE, GAGE_HEIGHT])
+
+    assert list(frames['06719505'].columns) == ['datetime', 'discharge', 'gage_height', 'station_id']
+    assert frames['06719505']['gage_height'].tolist() == np.array([2.31, 2.30, 2.28], dtype=np.float32).tolist()
+    # Stations without gage height only get the columns they report
+    assert list(frames['06730200'].columns) == ['datetime', 'discharge', 'station_id']
+
+
+def test_fetch_daily_values_batches_sites(fixtures, stub_server):
+    payload = json.loads((fixtures / 'nwis_dv.json').read_text())
+    requested = []
+
+    def handler(path, headers):
+        sites = parse_qs(urlsplit(path).query)['sites'][0].split(',')
+        requested.append(sites)
+        # Answer each batch with only the series of its own sites
+        series = [s for s in payload['value']['timeSeries'] if s['sourceInfo']['siteCode'][0]['value'] in sites]
+        return 200, json.dumps({'value': {'timeSeries': series}}).encode('utf-8')
+
+    ids = ['06719505', '09010500', '06730200']
+    frames = fetch_daily_values(ids, batch_size=2, workers=2, api_url=stub_server(handler))
+
+    assert sorted(requested) == [['06719505', '09010500'], ['06730200']]
+    assert sorted(frames) == ['06719505', '06730200']
+    assert len(frames['06730200']) == 2
+
+
+def test_fetch_daily_values_skips_failed_batches(stub_server):
+    url = stub_server(lambda path, headers: (503, b'busy'))
+
+    assert fetch_daily_values(['06719505'], api_url=url) == {}
+
+
+def test_fetch_daily_values_skips_batches_that_raise(fixtures, stub_server):
+    payload = (fixtures / 'nwis_dv.json').read_bytes()
+
+    def handler(path, headers):
+        # The batch holding 09010500 gets an HTML error page with status 200
+        if '09010500' in path:
+            return 200, b'<html>Service Unavailable</html>'
+        return 200, payload
+
+    url = stub_server(handler)
+    frames = fetch_daily_values(['06719505', '09010500', '06730200'], batch_size=1, workers=1, api_url=url)
+    assert sorted(frames) == ['06719505', '06730200']
+
+    # Nothing listens on port 9, so the request itself fails
+    closed = requests.Session()
+    assert fetch_daily_values(['06719505'], api_url='http://127.0.0.1:9', session=closed) == {}
+
+
+def test_batches():
+    assert batches(list('abcde'), 2) == [['a', 'b'], ['c', 'd'], ['e']]
+
+
+def test_fetch_incremental_starts_from_watermarks(fixtures, stub_server):
+    payload = json.loads((fixtures / 'nwis_dv.json').read_text())
+    requested = {}
+
+    def handler(path, headers):
+        query = parse_qs(urlsplit(path).query)
+        requested[query['startDT'][0]] = sorted(query['sites'][0].split(','))
+        assert 'period' not in query and query['endDT'] == ['2023-02-26']
+        return 200, json.dumps(payload).encode('utf-8')
+
+    watermarks = WatermarkStore(namespace='nwis')
+    watermarks.advance('06719505', datetime.date(2023, 2, 20))
+    watermarks.advance('06730200', datetime.date(2023, 2, 20))
+    watermarks.advance('09010500', datetime.date(2023, 2, 26))
+
+    frames = fetch_incremental(['06719505', '06730200', '09010500', '07083000'], watermarks,
+                               datetime.date(2022, 2, 26), datetime.date(2023, 2, 26), api_url=stub_server(handler))
+
+    # Up-to-date sites are skipped, the others share one request per start date
+    assert requested == {'2023-02-13': ['06719505', '06730200'], '2022-02-26': ['07083000']}
+    assert sorted(frames) == ['06719505', '06730200']
+
+
+def test_merge_values_keeps_only_new_or_revised_rows():
+    def frame(dates, discharge):
+        return pd.DataFrame({'datetime': pd.to_datetime(dates), 'discharge': np.array(discharge, dtype=np.float32),
+                             'station_id': '06719505'})
+
+    stored = frame(['2023-02-23', '2023-02-24', '2023-02-25'], [22.0, 21.4, np.nan])
+    fetched = frame(['2023-02-24', '2023-02-25', '2023-02-26'], [21.4, np.nan, 19.8])
+
+    merged, changed = merge_values(stored, fetched)
+    assert changed == 1
+    assert merged['discharge'].tolist()[-1] == np.float32(19.8)
+
+    # A provisional value that USGS revised replaces the stored one
+    merged, changed = merge_values(merged, frame(['2023-02-25'], [20.5]))
+    assert changed == 1
+    assert len(merged) == 4
+    assert merged.loc[merged['datetime'] == '2023-02-25', 'discharge'].tolist() == [20.5]
+
+    assert merge_values(None, fetched)[1] == 3
+
+
+def test_stored_watermarks_come_from_the_dataset():
+    stored = pd.DataFrame({
+        'datetime': pd.to_datetime(['2023-02-19', '2023-02-20', '2023-02-26']),
+        'discharge': [1.0, 2.0, 3.0],
+        'station_id': ['06719505', '06719505', '09010500'],
+    })
+
+    watermarks = stored_watermarks(stored)
+
+    assert watermarks.all() == {'06719505': datetime.date(2023, 2, 20), '09010500': datetime.date(2023, 2, 26)}
+    assert stored_watermarks(None).all() == {}
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from avalanche.sinks import LocalBlob, LocalBucket, Uploader, decode_frame, format_of, get_bucket, write_frame
+from avalanche.snotel import SCHEMA
+
+
+def _frame():
+    return pd.DataFrame({
+        'date': ['2023-11-06', '2023-11-07'],
+        'station_id': [505, 505],
+        'station_name': ['Grizzly Peak', 'Grizzly Peak'],
+        'snow_depth_in': [12.0, None],
+    })
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_write_frame_round_trips_through_local_bucket(tmp_path, fmt):
+    bucket = LocalBucket(tmp_path)
+
+    name = write_frame(bucket, _frame(), 'daily_raw/2023-11-07-505', fmt, schema=SCHEMA)
+
+    assert name == f'daily_raw/2023-11-07-505.{fmt}'
+    assert format_of(name) == fmt
+    stored = decode_frame(bucket.blob(name).download_as_bytes(), fmt)
+    assert stored['station_id'].tolist() == [505, 505]
+    assert stored['snow_depth_in'].isna().tolist() == [False, True]
+
+
+def test_parquet_keeps_schema_types(tmp_path):
+    bucket = LocalBucket(tmp_path)
+
+    name = write_frame(bucket, _frame(), 'raw/505', 'parquet', schema=SCHEMA)
+    stored = decode_frame(bucket.blob(name).download_as_bytes(), 'parquet')
+
+    assert str(stored['date'].dtype) == 'datetime64[ns]'
+    assert str(stored['station_id'].dtype) == 'Int64'
+    assert str(stored['station_name'].dtype) == 'string'
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_frame(LocalBucket(tmp_path), _frame(), 'raw/505', 'json')
+
+
+@pytest.mark.parametrize('fmt, ok', [('parquet', True), ('json', False)])
+def test_output_format_is_checked_on_import(fmt, ok):
+    result = subprocess.run([sys.executable, '-c', 'import avalanche.sinks'], capture_output=True, text=True,
+                            env={**os.environ, 'OUTPUT_FORMAT': fmt})
+
+    assert (result.returncode == 0) == ok
+    assert ok or 'Unknown output format' in result.stderr
+
+
+def test_get_bucket_reuses_one_handle(tmp_path):
+    bucket = get_bucket('raw-avy-data', local_root=tmp_path)
+
+    assert get_bucket('raw-avy-data', local_root=tmp_path) is bucket
+    assert isinstance(bucket, LocalBucket) and bucket.root == tmp_path / 'raw-avy-data'
+
+
+def test_uploader_bounds_uploads_in_flight(tmp_path):
+    bucket = LocalBucket(tmp_path)
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    class SlowBlob(LocalBlob):
+        def upload_from_string(self, data, content_type=None):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.02)
+            super().upload_from_string(data, content_type)
+            with lock:
+                in_flight[0] -= 1
+
+    bucket.blob = lambda name: SlowBlob(bucket, name)
+
+    with Uploader(bucket, 'parquet', workers=4, max_pending=2) as uploader:
+        for i in range(8):
+            uploader.submit(_frame(), f'daily/part-{i}')
+
+    assert in_flight[1] == 2
+    assert sorted(blob.name for blob in bucket.list_blobs('daily/')) == [f'daily/part-{i}.parquet' for i in range(8)]
+
+
+def test_uploader_keeps_failures(tmp_path):
+    uploader = Uploader(LocalBucket(tmp_path))
+    uploader.submit(_frame(), 'ok')
+    uploader.submit('not a frame', 'broken')
+
+    assert uploader.close() == ['ok.csv']
+    assert [stem for stem, _ in uploader.failed] == ['broken']
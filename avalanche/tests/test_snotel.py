@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+from avalanche.snotel import SCHEMA, ReportError, fetch_report, parse_report, report_url, split_elements, to_schema
+
+
+def test_split_elements_fans_out_per_variable():
+    data = pd.DataFrame({
+        'Date': ['2023-11-06'],
+        'Station Id': [505],
+        'Station Name': ['Grizzly Peak'],
+        'Snow Water Equivalent (in) Start of Day Values': [1.9],
+        'Snow Depth (in) Start of Day Values': [12],
+        'Air Temperature Observed (degF) Start of Day Values': [25],
+        'Air Temperature Maximum (degF)': [38],
+    })
+
+    outputs = split_elements(data)
+
+    assert list(outputs) == ['swe', 'snow-depth', 'air-temp']
+    assert list(outputs['swe'].columns) == ['Date', 'Station Id', 'Station Name',
+                                            'Snow Water Equivalent (in) Start of Day Values']
+    assert list(outputs['air-temp'].columns)[3:] == ['Air Temperature Observed (degF) Start of Day Values',
+                                                     'Air Temperature Maximum (degF)']
+
+
+def test_split_elements_skips_missing_variables():
+    data = pd.DataFrame({'Date': ['2023-11-06'], 'Snow Depth (in) Start of Day Values': [12]})
+
+    assert list(split_elements(data)) == ['snow-depth']
+
+
+def test_parse_report_skips_comments_and_types_columns(fixtures):
+    with open(fixtures / 'snotel_505_CO.csv', 'rb') as f:
+        data = parse_report(f)
+
+    assert len(data) == 2
+    assert str(data['Date'].dtype) == 'datetime64[ns]'
+    assert str(data['Station Id'].dtype) == 'Int64'
+    assert str(data['Station Name'].dtype) == 'string'
+    assert data['Snow Depth (in) Start of Day Values'].tolist() == [12.0, 14.0]
+    assert data['Snow Density (pct) Start of Day Values'].isna().tolist() == [False, True]
+
+
+def test_parse_report_handles_partial_and_empty_reports():
+    lines = ['# Reporting Frequency: Daily', '', 'Date,Station Id,Snow Depth (in) Start of Day Values QC Flag',
+             '2023-11-07,505,V']
+    data = parse_report(lines)
+    assert data['Snow Depth (in) Start of Day Values QC Flag'].tolist() == ['V']
+
+    assert parse_report(['# no data', 'Date,Station Id']).empty
+    assert parse_report(['# no data']).empty
+
+
+HTML_ERROR = b'<!DOCTYPE html>\n<html><head><title>Service Unavailable</title></head>\n<body>Try again later</body></html>\n'
+
+
+def test_parse_report_rejects_bodies_that_are_not_reports():
+    with pytest.raises(ReportError):
+        parse_report(HTML_ERROR)
+    with pytest.raises(ReportError):
+        parse_report(HTML_ERROR.decode().splitlines())
+
+
+def test_fetch_report_skips_bodies_that_are_not_reports(stub_server):
+    url = stub_server(lambda path, headers: (200, HTML_ERROR))
+
+    assert fetch_report(f'{url}/reportGenerator/view_csv/customSingleStationReport').empty
+
+
+def test_report_url_uses_csv_endpoint():
+    url = report_url(505, 'CO', -1, 0, ['stationId', 'SNWD::value'])
+
+    assert '/reportGenerator/view_csv/' in url
+    assert '/505:CO:SNTL%7Cid=%22%22%7Cname/-1,0/stationId,SNWD::value?fitToScreen=false' in url
+
+
+def test_to_schema_types_every_column_without_objects(fixtures):
+    with open(fixtures / 'snotel_505_CO.csv', 'rb') as f:
+        data = to_schema(parse_report(f))
+
+    assert {column: str(data[column].dtype) for column in SCHEMA} == SCHEMA
+    assert data['new_snow'].isna().all()
+    assert data['snow_density_percentage'].isna().tolist() == [False, True]
+
+
+def test_to_schema_adds_missing_columns_as_typed_nulls():
+    data = to_schema(parse_report(['Date,Station Id,Snow Depth (in) Start of Day Values',
+                                   '2023-11-06,505,14', '2023-11-07,505,12']))
+
+    assert {column: str(data[column].dtype) for column in SCHEMA} == SCHEMA
+    assert data['station_name'].isna().all() and data['elevation_ft'].isna().all()
+
+    assert to_schema(parse_report(['Date,Station Id'])).empty
+
+
+def test_parse_report_reads_whole_bodies_like_lines(fixtures):
+    body = (fixtures / 'snotel_505_CO.csv').read_bytes()
+
+    pd.testing.assert_frame_equal(parse_report(body), parse_report(body.splitlines()))
+    pd.testing.assert_frame_equal(parse_report(body.decode()), parse_report(body.splitlines()))
+    assert parse_report(b'# no data\n\n').empty
@@ -0,0 +1,48 @@
+import logging
+
+import pandas as pd
+import pytest
+
+from avalanche import snotel_polars as pl_engine
+from avalanche.snotel import combine_reports
+
+PARTIAL = b'# partial report\nDate,Station Id,Snow Depth (in) Start of Day Values\n2023-11-06,506,14\n2023-11-07,506,\n'
+
+
+@pytest.mark.parametrize('order', [(0, 1), (1, 0)])
+def test_polars_engine_matches_pandas(fixtures, order):
+    full = (fixtures / 'snotel_505_CO.csv').read_bytes()
+    blank_lines = full.replace(b'\n', b'\r\n').replace(b',25,16\r\n', b',25,16\r\n\r\n')
+    bodies = [[full, PARTIAL][i] for i in order] + [b'# no data\n', b'Date,Station Id\n', blank_lines]
+
+    expected = combine_reports(bodies)
+    result = pl_engine.combine_reports(bodies)
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.loc[(order.index(0), 1), 'new_snow'] == 2.0
+
+
+def test_polars_engine_handles_no_rows():
+    pd.testing.assert_frame_equal(pl_engine.combine_reports([b'# no data\n']), combine_reports([b'# no data\n']))
+
+
+@pytest.mark.parametrize('bad', [
+    b'<!DOCTYPE html>\n<html><body>Service unavailable</body></html>\n',
+    PARTIAL.replace(b'-07,506,', b'-07,506,,9'),
+    PARTIAL.replace(b'2023-11-06', b'yesterday'),
+])
+def test_engines_skip_bad_reports_alike(fixtures, caplog, bad):
+    full = (fixtures / 'snotel_505_CO.csv').read_bytes()
+    bodies = [bad, full, PARTIAL]
+
+    with caplog.at_level(logging.WARNING):
+        expected = combine_reports(bodies)
+    pandas_skips = [record.getMessage().split(':')[0] for record in caplog.records]
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        result = pl_engine.combine_reports(bodies)
+    polars_skips = [record.getMessage().split(':')[0] for record in caplog.records]
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.index.get_level_values('station').unique().tolist() == [0, 1]
+    assert pandas_skips == polars_skips == ['Skipping station report 0']
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from avalanche import spatial
+from avalanche.geo import haversine
+from avalanche.stations import parse_yearcount
+
+# Boxes roughly over the Front Range and the Sawatch Range
+FRONT_RANGE = {'type': 'Polygon', 'coordinates': [[(-106.0, 39.5), (-105.5, 39.5), (-105.5, 40.0), (-106.0, 40.0),
+                                                     (-106.0, 39.5)]]}
+SAWATCH = {'type': 'Polygon', 'coordinates': [[(-106.8, 39.0), (-106.3, 39.0), (-106.3, 39.5), (-106.8, 39.5),
+                                                 (-106.8, 39.0)]]}
+
+
+@pytest.fixture
+def index(fixtures):
+    return spatial.StationIndex(parse_yearcount((fixtures / 'yearcount.html').read_text()))
+
+
+def test_nearest(index):
+    # Loveland Pass trailhead
+    nearest = index.nearest(39.66, -105.88, k=3)
+
+    assert nearest.index.tolist() == [505, 335, 1120]
+    rows = index.stations.set_index('station_id').loc[nearest.index]
+    assert np.allclose(nearest, haversine(39.66, -105.88, rows['latitude'], rows['longitude']))
+    assert nearest.is_monotonic_increasing
+
+    assert index.nearest(39.66, -105.88, k=3, max_miles=15).index.tolist() == [505, 335]
+    assert len(index.nearest(39.66, -105.88, k=50)) == len(index)
+    with pytest.raises(ValueError):
+        index.nearest(39.66, -105.88, k=0)
+
+
+def test_nearest_matches_brute_force(index):
+    for latitude, longitude in [(40.6, -111.6), (47.0, -121.0), (39.0, -106.0), (45.0, -110.0)]:
+        distances = haversine(latitude, longitude, index.latitudes, index.longitudes)
+        expected = index.stations['station_id'].to_numpy()[np.argsort(distances)[:2]]
+        assert index.nearest(latitude, longitude, k=2).index.tolist() == expected.tolist()
+
+
+def test_within_and_assign_regions(index):
+    assert index.within(FRONT_RANGE).tolist() == [335, 505]
+
+    regions = index.assign_regions({'front-range': FRONT_RANGE, 'sawatch': SAWATCH})
+
+    assert regions.index.tolist() == [335, 505, 766, 791, 1120]
+    assert regions.tolist() == ['front-range', 'front-range', pd.NA, pd.NA, 'sawatch']
+
+    unassigned = index.assign_regions({})
+    assert unassigned.index.tolist() == regions.index.tolist() and unassigned.name == 'region'
+    assert unassigned.isna().all() and unassigned.dtype == regions.dtype
+
+
+def test_stations_without_coordinates_are_skipped(fixtures):
+    stations = parse_yearcount((fixtures / 'yearcount.html').read_text())
+    stations.loc[0, 'latitude'] = np.nan
+
+    index = spatial.StationIndex(stations)
+
+    assert len(index) == 4
+    assert 335 not in index.nearest(39.80, -105.78, k=4).index
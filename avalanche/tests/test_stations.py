@@ -0,0 +1,74 @@
+import pandas as pd
+
+from avalanche import http
+from avalanche import stations as registry
+from avalanche.stations import by_state, in_bbox, load_stations, parse_yearcount
+
+
+def test_parse_yearcount(fixtures):
+    stations = parse_yearcount((fixtures / 'yearcount.html').read_text())
+
+    assert stations['station_id'].tolist() == [335, 505, 766, 791, 1120]
+    grizzly = stations[stations['station_id'] == 505].iloc[0]
+    assert grizzly['name'] == 'Grizzly Peak'
+    assert grizzly['elevation_ft'] == 11100
+    assert grizzly['start_date'] == pd.Timestamp('1979-10-01')
+    assert str(stations['latitude'].dtype) == 'float64'
+
+
+def test_filters(fixtures):
+    stations = parse_yearcount((fixtures / 'yearcount.html').read_text())
+
+    assert by_state(stations, 'CO')['station_id'].tolist() == [335, 505, 1120]
+    assert by_state(stations, 'UT', 'WA')['station_id'].tolist() == [766, 791]
+    assert in_bbox(stations, 39.5, -106.0, 40.0, -105.5)['station_id'].tolist() == [335, 505]
+
+
+def test_load_stations_caches_and_revalidates(stub_server, fixtures, tmp_path):
+    html = (fixtures / 'yearcount.html').read_bytes()
+    requests_seen = []
+
+    def handler(path, headers):
+        requests_seen.append(headers.get('If-None-Match'))
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, b''
+        return 200, html, {'ETag': '"v1"'}
+
+    url = f'{stub_server(handler)}/nwcc/yearcount'
+
+    first = load_stations(url, cache_dir=tmp_path, refresh=True)
+    assert load_stations(url, cache_dir=tmp_path) is first
+    assert requests_seen == [None]
+
+    # A fresh disk copy is used without touching the network
+    registry._loaded.clear()
+    pd.testing.assert_frame_equal(load_stations(url, cache_dir=tmp_path), first)
+    assert requests_seen == [None]
+
+    # An expired copy is revalidated with its ETag
+    registry._loaded.clear()
+    pd.testing.assert_frame_equal(load_stations(url, cache_dir=tmp_path, ttl=0), first)
+    assert requests_seen == [None, '"v1"']
+
+
+def test_load_stations_without_a_writable_cache(stub_server, fixtures, tmp_path):
+    html = (fixtures / 'yearcount.html').read_bytes()
+    url = f'{stub_server(lambda path, headers: (200, html))}/nwcc/yearcount'
+
+    # A file where the cache directory should be makes every cache write fail
+    blocked = tmp_path / 'blocked'
+    blocked.write_text('')
+
+    stations = load_stations(url, cache_dir=blocked / 'cache', refresh=True)
+
+    assert len(stations) == 5
+    assert load_stations(url, cache_dir=blocked / 'cache') is stations
+
+
+def test_load_stations_caches_in_the_http_cache_dir(stub_server, fixtures):
+    html = (fixtures / 'yearcount.html').read_bytes()
+    url = f'{stub_server(lambda path, headers: (200, html))}/nwcc/yearcount'
+
+    load_stations(url, refresh=True)
+
+    assert (http.CACHE_DIR / 'stations.parquet').exists()
@@ -0,0 +1,91 @@
+import datetime
+
+import pandas as pd
+import pyarrow.compute as pc
+import pytest
+
+from avalanche.store import ObservationStore
+
+
+def _snotel(days, stations=(505, 1120), swe=1.0):
+    dates = pd.date_range('2023-11-28', periods=days, freq='D')
+    return pd.DataFrame({
+        'date': [date for _ in stations for date in dates],
+        'station_id': pd.array([station for station in stations for _ in dates], dtype='Int64'),
+        'state_code': pd.array(['CO'] * len(stations) * days, dtype='string'),
+        'elevation_ft': pd.array([11100 if station == 505 else 9000 for station in stations for _ in dates],
+                                 dtype='Int64'),
+        'snow_water_equivalent_in': [swe + i for i in range(len(stations) * days)],
+    })
+
+
+def test_write_partitions_by_month_and_reads_back_typed(tmp_path):
+    store = ObservationStore(tmp_path)
+    assert store.write('snotel', _snotel(10)) == 20
+
+    assert store.months('snotel') == {'2023-11': 1, '2023-12': 1}
+
+    data = store.read('snotel')
+    assert len(data) == 20
+    assert str(data['station_id'].dtype) == 'Int64' and str(data['state_code'].dtype) == 'string'
+    assert data[['station_id', 'date']].equals(data[['station_id', 'date']].sort_values(['station_id', 'date']))
+
+
+def test_read_filters_stations_days_and_predicates(tmp_path):
+    store = ObservationStore(tmp_path)
+    store.write('snotel', _snotel(10))
+
+    data = store.read('snotel', start=datetime.date(2023, 12, 1), end='2023-12-03',
+                      columns=['station_id', 'date', 'snow_water_equivalent_in'],
+                      where=(pc.field('state_code') == 'CO') & (pc.field('elevation_ft') > 10000))
+
+    assert list(data.columns) == ['station_id', 'date', 'snow_water_equivalent_in']
+    assert data['station_id'].unique().tolist() == [505]
+    assert data['date'].dt.strftime('%m-%d').tolist() == ['12-01', '12-02', '12-03']
+
+    assert store.read('snotel', stations=[1120], start='2023-11-30', end='2023-11-30')['date'].tolist() == \
+        [pd.Timestamp('2023-11-30')]
+    assert store.read('snotel', start='2024-06-01', end='2024-06-30').empty
+    assert store.read('buoy').empty
+
+
+def test_later_writes_replace_rows_and_compact(tmp_path):
+    store = ObservationStore(tmp_path)
+    store.write('snotel', _snotel(5))
+    store.write('snotel', _snotel(2, stations=(505,), swe=100.0))
+
+    assert store.months('snotel') == {'2023-11': 2, '2023-12': 1}
+    before = store.read('snotel')
+
+    assert len(before) == 10
+    assert before.loc[before['station_id'] == 505, 'snow_water_equivalent_in'].tolist()[:2] == [100.0, 101.0]
+
+    assert store.compact('snotel') == 1
+    assert store.months('snotel') == {'2023-11': 1, '2023-12': 1}
+    pd.testing.assert_frame_equal(store.read('snotel'), before)
+
+
+def test_where_sees_only_the_latest_row(tmp_path):
+    store = ObservationStore(tmp_path)
+    store.write('snotel', _snotel(1, stations=(505,), swe=6.0))
+    store.write('snotel', _snotel(1, stations=(505,), swe=4.0))
+
+    assert store.read('snotel', where=pc.field('snow_water_equivalent_in') > 5).empty
+    assert store.read('snotel', where=pc.field('snow_water_equivalent_in') < 5)['snow_water_equivalent_in'].tolist() \
+        == [4.0]
+
+
+def test_columns_added_by_later_parts_are_read(tmp_path):
+    store = ObservationStore(tmp_path)
+    store.write('snotel', _snotel(2))
+    store.write('snotel', _snotel(1, stations=(505,)).assign(new_snow=3.0))
+
+    data = store.read('snotel')
+    assert data['new_snow'].iloc[0] == 3.0 and data['new_snow'].iloc[1:].isna().all()
+    assert store.read('snotel', columns=['station_id', 'new_snow'], where=pc.field('new_snow') > 0) \
+        ['station_id'].tolist() == [505]
+
+
+def test_unknown_datasets_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ObservationStore(tmp_path).write('avalanches', _snotel(1))
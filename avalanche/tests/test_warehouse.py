@@ -0,0 +1,79 @@
+import sqlite3
+
+import pandas as pd
+
+from avalanche.warehouse import BatchAppender, SQLiteWriter, latest_rows, merge_statement
+
+
+def _rows(**values):
+    row = {
+        'date': pd.Timestamp('2023-11-06'),
+        'station_id': 505,
+        'station_name': 'Grizzly Peak',
+        'snow_water_equivalent_in': 1.9,
+        'snow_water_equivalent_median_percentage': 95.0,
+        'snow_depth_in': 12.0,
+        'max_temp_degF': 38.0,
+        'min_temp_degF': 17.0,
+        'observed_temp_degF': 25.0,
+        'snow_density_percentage': 16.0,
+    }
+    row.update(values)
+    return row
+
+
+def test_sqlite_writer_merges_batch():
+    connection = sqlite3.connect(':memory:')
+    pd.DataFrame([_rows(), _rows(station_id=1120, station_name='Berthoud Summit')]).assign(
+        date='2023-11-06').to_sql('snotel', connection, index=False)
+
+    corrections = pd.DataFrame([
+        _rows(snow_depth_in=13.0),
+        _rows(station_id=1120, station_name='Berthoud Summit', snow_depth_in=20.0),
+        _rows(station_id=335, station_name='Berthoud Pass', snow_depth_in=18.0),
+    ])
+
+    # 335 was never appended, so its correction is ignored like the per-row UPDATE it replaces
+    assert SQLiteWriter(connection).upsert(corrections) == 2
+
+    stored = pd.read_sql('SELECT station_id, date, snow_depth_in FROM snotel ORDER BY station_id', connection)
+    assert stored.values.tolist() == [[505, '2023-11-06', 13.0], [1120, '2023-11-06', 20.0]]
+
+
+def test_duplicate_corrections_stage_the_last_row():
+    connection = sqlite3.connect(':memory:')
+    pd.DataFrame([_rows()]).assign(date='2023-11-06').to_sql('snotel', connection, index=False)
+
+    # A station listed twice in the registry is fetched and corrected twice
+    corrections = pd.DataFrame([_rows(snow_depth_in=13.0), _rows(snow_depth_in=14.0)])
+
+    assert latest_rows(corrections)['snow_depth_in'].tolist() == [14.0]
+    assert SQLiteWriter(connection).upsert(corrections) == 1
+    assert pd.read_sql('SELECT snow_depth_in FROM snotel', connection)['snow_depth_in'].tolist() == [14.0]
+
+
+def test_merge_statement_keys_on_station_and_date():
+    sql = merge_statement('p.d.snotel', 'p.d.snotel_staging', ['station_id', 'date', 'snow_depth_in'])
+
+    assert 'ON T.station_id = S.station_id AND T.date = S.date' in sql
+    assert 'snow_depth_in = S.snow_depth_in' in sql
+    assert 'INSERT' not in sql
+
+
+def test_batch_appender_chunks_loads():
+    class RecordingWriter(SQLiteWriter):
+        loads = []
+
+        def append(self, df):
+            self.loads.append(len(df))
+            return super().append(df)
+
+    connection = sqlite3.connect(':memory:')
+    appender = BatchAppender(RecordingWriter(connection), chunk_rows=2)
+    for station_id in (505, 1120, 335):
+        appender.add(pd.DataFrame([_rows(station_id=station_id)]))
+
+    assert appender.flush() == 3
+    assert RecordingWriter.loads == [2, 1]
+    assert appender.flush() == 0
+    assert pd.read_sql('SELECT COUNT(*) AS n FROM snotel', connection)['n'][0] == 3
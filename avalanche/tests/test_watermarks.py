@@ -0,0 +1,29 @@
+import datetime
+
+from avalanche.watermarks import WatermarkStore
+
+
+def test_missing_range_follows_watermark(tmp_path):
+    start, end = datetime.date(2009, 10, 1), datetime.date(2023, 11, 7)
+    store = WatermarkStore(tmp_path / 'watermarks.sqlite', namespace='snotel')
+
+    assert store.missing_range('505', start, end) == (start, end)
+
+    store.advance('505', datetime.date(2023, 11, 5))
+    assert store.missing_range('505', start, end) == (datetime.date(2023, 11, 6), end)
+
+    store.advance('505', end)
+    assert store.missing_range('505', start, end) is None
+
+
+def test_watermarks_only_move_forward_and_persist(tmp_path):
+    path = tmp_path / 'watermarks.sqlite'
+    store = WatermarkStore(path, namespace='snotel')
+
+    store.advance(505, datetime.date(2023, 11, 7))
+    assert store.advance(505, datetime.date(2023, 1, 1)) == datetime.date(2023, 11, 7)
+    store.close()
+
+    reopened = WatermarkStore(path, namespace='snotel')
+    assert reopened.all() == {'505': datetime.date(2023, 11, 7)}
+    assert WatermarkStore(path, namespace='nwis').all() == {}
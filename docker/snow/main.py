@@ -1,17 +1,26 @@
+import argparse
 import asyncio
 import logging
-from typing import Any, Dict, Union, List, Tuple
+import os
+from typing import Any, Dict, Optional
 
 import google.cloud.logging
-from io import StringIO
 
-import numpy as np
 import pandas as pd
 import requests
-import polars as pl
 from google.cloud import bigquery
 from google.cloud import storage
 
+from avalanche import http, snotel_polars
+from avalanche.compaction import compact_day
+from avalanche.features import FEATURE_LOOKBACK_DAYS, derive_features
+from avalanche.fetch import AsyncFetcher, DEFAULT_CONCURRENCY
+from avalanche.sinks import FORMATS, OUTPUT_FORMAT, get_bucket, write_frame
+from avalanche.snotel import SCHEMA, combine_reports
+from avalanche.stations import load_stations
+from avalanche.store import ObservationStore, default_store
+from avalanche.warehouse import BatchAppender, BigQueryWriter
+
 
 ##### CONFIG #####
 # Specify the dataset and table information
@@ -19,104 +28,38 @@ project_id = 'avalanche-analytics-project'
 dataset_id = 'production'
 table_id = 'snotel'
 
+# Library that parses the station reports, 'pandas' or 'polars'; both produce the same frame
+ENGINES = {'pandas': combine_reports, 'polars': snotel_polars.combine_reports}
+ENGINE = os.environ.get('ENGINE', 'pandas')
+
 client = bigquery.Client(project=project_id)
+writer = BigQueryWriter(client, project_id, dataset_id, table_id)
 log_client = google.cloud.logging.Client(project=project_id)
 log_client.setup_logging()
 
 
-async def upload_blob_from_memory(bucket: storage.Bucket, contents: str, destination_blob_name: str) -> None:
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_string(contents, content_type='text/csv')
+async def upload_blob_from_memory(bucket: storage.Bucket, df: pd.DataFrame, destination_stem: str,
+                                  fmt: str = OUTPUT_FORMAT) -> None:
+    destination_blob_name = await asyncio.to_thread(write_frame, bucket, df, destination_stem, fmt, SCHEMA)
     logging.info(f"{destination_blob_name} uploaded to {bucket.name}.")
 
 
-def process_station(record: Dict[str, Any]) -> Union[None, Tuple[str, Any, Any]]:
-    today_data = None
-    yesterday_data = None
-
-    station_id = record["site_name"][record["site_name"].find("(") + 1:record["site_name"].find(")")]
+async def process_station(fetcher: AsyncFetcher, record: Dict[str, Any]) -> Optional[bytes]:
+    station_id = record["station_id"]
     state = record["state"]
 
     logging.info(f"Processing station {station_id} in {state}")
 
     url = f'https://wcc.sc.egov.usda.gov/reportGenerator/view_csv/customSingleStationReport/daily/start_of_period/{station_id}:{state}:SNTL%7Cid=""|name/-1,0/name,stationId,state.code,network.code,elevation,latitude,longitude,county.name,WTEQ::value,WTEQ::pctOfMedian_1991,SNWD::value,TMAX::value,TMIN::value,TOBS::value,SNDN::value?fitToScreen=false'
 
-    response = requests.get(url)
+    response = await fetcher.get(url)
 
     # Check if the request was successful
     if response.status_code == 200:
-        # Use StringIO to simulate a file object for Pandas to read the CSV data
-        csv_data = StringIO(response.text)
-
-        # Parse CSV data into a Pandas DataFrame
-        data = pd.read_csv(csv_data, comment='#', skip_blank_lines=True)
-
-        if 'Snow Depth (in) Start of Day Values' not in data.columns:
-            data['Snow Depth (in) Start of Day Values'] = None
-
-        data['new_snow'] = np.maximum(0, data['Snow Depth (in) Start of Day Values'] - data[
-                'Snow Depth (in) Start of Day Values'].shift(1))
-
-        column_mapping = {
-                'Date': 'date',
-                'Station Name': 'station_name',
-                'Station Id': 'station_id',
-                'State Code': 'state_code',
-                'Network Code': 'network_code',
-                'Elevation (ft)': 'elevation_ft',
-                'Latitude': 'latitude',
-                'Longitude': 'longitude',
-                'County Name': 'county_name',
-                'Snow Water Equivalent (in) Start of Day Values': 'snow_water_equivalent_in',
-                'Snow Water Equivalent % of Median (1991-2020)': 'snow_water_equivalent_median_percentage',
-                'Snow Depth (in) Start of Day Values': 'snow_depth_in',
-                'Air Temperature Maximum (degF)': 'max_temp_degF',
-                'Air Temperature Minimum (degF)': 'min_temp_degF',
-                'Air Temperature Observed (degF) Start of Day Values': 'observed_temp_degF',
-                'Snow Density (pct) Start of Day Values': 'snow_density_percentage'
-            }
-
-        data.rename(columns=column_mapping, inplace=True)
-
-        data = data.fillna(np.nan).replace([np.nan], [None])
-
-        schema = {
-            "date": "datetime64[ns]",
-            "station_name": "string",
-            "station_id": "Int64",
-            "state_code": "string",
-            "network_code": "string",
-            "elevation_ft": "Int64",
-            "latitude": "float64",
-            "longitude": "float64",
-            "county_name": "string",
-            "snow_water_equivalent_in": "float64",
-            "snow_water_equivalent_median_percentage": "float64",
-            "snow_depth_in": "float64",
-            "max_temp_degF": "float64",
-            "min_temp_degF": "float64",
-            "observed_temp_degF": "float64",
-            "snow_density_percentage": "float64",
-            "new_snow": "float64"
-        }
-
-        # Ensure columns match the schema
-        for column, dtype in schema.items():
-            if column not in data.columns or data[column].dtype != dtype:
-                data[column] = data[column].astype(dtype)
-
-        if len(data) == 0:
-            return station_id, today_data, yesterday_data
-
-        if len(data[1:]) > 0:
-            today_data = data[1:]
-
-        if len(data[0:1]) > 0:
-            yesterday_data = data[0:1]
-
-        logging.info(f"Successfully processed station {station_id} in {state}")
-
-        return station_id, today_data, yesterday_data
+        logging.info(f"Successfully fetched station {station_id} in {state}")
+
+        # Reports are parsed together once every station is in, by the selected engine
+        return response.content
 
     else:
         print("Failed to fetch data from the URL")
@@ -126,106 +69,133 @@ def process_station(record: Dict[str, Any]) -> Union[None, Tuple[str, Any, Any]]
         return None
 
 
-async def append_bq_table(df: pd.DataFrame, _table_id: str) -> None:
+async def upload_features(bucket: storage.Bucket, data: pd.DataFrame, store: Optional[ObservationStore],
+                          fmt: str = OUTPUT_FORMAT) -> None:
+    """Uploads today's snowfall totals, SWE change, settlement and temperature swings to derived/{date}.
 
-    logging.info(f"Appending {len(df)} rows to {project_id}.{dataset_id}.{_table_id}")
+    Multi-day features need the days before yesterday, so they are derived over the stored history when
+    AVALANCHE_STORE is set; without it they are NaN where they reach past yesterday.
+    """
+    today = data['date'].max()
+    history = data.reset_index(drop=True)
+    if store is not None:
+        history = await asyncio.to_thread(store.read, 'snotel', start=today - pd.Timedelta(days=FEATURE_LOOKBACK_DAYS),
+                                          end=today)
 
-    table_ref = client.dataset(dataset_id).table(_table_id)
+    features = derive_features(history)
+    features = features[features['date'] == today].reset_index(drop=True)
+    await upload_blob_from_memory(bucket, features, f'derived/{today.date()}', fmt)
 
-    # Load data into the table
-    job_config = bigquery.LoadJobConfig()
-    job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
 
-    # Load data from the DataFrame into the BigQuery table
-    job = client.load_table_from_dataframe(df, table_ref, job_config=job_config)
-    #job.result()  # Wait for the job to complete
+async def append_bq_table(appender: BatchAppender) -> None:
 
-    #logging.info(f"STATUS: {job.state}")
+    logging.info(f"Appending {sum(len(df) for df in appender.frames)} rows to {project_id}.{dataset_id}.{table_id}")
+
+    written = await asyncio.to_thread(appender.flush)
+
+    logging.info(f"Appended {written} rows to {project_id}.{dataset_id}.{table_id}")
 
 
 async def update_bq_table(df: pd.DataFrame) -> None:
 
-    logging.info(f"Updating {project_id}.{dataset_id}.{table_id}")
-
-    # Define the update SQL statement
-    update_sql = f"""
-        UPDATE `{project_id}.{dataset_id}.{table_id}`
-        SET 
-            snow_water_equivalent_in = @snow_water_equivalent_in,
-            snow_water_equivalent_median_percentage = @snow_water_equivalent_median_percentage,
-            snow_depth_in = @snow_depth_in,
-            max_temp_degF = @max_temp_degF,
-            min_temp_degF = @min_temp_degF,
-            observed_temp_degF = @observed_temp_degF,
-            snow_density_percentage = @snow_density_percentage
-        WHERE station_id = @station_id AND date = @date
-    """
+    logging.info(f"Updating {len(df)} rows in {project_id}.{dataset_id}.{table_id}")
+
+    affected = await asyncio.to_thread(writer.upsert, df)
 
-    update_row = df.to_dict(orient='records')[0]
+    logging.info(f"Merged {affected} rows into {project_id}.{dataset_id}.{table_id}")
 
-    # Define the parameters for the SQL statement
-    parameters = [
-        bigquery.ScalarQueryParameter("station_id", "INT64", update_row['station_id']),
-        bigquery.ScalarQueryParameter("date", "DATE", update_row['date'].strftime('%Y-%m-%d')),
-        bigquery.ScalarQueryParameter("snow_water_equivalent_in", "FLOAT", update_row['snow_water_equivalent_in']),
-        bigquery.ScalarQueryParameter("snow_water_equivalent_median_percentage", "FLOAT",
-                                      update_row['snow_water_equivalent_median_percentage']),
-        bigquery.ScalarQueryParameter("snow_depth_in", "FLOAT", update_row['snow_depth_in']),
-        bigquery.ScalarQueryParameter("max_temp_degF", "FLOAT", update_row['max_temp_degF']),
-        bigquery.ScalarQueryParameter("min_temp_degF", "FLOAT", update_row['min_temp_degF']),
-        bigquery.ScalarQueryParameter("observed_temp_degF", "FLOAT", update_row['observed_temp_degF']),
-        bigquery.ScalarQueryParameter("snow_density_percentage", "FLOAT", update_row['snow_density_percentage'])
-    ]
 
-    # Run the update query
-    update_sql = update_sql.format(project_id=project_id, dataset_id=dataset_id, table_id=table_id)
-    query_job = client.query(update_sql, job_config=bigquery.QueryJobConfig(query_parameters=parameters))
-    #query_job.result()  # Wait for the query to complete
+async def handle_station(fetcher: AsyncFetcher, record: Dict[str, Any]) -> Optional[bytes]:
+    """Fetches one station and returns its report, yesterday's row first and today's after it."""
+    try:
 
-    #logging.info(f"STATUS: {query_job.state}")
+        data = await process_station(fetcher, record)
+        print(record["station_id"])
 
+        return data
 
+    except (TypeError, requests.RequestException) as e:
+        logging.error(f"Error occurred: {str(e)}")
 
-def entry_point(event: Any, context: Any) -> None:
-    # Initialize Google Cloud Storage client and bucket
-    storage_client = storage.Client(project=project_id)
-    bucket = storage_client.bucket('snow-depth')
 
-    count = 0
+async def run(concurrency: int = DEFAULT_CONCURRENCY, chunk_rows: Optional[int] = None,
+              fmt: str = OUTPUT_FORMAT, engine: str = ENGINE) -> None:
+    # Shared Google Cloud Storage bucket, one client per process
+    bucket = get_bucket('snow-depth', project=project_id)
 
     # Fetch station metadata
-    station_md = pd.read_html("https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist")[0].to_dict(orient='records')
+    station_md = load_stations().to_dict(orient='records')
 
-    for record in station_md:
+    logging.info(f"Processing {len(station_md)} stations with concurrency {concurrency}")
 
-        count += 1
-        print(count/len(station_md))
+    appender = BatchAppender(writer, chunk_rows=chunk_rows)
 
-        try:
+    async with AsyncFetcher(concurrency=concurrency) as fetcher:
+        reports = await asyncio.gather(*(handle_station(fetcher, record) for record in station_md))
 
-            station_id, today_data, yesterday_data = process_station(record)
-            print(station_id)
+    # Parse, type and derive new_snow once over every station's rows; each station's first row is yesterday's
+    data = ENGINES[engine](report for report in reports if report is not None)
+    if data.empty:
+        logging.warning("No station returned any rows")
+        return
 
-            if today_data is not None:
+    is_yesterday = data.index.get_level_values('row') == 0
+    today_data = data[~is_yesterday]
 
-                destination_blob_name = f'daily_raw/{str(today_data["date"][1])}-{str(today_data["station_id"][1])}.csv'
-                asyncio.run(upload_blob_from_memory(bucket, contents=today_data.to_csv(index=False),
-                                        destination_blob_name=destination_blob_name))
+    await asyncio.gather(*(
+        upload_blob_from_memory(bucket, rows.reset_index(drop=True),
+                                f'daily_raw/{str(rows["date"].iloc[0])}-{str(rows["station_id"].iloc[0])}', fmt)
+        for _, rows in today_data.groupby(level='station')))
 
-                asyncio.run(append_bq_table(today_data, table_id))
+    appender.add(today_data.reset_index(drop=True))
 
-            if yesterday_data is not None:
+    dates = sorted({str(date.date()) for df in appender.frames for date in df['date']})
 
-                asyncio.run(update_bq_table(yesterday_data))
+    # Load today's rows with one job per chunk and apply yesterday's corrections with a single MERGE
+    writes = [append_bq_table(appender)]
 
-        except TypeError as e:
-            logging.error(f"Error occurred: {str(e)}")
+    corrections = data[is_yesterday].reset_index(drop=True)
+    if len(corrections) > 0:
+        writes.append(update_bq_table(corrections))
+
+    await asyncio.gather(*writes)
+
+    # Today's rows and yesterday's corrections in the local store, when AVALANCHE_STORE is set
+    store = default_store()
+    if store is not None:
+        await asyncio.to_thread(store.write, 'snotel', data.reset_index(drop=True))
+
+    # Today's derived snowpack features, over yesterday's rows and any stored history before them
+    await upload_features(bucket, data, store, fmt)
+
+    # Merge the day's per-station blobs into one partition for downstream readers
+    for date in dates:
+        await asyncio.to_thread(compact_day, bucket, date)
+
+    # Requests, retries, rate-limit waits and latencies per upstream host
+    http.metrics.log()
+
+
+def entry_point(event: Any, context: Any, concurrency: int = DEFAULT_CONCURRENCY,
+                chunk_rows: Optional[int] = None, fmt: str = OUTPUT_FORMAT, engine: str = ENGINE) -> None:
+    asyncio.run(run(concurrency, chunk_rows, fmt, engine))
 
 
 def main():
-    entry_point(None, None)
+    parser = argparse.ArgumentParser(description='Collect the latest SNOTEL observations for every station.')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='maximum number of stations fetched at once')
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help='split the BigQuery append into load jobs of at most this many rows')
+    parser.add_argument('--format', choices=FORMATS, default=OUTPUT_FORMAT,
+                        help='file format of the raw blobs uploaded to GCS')
+    parser.add_argument('--engine', choices=list(ENGINES), default=ENGINE,
+                        help='library that parses and types the station reports')
+    args = parser.parse_args()
+
+    entry_point(None, None, concurrency=args.concurrency, chunk_rows=args.chunk_rows, fmt=args.format,
+                engine=args.engine)
 
 
 if __name__ == '__main__':
     main()
-
@@ -1,87 +1,132 @@
+import argparse
+import re
+
 import pandas as pd
-import numpy as np
 import datetime
 import asyncio
-from google.cloud import storage
-import concurrent.futures
 
+from avalanche.features import new_snow
+from avalanche.sinks import OUTPUT_FORMAT, get_bucket, write_frame
+from avalanche.snotel import COLUMN_MAPPING, REPORT_ELEMENTS, SCHEMA, fetch_report, report_url
+from avalanche.stations import load_stations
+from avalanche.store import default_store
+from avalanche.watermarks import WatermarkStore
+
+# Days covered by a full backfill
+BACKFILL_START = datetime.date(2009, 10, 1)
+BACKFILL_END = datetime.date(2023, 11, 7)
+
+# A full backfill writes raw/{station_id}, which holds every day up to BACKFILL_END; incremental runs
+# write raw/{station_id}/{first day}_{last day}. The names record what was ingested
+BACKFILL_BLOB = re.compile(r'raw/(?P<station_id>[^/]+)\.(csv|parquet)$')
+INCREMENT_BLOB = re.compile(r'raw/(?P<station_id>[^/]+)/\d{4}-\d{2}-\d{2}_(?P<last>\d{4}-\d{2}-\d{2})\.')
 
-async def upload_blob_from_memory(bucket, contents, destination_blob_name):
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_string(contents, content_type='text/csv')
+
+async def upload_blob_from_memory(bucket, df, destination_stem, fmt=OUTPUT_FORMAT):
+    destination_blob_name = write_frame(bucket, df, destination_stem, fmt, schema=SCHEMA)
     print(f"{destination_blob_name} uploaded to {bucket.name}.")
 
 
-def process_station(record):
-    station_id = record["site_name"][record["site_name"].find("(") + 1:record["site_name"].find(")")]
+def process_station(record, s_date=BACKFILL_START, e_date=BACKFILL_END):
+    station_id = record["station_id"]
     state = record["state"]
-    start_date = record["start"]
-    format = '%Y-%B'
-    s_date = datetime.datetime.strptime(start_date, format)
-    s_date = str(s_date.date())
-    s_date = '2009-10-01'
-    url = f'https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/start_of_period/{station_id}:{state}:SNTL%7Cid=%22%22%7Cname/{s_date},2023-11-07/name,stationId,state.code,network.code,elevation,latitude,longitude,county.name,WTEQ::value,WTEQ::pctOfMedian_1991,SNWD::value,TMAX::value,TMIN::value,TOBS::value,SNDN::value?fitToScreen=false'
+
+    # Fetch one extra day so new_snow is correct on the first requested day, then drop it
+    fetch_start = s_date - datetime.timedelta(days=1)
+    url = report_url(station_id, state, fetch_start, e_date, REPORT_ELEMENTS)
     #https://wcc.sc.egov.usda.gov/reportGenerator/view/customSingleStationReport/daily/start_of_period/1120:CO:SNTL%7Cid=%22%22%7Cname/-29,0/WTEQ::value,WTEQ::pctOfMedian_1991,SNWD::value,TMAX::value,TMIN::value,TOBS::value,SNDN::value?fitToScreen=false
     print('Done with', station_id, 'in', state, 'at', datetime.datetime.now().strftime("%H:%M:%S"))
-    data = max(pd.read_html(url), key=lambda x: len(x))
-
-    if 'Snow Depth (in) Start of Day Values' not in data.columns:
-        data['Snow Depth (in) Start of Day Values'] = np.nan
-
-    data['new_snow'] = np.maximum(0, data['Snow Depth (in) Start of Day Values'] - data['Snow Depth (in) Start of Day Values'].shift(1))
-
-    column_mapping = {
-        'Date': 'date',
-        'Station Name': 'station_name',
-        'Station Id': 'station_id',
-        'State Code': 'state_code',
-        'Network Code': 'network_code',
-        'Elevation (ft)': 'elevation_ft',
-        'Latitude': 'latitude',
-        'Longitude': 'longitude',
-        'County Name': 'county_name',
-        'Snow Water Equivalent (in) Start of Day Values': 'snow_water_equivalent_in',
-        'Snow Water Equivalent % of Median (1991-2020)': 'snow_water_equivalent_median_percentage',
-        'Snow Depth (in) Start of Day Values': 'snow_depth_in',
-        'Air Temperature Maximum (degF)': 'max_temp_degF',
-        'Air Temperature Minimum (degF)': 'min_temp_degF',
-        'Air Temperature Observed (degF) Start of Day Values': 'observed_temp_degF',
-        'Snow Density (pct) Start of Day Values': 'snow_density_percentage'
-    }
-
-    data.rename(columns=column_mapping, inplace=True)
+    data = fetch_report(url)
+
+    if data.empty:
+        return station_id, data
+
+    data.rename(columns=COLUMN_MAPPING, inplace=True)
+
+    data['new_snow'] = new_snow(data)
+
+    data = data[data['date'].dt.date >= s_date]
 
     return station_id, data
 
 
-def main():
+def stored_watermarks(bucket):
+    """Each station's last ingested day, read from the names of the blobs in the bucket.
+
+    The bucket is the persisted record: a station with a full backfill starts from BACKFILL_END, and each
+    incremental blob moves it to the last day that blob holds.
+    """
+    watermarks = WatermarkStore(namespace='snotel')
+    for blob in bucket.list_blobs(prefix='raw/'):
+        backfill = BACKFILL_BLOB.match(blob.name)
+        increment = INCREMENT_BLOB.match(blob.name)
+        if backfill:
+            watermarks.advance(backfill['station_id'], BACKFILL_END)
+        elif increment:
+            watermarks.advance(increment['station_id'], datetime.date.fromisoformat(increment['last']))
+    return watermarks
+
+
+def main(incremental=False):
     # Initialize Google Cloud Storage client and bucket
-    storage_client = storage.Client(project='avalanche-analytics-project')
-    bucket = storage_client.bucket('snow-depth')
+    bucket = get_bucket('snow-depth', project='avalanche-analytics-project')
 
     # Fetch station metadata
-    station_md = pd.read_html("https://wcc.sc.egov.usda.gov/nwcc/yearcount?network=sntl&state=&counttype=statelist")[
-        0].to_dict(orient='records')
+    station_md = load_stations().to_dict(orient='records')
+
+    watermarks = stored_watermarks(bucket) if incremental else None
+    today = datetime.date.today()
+
+    # Local copy for queries when AVALANCHE_STORE is set
+    store = default_store()
 
     processed_data = []
     for record in station_md:
 
         try:
 
-            station_id, data = process_station(record)
+            if watermarks is None:
+                station_id, data = process_station(record)
+                destination_stem = f'raw/{record["station_id"]}'
+
+            else:
+                # Only fetch the days after the station's last ingested date
+                missing = watermarks.missing_range(record["station_id"], BACKFILL_START, today)
+                if missing is None:
+                    print('Up to date', record["station_id"])
+                    continue
+
+                station_id, data = process_station(record, *missing)
 
             print(station_id)
             processed_data.append(station_id)
 
+            if len(data) == 0:
+                continue
+
+            if watermarks is not None:
+                # Named after the days actually ingested, which the next run reads back as the watermark
+                dates = data['date'].dt.date
+                destination_stem = f'raw/{station_id}/{dates.min()}_{dates.max()}'
+
             # Upload data to Google Cloud Storage in bulk
             #for station_id, data in processed_data:
-            destination_blob_name = f'raw/{station_id}.csv'
-            asyncio.run(upload_blob_from_memory(bucket, contents=data.to_csv(index=False),
-                                        destination_blob_name=destination_blob_name))
+            asyncio.run(upload_blob_from_memory(bucket, data, destination_stem))
+            if store is not None:
+                store.write('snotel', data)
 
         except TypeError:
             pass
 
+    # One part per month instead of one per station
+    if store is not None:
+        store.compact('snotel')
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Backfill the SNOTEL daily history of every station.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch the days after each station\'s last ingested date')
+    args = parser.parse_args()
+
+    main(incremental=args.incremental)